@@ -0,0 +1,129 @@
+from roulette import *
+from transposition_tables import ALL_MOVES
+import sqlite3
+
+# Bump whenever a change to the search would change its results, so old results are thrown away instead of trusted.
+ANALYSIS_CACHE_VERSION = 2
+
+# Writes are committed in batches, committing every one of them would spend more time syncing the file than searching.
+COMMIT_EVERY = 256
+
+def cache_depth(position: PackedPosition, depth: int) -> int:
+    return min(depth, position.unknown_live_shells + position.unknown_blank_shells)
+
+class AnalysisCache:
+    """
+    Finished search results kept between runs in an SQLite database, keyed by position key and depth.
+    
+    Keys are canonical (the same position always has the same key, see `PackedPosition`), so a position met again in
+    a later game is found no matter how it was reached. Once there are more than `max_entries` results, the least
+    recently used ones are thrown away.
+    
+    Only exact results from float searches are stored, and a result is only returned for a search of the same depth, so
+    searches give the same results whatever is already in the cache. Depths past the shells left are all stored as the
+    shells left, since every shot uses up a shell and searching any deeper can't change anything.
+    """
+    def __init__(self, connection: sqlite3.Connection, max_entries: int = 1000000, min_depth: int = 3, path: str | None = None):
+        self.connection = connection
+        self.max_entries = max_entries
+        self.min_depth = min_depth
+        self.path = path
+        
+        self.clock = connection.execute("SELECT COALESCE(MAX(last_used), 0) FROM results").fetchone()[0]
+        self.entries = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        self.uncommitted = 0
+    
+    @classmethod
+    def open(cls, path: str, max_entries: int = 1000000, min_depth: int = 3) -> "AnalysisCache":
+        """
+        Opens the cache at `path`, making it if it doesn't exist yet, or emptying it if it was made by a different version.
+        
+        Args:
+            path (str): The database file. ":memory:" works too, for a cache that doesn't outlast the program.
+            max_entries (int, optional): How many results to keep. Defaults to 1000000.
+            min_depth (int, optional): Positions searched less deeply than this, other than the root, aren't stored,
+                since they're quicker to search again than to look up. Defaults to 3.
+        
+        Returns:
+            AnalysisCache: The cache.
+        """
+        # The GUI searches on a different thread than it was made on, but only ever one search at a time.
+        connection = sqlite3.connect(path, check_same_thread = False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        
+        connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value INTEGER)")
+        version = connection.execute("SELECT value FROM metadata WHERE name = 'version'").fetchone()
+        
+        if version == None or version[0] != ANALYSIS_CACHE_VERSION:
+            connection.execute("DROP TABLE IF EXISTS results")
+            connection.execute("INSERT OR REPLACE INTO metadata VALUES ('version', ?)", (ANALYSIS_CACHE_VERSION,))
+        
+        connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                  key TEXT NOT NULL,
+                                  depth INTEGER NOT NULL,
+                                  evaluation REAL NOT NULL,
+                                  path TEXT NOT NULL,
+                                  last_used INTEGER NOT NULL,
+                                  PRIMARY KEY (key, depth)
+                              )""")
+        connection.execute("CREATE INDEX IF NOT EXISTS results_by_last_used ON results (last_used)")
+        connection.commit()
+        
+        return cls(connection, max_entries, min_depth, path)
+    
+    def get(self, position: PackedPosition, depth: int) -> tuple[float, list[ValidMoves]] | None:
+        """
+        Returns `(evaluation, path)` from the stored search of `position` at `depth`, or None if there isn't one.
+        """
+        key = f"{position.key:x}"
+        depth = cache_depth(position, depth)
+        row = self.connection.execute("SELECT evaluation, path FROM results WHERE key = ? AND depth = ?", (key, depth)).fetchone()
+        if row == None: return None
+        
+        evaluation, path = row
+        self.clock += 1
+        self.connection.execute("UPDATE results SET last_used = ? WHERE key = ? AND depth = ?", (self.clock, key, depth))
+        self.count_write()
+        
+        return evaluation, [ALL_MOVES[int(move)] for move in path.split(",") if move]
+    
+    def add(self, position: PackedPosition, depth: int, evaluation: float, path: list[ValidMoves]):
+        self.clock += 1
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                (f"{position.key:x}", cache_depth(position, depth), float(evaluation), ",".join(str(move.value) for move in path), self.clock))
+        self.entries += 1 # Might have replaced an old result, evict recounts.
+        self.count_write()
+        
+        if self.entries > self.max_entries: self.evict()
+    
+    def evict(self):
+        """
+        Throws away the least recently used results until there are `max_entries` left, and a tenth more to make room
+        so this doesn't happen on every store.
+        """
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        excess = self.entries - self.max_entries
+        if excess <= 0: return
+        
+        excess += self.max_entries // 10
+        self.connection.execute("DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_used LIMIT ?)", (excess,))
+        self.entries = max(0, self.entries - excess)
+        self.commit()
+    
+    def count_write(self):
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY: self.commit()
+    
+    def commit(self):
+        self.connection.commit()
+        self.uncommitted = 0
+    
+    def clear(self):
+        self.connection.execute("DELETE FROM results")
+        self.entries = 0
+        self.commit()
+    
+    def close(self):
+        self.commit()
+        self.connection.close()
\ No newline at end of file
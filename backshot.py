@@ -1,7 +1,12 @@
 from roulette import *
-from bonuses import *
 from transposition_tables import *
+from tablebases import *
+from analysis_cache import *
 from itertools import permutations
+from concurrent.futures import ProcessPoolExecutor
+from operator import truediv
+import os
+import time
 
 def convert_move_list(move_list: list[ValidMoves]):
     resultant = []
@@ -32,13 +37,13 @@ def convert_move_list(move_list: list[ValidMoves]):
             
     return resultant
 
-def is_redundant_move(move: ValidMoves, state: BuckshotRouletteMove):
+def is_redundant_move(move: ValidMoves, state: PackedPosition):
     """
     Returns True if `move` doesn't make sense for the given `state`. (e.g. smoking cigarettes at max health)
 
     Args:
         move (ValidMoves): The move to be made
-        state (BuckshotRouletteMove): The state the game is currently in.
+        state (PackedPosition): The state the game is currently in.
 
     Returns:
         bool: True if move is redundant, False if not.
@@ -57,7 +62,7 @@ def is_redundant_move(move: ValidMoves, state: BuckshotRouletteMove):
             blank_shell_with_dealer = not state.is_players_turn and state.get_current_shell() == "blank"
             live_shell_with_player = state.is_players_turn and state.get_current_shell() == "live"
             
-            return sawed_gun_with_player or blank_shell_with_dealer, live_shell_with_player
+            return sawed_gun_with_player or blank_shell_with_dealer or live_shell_with_player
 
         case ValidMoves.USE_BEER:
             known_shell = state.get_current_shell() != None
@@ -87,7 +92,7 @@ def is_redundant_move(move: ValidMoves, state: BuckshotRouletteMove):
         
         case ValidMoves.USE_ADRENALINE:
             other_players_items = state.dealer_items if state.is_players_turn else state.player_items
-            if other_players_items == []: return True
+            if not other_players_items: return True
         
         case ValidMoves.USE_BURNER_PHONE: # Could | with ValidMoves.USE_BEER
             known_shell = state.get_current_shell() != None
@@ -107,7 +112,10 @@ def is_redundant_move(move: ValidMoves, state: BuckshotRouletteMove):
         case ValidMoves.USE_INVERTER:
             return state.get_current_shell() == "live"
 
-def obvious_move_exists(state: BuckshotRouletteMove):
+def obvious_move_exists(state: PackedPosition):
+    # Can't shoot while on adrenaline, so let the search pick what to steal.
+    if state.on_adrenaline: return None
+    
     if state.is_players_turn:
         current_items = state.player_items
         current_health = state.player_health
@@ -154,6 +162,79 @@ def obvious_move_exists(state: BuckshotRouletteMove):
     
     return None
 
+class DealerModel:
+    """
+    How `BackshotRoulette` assumes the dealer plays, see DEALER_MODELS.
+    """
+    def move_weights(self, state: PackedPosition, ratio = Fraction) -> list[tuple[ValidMoves, Fraction]] | None:
+        """
+        Returns the moves the dealer plays in `state` as `(move, chance)` pairs, or None if it should be searched instead.
+        """
+        raise NotImplementedError()
+
+class AdversarialDealer(DealerModel):
+    """
+    The dealer plays whatever is worst for the player, so `search` looks at every move on its turn and takes the minimum.
+    This is the most pessimistic model, and the only one tablebases and analysis caches are made with.
+    """
+    def move_weights(self, state: PackedPosition, ratio = Fraction) -> list[tuple[ValidMoves, Fraction]] | None:
+        return None
+
+class ScriptedDealer(DealerModel):
+    """
+    A simple fixed policy, closer to how the dealer in the game plays than a perfect opponent.
+    
+    It plays any obvious move (see `obvious_move_exists`), then uses the first item in ITEM_PRIORITY that isn't redundant,
+    then shoots: the player if the chambered shell is at least as likely to be live as blank, itself otherwise.
+    """
+    ITEM_PRIORITY = [ValidMoves.USE_EXPIRED_MEDICINE,
+                     ValidMoves.USE_BURNER_PHONE,
+                     ValidMoves.USE_BEER,
+                     ValidMoves.USE_HANDCUFFS,
+                     ValidMoves.USE_ADRENALINE]
+    
+    def choose_move(self, state: PackedPosition) -> ValidMoves:
+        obvious_move = obvious_move_exists(state)
+        if obvious_move != None and state.is_legal(obvious_move): return obvious_move
+        
+        for move in self.ITEM_PRIORITY:
+            if state.is_legal(move) and not is_redundant_move(move, state): return move
+        
+        # On adrenaline with nothing worth stealing, it still has to steal something.
+        if not state.is_legal(ValidMoves.SHOOT_DEALER): return state.get_all_moves()[0]
+        
+        return self.shoot_other_player(state) if self.live_chance(state) * 2 >= 1 else self.shoot_self(state)
+    
+    def shoot_other_player(self, state: PackedPosition) -> ValidMoves:
+        return ValidMoves.SHOOT_DEALER if state.is_players_turn else ValidMoves.SHOOT_PLAYER
+    
+    def shoot_self(self, state: PackedPosition) -> ValidMoves:
+        return ValidMoves.SHOOT_PLAYER if state.is_players_turn else ValidMoves.SHOOT_DEALER
+    
+    def live_chance(self, state: PackedPosition, ratio = Fraction):
+        """
+        Returns the chance the chambered shell fires live, inverter included.
+        """
+        live_chance = state.loaded_chance(0, ratio)
+        return 1 - live_chance if state.inverter_on else live_chance
+    
+    def move_weights(self, state: PackedPosition, ratio = Fraction) -> list[tuple[ValidMoves, Fraction]] | None:
+        return [(self.choose_move(state), ratio(1, 1))]
+
+class StochasticDealer(ScriptedDealer):
+    """
+    Plays like ScriptedDealer, except that when it has to guess about the chambered shell it shoots the player with
+    the chance the shell is live, and itself otherwise, instead of always taking the likelier side.
+    """
+    def move_weights(self, state: PackedPosition, ratio = Fraction) -> list[tuple[ValidMoves, Fraction]] | None:
+        move = self.choose_move(state)
+        if move not in [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER] or state.get_current_shell() != None:
+            return [(move, ratio(1, 1))]
+        
+        live_chance = self.live_chance(state, ratio)
+        weights = [(self.shoot_other_player(state), live_chance), (self.shoot_self(state), 1 - live_chance)]
+        return [(move, weight) for move, weight in weights if weight > 0]
+
 def items_to_string(item_list: list[Items]):
     resultant = []
 
@@ -181,18 +262,48 @@ def items_to_string(item_list: list[Items]):
     resultant.sort()
     return "".join(resultant)
 
+def string_to_item(item_string: str):
+    item_string = item_string.lower()
+    items = []
+    
+    for char in item_string:
+        match char:
+            case "h":
+                items += [Items.HANDCUFFS]
+            case "s":
+                items += [Items.HAND_SAW]
+            case "c":
+                items += [Items.CIGARETTES]
+            case "b":
+                items += [Items.BEER]
+            case "m":
+                items += [Items.MAGNIFYING_GLASS]
+            case "a":
+                items += [Items.ADRENALINE]
+            case "e":
+                items += [Items.EXPIRED_MEDICINE]
+            case "f":
+                items += [Items.BURNER_PHONE]
+            case "i":
+                items += [Items.INVERTER]
+    
+    return items
+
 def shots_taken(move_list: list[ValidMoves]):
     shots = move_list.count(ValidMoves.SHOOT_DEALER)
     shots += move_list.count(ValidMoves.SHOOT_PLAYER)
     return shots
 
 class Move:
-    def __init__(self, move_type: ValidMoves, evaluation: int | Fraction, path = []):
+    def __init__(self, move_type: ValidMoves, evaluation: float | Fraction, path = []):
         self.move_type = move_type
         self.evaluation = evaluation
         self.path = path
     
     def gui_string(self):
+        # Nothing to play once the round is over, or there are no live shells left.
+        if self.move_type == None: return f"Evaluation: {float(self.evaluation)*100:.2f}"
+        
         match self.move_type:
             case ValidMoves.SHOOT_DEALER:
                 move = "Shoot Dealer"
@@ -223,223 +334,901 @@ class Move:
         if self.move_type == None: return f"Evaluation: {float(self.evaluation)}"
         return f"Move ({self.move_type}, Chance dealer kills player: {float(self.evaluation)*100:.2f}%)\nPath: {', '.join(convert_move_list(self.path))}"
 
-class BackshotRoulette:
+# Every evaluation lies between these, which is what lets chance nodes be pruned.
+# Plain ints, so they mix with either kind of arithmetic.
+MIN_EVALUATION = 0
+MAX_EVALUATION = 1
+
+# How chances and evaluations are calculated, as the function making a number from a numerator and denominator.
+# Fractions are exact but slow, so they're for checking the float search.
+ARITHMETIC = {
+    "float": truediv,
+    "fraction": Fraction,
+}
+
+# How the dealer is assumed to play, see `DealerModel`.
+DEALER_MODELS = {
+    "adversarial": AdversarialDealer,
+    "scripted": ScriptedDealer,
+    "stochastic": StochasticDealer,
+}
+
+# Size of the transposition table, unless BackshotRoulette is given another.
+TRANSPOSITION_TABLE_MIBIBYTES = 64
+
+# How far apart float and fraction evaluations of the same search are allowed to be, see `compare_arithmetic`.
+FLOAT_TOLERANCE = 1e-9
+
+# Float searches count evaluations this close to the edge of their alpha-beta window as outside it. Rounding in
+# expected_evaluation's Star1 windows can leave a cut off node's bound just inside the window, where it would be
+# mistaken for an exact evaluation.
+WINDOW_TOLERANCE = 1e-12
+
+# The history table has a score for every (turn, what's known about the chambered shell, move) combination.
+SHELL_KNOWLEDGE = {None: 0, "live": 1, "blank": 2}
+HISTORY_SIZE = 2 * len(SHELL_KNOWLEDGE) * len(ValidMoves)
+KILLER_MOVES_PER_PLY = 2
+
+def history_index(state: PackedPosition, move: ValidMoves) -> int:
+    return ((state.key & 1) * len(SHELL_KNOWLEDGE) + SHELL_KNOWLEDGE[state.get_current_shell()]) * len(ValidMoves) + move.value
+
+def kill_probability(live: int, blank: int, is_players_turn: bool, has_beer: bool, ratio = Fraction) -> float | Fraction:
+    """
+    Estimates the chance the dealer kills the player on their next shot, see `BackshotRoulette.evaluate_position`.
+    """
+    if live == 0: return ratio(0, 1) # Nobody can be shot with a blank.
+    
+    if is_players_turn:
+        # Since it isn't the dealer's turn, we evaluate based on the mean probability that the dealer can kill us on the next turn
+        # This is done by calculating the probabilities that the dealer could kill the player after a "bullet modifying move" (shooting, beer)
+        
+        # Shooting the dealer can result in one less live or one less blank
+        # Let L be the number of live shells and B the number of blank shells
+        #   1/2(L/(L+B-1) + (L-1)/(L+B-1))
+        # = 1/2((L+L-1)/(L+B-1))
+        # = (2L-1)/(2*(L+B-1))
+        
+        denominator = live + blank - 1
+        if denominator > 0:
+            shoot_dealer_eval = ratio(2 * live - 1, 2 * denominator)
+        else:
+            shoot_dealer_eval = ratio(1, 1)
+        
+        # This one is trickier to explain.
+        # Just, https://cdn.discordapp.com/attachments/1214864872001634374/1216704848293134358/image.png?ex=66015bb1&is=65eee6b1&hm=a3fdd531492b59d0a5802bedaec171791997e8e04553743fb5bcf71589d44b36&
+        # Same variable names as last time.
+        
+        shoot_self_eval = ratio(1, 1)
+        
+        for n in range(1, blank):
+            denominator = live + blank - n
+            
+            if denominator > 0:
+                shoot_self_eval += ratio(live - 1, denominator)
+            else:
+                shoot_dealer_eval += ratio(1, 1)
+        
+        shoot_self_eval *= ratio(1, blank) if blank > 0 else ratio(1, 1)
+        
+        # Using a beer can lead to four outcomes.
+        # 
+        #  racking         shooting
+        #
+        #                     live +- (L-2)/(L+B-2)
+        #    live +- (L-1)/(L+B-1) +
+        #         |          blank +- (L-1)/(L+B-2)
+        # L/(L+B) +
+        #         |           live +- (L-1)/(L+B-2)
+        #   blank +----- L/(L+B-1) +
+        #                    blank +----- L/(L+B-2)
+        #
+        # Summing the probabilities and dividing by 4 yields the average probability of
+        # (4L-3)/(4(L+B-2))
+        
+        if has_beer:
+            denominator = live + blank - 2
+            if denominator > 0:
+                use_beer_eval = ratio(4 * live - 3, 4 * denominator)
+            else:
+                use_beer_eval = ratio(1, 1)
+        else:
+            if blank > 0:
+                use_beer_eval = ratio(live, live + blank)
+            else:
+                use_beer_eval = ratio(1, 1)
+        
+        return min(shoot_dealer_eval, shoot_self_eval, use_beer_eval)
+    
+    if blank > 0:
+        dealer_kill_probability = ratio(live, live + blank)
+    else:
+        dealer_kill_probability = ratio(1, 1)
+    
+    return dealer_kill_probability
+
+def build_kill_probability_table(ratio = Fraction) -> list[float | Fraction]:
+    """
+    Returns `kill_probability` for every combination of its arguments, indexed by `kill_probability_index`.
+    """
+    table = []
+    
+    for live in range(SHELL_COUNT_MASK + 1):
+        for blank in range(SHELL_COUNT_MASK + 1):
+            for is_players_turn in (False, True):
+                for has_beer in (False, True):
+                    table += [kill_probability(live, blank, is_players_turn, has_beer, ratio)]
+    
+    return table
+
+def kill_probability_index(live: int, blank: int, is_players_turn: bool, has_beer: bool) -> int:
+    return (live * (SHELL_COUNT_MASK + 1) + blank) * 4 + 2 * is_players_turn + has_beer
+
+class SearchStatistics:
+    """
+    Counts what a search did. `BackshotRoulette.iterative_search` starts a new one every time it's called, otherwise
+    they keep adding up until `BackshotRoulette.statistics` is replaced.
+    """
     def __init__(self):
+        self.nodes_by_ply = {} # Calls to search, by how many moves they are from the root.
+        self.leaves = 0
+        
+        self.cutoffs = 0
+        self.cutoffs_by_move_index = {} # How many cutoffs came from the first move searched (0), the second (1), ...
+        self.chance_cutoffs = 0 # Chance nodes cut off by Star1.
+        
+        self.obvious_moves = 0 # Positions where obvious_move_exists picked the only move.
+        self.redundant_moves_skipped = 0
+        self.modelled_dealer_moves = 0 # Dealer turns played by the dealer model instead of searched.
+        
+        self.transposition_probes = 0
+        self.transposition_hits = 0
+        self.transposition_cutoffs = 0 # Probes good enough to return without searching.
+        
+        # Copied from the table's own counters when an iterative search ends, see `count_table`.
+        self.transposition_stores = 0
+        self.transposition_collisions = 0 # Stores that overwrote a different position.
+        self.transposition_occupancy = 0.0
+        
+        self.tablebase_hits = 0
+        self.analysis_cache_hits = 0
+        
+        self.move_generation_seconds = 0.0
+        self.evaluation_seconds = 0.0
+        self.depth_seconds = {} # Time to finish each depth of an iterative search, since it started.
+    
+    @property
+    def nodes(self) -> int:
+        return sum(self.nodes_by_ply.values())
+    
+    @property
+    def effective_branching_factor(self) -> float:
+        """
+        The number of children each position would need for the search to have reached its deepest ply with the same
+        number of positions there.
+        """
+        deepest_ply = max(self.nodes_by_ply, default = 0)
+        if deepest_ply == 0: return 0.0
+        return (self.nodes_by_ply[deepest_ply] / self.nodes_by_ply.get(0, 1)) ** (1 / deepest_ply)
+    
+    @property
+    def first_move_cutoff_rate(self) -> float:
+        """
+        Fraction of cutoffs caused by the first move searched, the higher the better the move ordering.
+        """
+        return self.cutoffs_by_move_index.get(0, 0) / self.cutoffs if self.cutoffs else 0.0
+    
+    def count_table(self, table: TranspositionTable):
+        """
+        Takes the stores and collisions `table` has counted since its counters were last reset, and how full it is.
+        """
+        self.transposition_stores = table.stores
+        self.transposition_collisions = table.collisions
+        self.transposition_occupancy = table.occupancy
+    
+    def __str__(self):
+        return f"""Search Statistics
+
+Positions: {self.nodes} ({self.leaves} leaves), deepest ply {max(self.nodes_by_ply, default = 0)}
+Effective branching factor: {self.effective_branching_factor:.2f}
+Cutoffs: {self.cutoffs} ({self.first_move_cutoff_rate * 100:.1f}% on the first move), {self.chance_cutoffs} chance nodes
+Obvious moves: {self.obvious_moves}, redundant moves skipped: {self.redundant_moves_skipped}, modelled dealer moves: {self.modelled_dealer_moves}
+Transposition table: {self.transposition_hits} / {self.transposition_probes} hits, {self.transposition_cutoffs} cutoffs, {self.transposition_stores} stores ({self.transposition_collisions} collisions), {self.transposition_occupancy * 100:.2f}% full
+Tablebase hits: {self.tablebase_hits}, analysis cache hits: {self.analysis_cache_hits}
+Move generation: {self.move_generation_seconds:.3f} seconds, evaluation: {self.evaluation_seconds:.3f} seconds
+"""
+
+class SearchAborted(Exception):
+    """
+    Raised inside `BackshotRoulette.search` when the time or node limit of an iterative search runs out.
+    """
+    pass
+
+class BackshotRoulette:
+    def __init__(self, arithmetic: str = "float", tablebase: Tablebase | None = None, in_place: bool = False, analysis_cache: AnalysisCache | None = None, dealer_model: str | DealerModel = "adversarial",
+                 table_mibibytes: int | float = TRANSPOSITION_TABLE_MIBIBYTES):
+        """
+        Args:
+            arithmetic (str, optional): "float" for speed, or "fraction" for exact evaluations. Defaults to "float".
+            tablebase (Tablebase | None, optional): Endgame tablebase to probe once few enough shells are left. Defaults to None.
+            in_place (bool, optional): Search by changing one MutablePosition in place and undoing each move, instead of
+                making a new position for every outcome. Defaults to False.
+            analysis_cache (AnalysisCache | None, optional): Results from earlier runs to look up before searching, and
+                to store results in afterwards. Defaults to None.
+            dealer_model (str | DealerModel, optional): How the dealer plays, a name from DEALER_MODELS or a model.
+                Anything but "adversarial" turns the dealer's turns into chance nodes over the moves the model plays,
+                which makes the tree much smaller. Defaults to "adversarial".
+            table_mibibytes (int | float, optional): Size of the transposition table, which is all allocated up front.
+                Defaults to TRANSPOSITION_TABLE_MIBIBYTES.
+        """
+        if arithmetic not in ARITHMETIC: raise ValueError(f"Unknown arithmetic {arithmetic!r}, expected one of {list(ARITHMETIC)}")
+        if tablebase != None and arithmetic != "float": raise ValueError("Tablebases store floats, so they can only be used with float arithmetic.")
+        if analysis_cache != None and arithmetic != "float": raise ValueError("Analysis caches store floats, so they can only be used with float arithmetic.")
+        
+        if isinstance(dealer_model, str):
+            if dealer_model not in DEALER_MODELS: raise ValueError(f"Unknown dealer model {dealer_model!r}, expected one of {list(DEALER_MODELS)}")
+            dealer_model = DEALER_MODELS[dealer_model]()
+        
+        # Neither is keyed by dealer model, so their results are only right against an adversarial dealer.
+        is_adversarial = isinstance(dealer_model, AdversarialDealer)
+        if tablebase != None and not is_adversarial: raise ValueError("Tablebases assume an adversarial dealer.")
+        if analysis_cache != None and not is_adversarial: raise ValueError("Analysis caches assume an adversarial dealer.")
+        
         self.positions_searched = 0
         self.max_depth = 0
         
+        # Printing every position is very slow, on_node is much cheaper if you only need some of them.
         self.verbose = False
-        self.transposition_table = TranspositionTable(64)
+        self.statistics = SearchStatistics()
+        
+        # Optional hooks, called as on_node(state, move_depth, parent_moves) when search starts on a position and
+        # on_cutoff(state, move, move_index, move_depth) when a move causes an alpha-beta cutoff.
+        # In an in-place search `state` changes once the hook returns, so copy its key if you want to keep it.
+        self.on_node = None
+        self.on_cutoff = None
+        
+        self.arithmetic = arithmetic
+        self.ratio = ARITHMETIC[arithmetic]
+        self.window_tolerance = WINDOW_TOLERANCE if arithmetic == "float" else 0
+        self.kill_probabilities = build_kill_probability_table(self.ratio)
+        self.transposition_table = TranspositionTable(table_mibibytes, exact = arithmetic == "fraction")
+        self.tablebase = tablebase
+        self.in_place = in_place
+        self.generate_outcomes = PackedPosition.outcome_keys if in_place else PackedPosition.outcomes
+        self.analysis_cache = analysis_cache
+        self.dealer_model = dealer_model
+        
+        # Move ordering, see get_ordered_moves. iterative_search clears these, and they carry over between its depths.
+        self.killer_moves = []
+        self.history = [0] * HISTORY_SIZE
+        
+        # Set by iterative_search, searches are unlimited otherwise.
+        self.deadline = None
+        self.node_limit = None
+        self.principal_variation = []
+        self.stop_requested = False
+        self.root_best = None # The best root move the last search finished, for when it's stopped part way through.
+        
+        # Created by parallel_search the first time it's needed, and kept so the workers keep their tables.
+        self.process_pool = None
+        self.process_pool_size = 0
     
-    def predicted_evaluation(self, move: ValidMoves, state: BuckshotRouletteMove) -> Fraction:
+    def evaluate_position(self, state: PackedPosition) -> float | Fraction:
         """
-        Estimates a position's evaluation.
+        Returns the chance the dealer kills the player on their next shot, looked up from `kill_probabilities`.
+        Only the shell counts, whose turn it is and whether a beer can be used matter.
         """
-        
-        state_eval = 0
+        key = state.key
+        has_beer = bool(state.count_usable_item(Items.BEER))
+        index = kill_probability_index((key >> LIVE_OFFSET) & SHELL_COUNT_MASK, (key >> BLANK_OFFSET) & SHELL_COUNT_MASK, key & 1, has_beer)
+        return self.kill_probabilities[index]
+    
+    def get_ordered_moves(self, state: PackedPosition, ply: int = 0) -> list[ValidMoves]:
+        """
+        Returns a list of moves ordered without playing any of them. The best move from the transposition table goes first,
+        then this ply's killer moves, then everything else by how often it has caused cutoffs (the history table).
+
+        Args:
+            state (PackedPosition): A given state in Buckshot Roulette.
+            ply (int, optional): How many moves `state` is from the root, for the killer moves. Defaults to 0.
 
-        if state.player_health == 0: state_eval = -INF
-        elif state.dealer_health == 0: state_eval = INF
+        Returns:
+            list[ValidMoves]: An ordered list of moves, most likely to be the best first.
+        """
+        history = self.history
+        history_offset = history_index(state, ValidMoves.SHOOT_DEALER)
+        scores = {move: history[history_offset + move.value] for move in state.get_all_moves()}
+        
+        if ply < len(self.killer_moves):
+            for rank, killer in enumerate(self.killer_moves[ply]):
+                if killer in scores: scores[killer] = INF - rank
+        
+        transposition = self.transposition_table.get(state.zobrist)
+        if transposition != None and transposition.best_move in scores:
+            scores[transposition.best_move] = 2 * INF
+        
+        return sorted(scores, key = scores.get, reverse = True)
+    
+    def record_cutoff(self, state: PackedPosition, move: ValidMoves, ply: int, move_depth: int):
+        """
+        Remembers `move` as a killer move for `ply`, and adds to its history score. Deeper cutoffs count for more,
+        since they save more work.
+        """
+        while len(self.killer_moves) <= ply:
+            self.killer_moves += [[None] * KILLER_MOVES_PER_PLY]
+        
+        killers = self.killer_moves[ply]
+        if killers[0] != move:
+            killers.pop()
+            killers.insert(0, move)
         
-        if state.unknown_live_shells + state.unknown_blank_shells != 0:
-            state_eval += known_shell_bonus(move, state)
-            state_eval += shoot_other_person_bonus(move, state)
+        self.history[history_index(state, move)] += (move_depth + 1) ** 2
+    
+    def get_search_moves(self, state: PackedPosition, parent_moves: list[ValidMoves] = []) -> list[ValidMoves]:
+        """
+        Returns the moves `search` looks at in `state`, in the order it looks at them.
+        """
+        # Force play any obvious moves, otherwise search all moves in order (see get_ordered_moves).
+        obvious_move = obvious_move_exists(state)
+        if obvious_move != None and state.is_legal(obvious_move):
+            self.statistics.obvious_moves += 1
+            return [obvious_move]
+        
+        # Redundant moves are skipped, unless that would leave nothing to play.
+        ordered_moves = self.get_ordered_moves(state, len(parent_moves))
+        all_moves = [move for move in ordered_moves if not is_redundant_move(move, state)] or ordered_moves
+        self.statistics.redundant_moves_skipped += len(ordered_moves) - len(all_moves)
         
-        #state_eval += item_bonus(state.player_items)
-        #state_eval -= item_bonus(state.dealer_items)
-        state_eval += item_usage_bonus(move, state)
+        # Follow the principal variation of the last iteration first, if we're still on it.
+        ply = len(parent_moves)
+        if ply < len(self.principal_variation) and parent_moves == self.principal_variation[:ply]:
+            pv_move = self.principal_variation[ply]
+            if pv_move in all_moves:
+                all_moves.remove(pv_move)
+                all_moves.insert(0, pv_move)
+        
+        return all_moves
+    
+    def leaf_evaluation(self, state: PackedPosition) -> float | Fraction:
+        """
+        Evaluates a position the search won't look past, between MIN_EVALUATION and MAX_EVALUATION.
+        """
+        if state.player_health == 0: return MIN_EVALUATION
+        if state.dealer_health == 0: return MAX_EVALUATION
         
-        state_eval -= hand_saw_penalty(state)
-        state_eval -= low_health_penalty(state)
+        chance_player_lives = 1 - self.evaluate_position(state)
+        health_difference = self.ratio(state.player_health, state.dealer_health + state.player_health)
+        return chance_player_lives * health_difference
+    
+    def timed_leaf_evaluation(self, state: PackedPosition) -> float | Fraction:
+        start_time = time.perf_counter()
+        evaluation = self.leaf_evaluation(state)
+        self.statistics.evaluation_seconds += time.perf_counter() - start_time
+        return evaluation
+    
+    def search(self, move_depth: int, state: PackedPosition | BuckshotRouletteMove, alpha = -INF, beta = INF, parent_moves = []) -> Move:
+        """
+        Expectimax search with alpha-beta pruning on the player's and dealer's moves, and Star1/Star2 pruning on chance
+        (see `expected_evaluation`). The evaluation of the returned move is the expected evaluation of `state`.
 
-        health_difference = Fraction(state.player_health, state.player_health + state.dealer_health)
-        state_eval += health_difference * 100
+        Args:
+            move_depth (int): How many more shots to search.
+            state (PackedPosition | BuckshotRouletteMove): The position to search.
+            alpha (optional): The evaluation the player is already guaranteed elsewhere. Defaults to -INF.
+            beta (optional): The evaluation the dealer is already guaranteed elsewhere. Defaults to INF.
+            parent_moves (list[ValidMoves], optional): The moves leading to `state`. Defaults to [].
 
-        return state_eval
-    
-    def evaluate_position(self, state: BuckshotRouletteMove) -> Fraction:   
-        if state.is_players_turn:
-            # Since it isn't the dealer's turn, we evaluate based on the mean probability that the dealer can kill us on the next turn
-            # This is done by calculating the probabilities that the dealer could kill the player after a "bullet modifying move" (shooting, beer)
+        Returns:
+            Move: The best move and its evaluation.
+        """
+        if isinstance(state, BuckshotRouletteMove): state = state.to_packed()
+        
+        statistics = self.statistics
+        ply = len(parent_moves)
+        
+        # An aborted search doesn't undo its moves, so the root is copied rather than changed.
+        if self.in_place and ply == 0: state = MutablePosition(state.key, state.zobrist)
+        statistics.nodes_by_ply[ply] = statistics.nodes_by_ply.get(ply, 0) + 1
+        
+        if self.on_node != None: self.on_node(state, move_depth, parent_moves)
+        if self.verbose: print(f"Starting search with move_depth {move_depth} on moves {', '.join(convert_move_list(parent_moves))}")
+        
+        if self.stop_requested: raise SearchAborted()
+        if self.deadline != None and time.perf_counter() >= self.deadline: raise SearchAborted()
+        if self.node_limit != None and self.positions_searched >= self.node_limit: raise SearchAborted()
+        
+        if 0 in [move_depth, state.player_health, state.dealer_health, state.unknown_live_shells]:
+            statistics.leaves += 1
+            return Move(None, self.timed_leaf_evaluation(state))
+        
+        tablebase_entry = self.probe_tablebase(move_depth, state)
+        if tablebase_entry != None:
+            evaluation, best_move = tablebase_entry
+            return Move(best_move, evaluation, [best_move])
+        
+        transposition = self.transposition_table.get(state.zobrist)
+        statistics.transposition_probes += 1
+        if transposition != None:
+            statistics.transposition_hits += 1
+        
+        if transposition != None and transposition.depth >= move_depth:
+            is_exact = transposition.flag == EXACT
+            fails_high = transposition.flag == LOWER_BOUND and transposition.evaluation >= beta
+            fails_low = transposition.flag == UPPER_BOUND and transposition.evaluation <= alpha
             
-            # Shooting the dealer can result in one less live or one less blank
-            # Let L be the number of live shells and B the number of blank shells
-            #   1/2(L/(L+B-1) + (L-1)/(L+B-1))
-            # = 1/2((L+L-1)/(L+B-1))
-            # = (2L-1)/(2*(L+B-1))
+            if is_exact or fails_high or fails_low:
+                statistics.transposition_cutoffs += 1
+                return Move(transposition.best_move, transposition.evaluation, [transposition.best_move])
+        
+        cached = self.probe_analysis_cache(move_depth, state, ply)
+        if cached != None:
+            evaluation, path = cached
+            return Move(path[0] if path else None, evaluation, path)
+        
+        original_alpha, original_beta = alpha, beta
+        
+        start_time = time.perf_counter()
+        dealer_moves = None if state.is_players_turn else self.dealer_model.move_weights(state, self.ratio)
+        all_moves = self.get_search_moves(state, parent_moves) if dealer_moves == None else []
+        statistics.move_generation_seconds += time.perf_counter() - start_time
+        
+        best_move = ValidMoves.SHOOT_PLAYER if state.is_players_turn else ValidMoves.SHOOT_DEALER
+        best_eval = -INF if state.is_players_turn else INF
+        best_path = []
+        
+        # A modelled dealer doesn't choose, so its turn is a chance node over the moves it might play.
+        if dealer_moves != None:
+            statistics.modelled_dealer_moves += 1
+            best_move = max(dealer_moves, key = lambda move_weight: move_weight[1])[0]
+            best_eval, best_path = self.policy_evaluation(move_depth, dealer_moves, alpha, beta, parent_moves, state)
+        
+        for move_index, move in enumerate(all_moves):
+            # Every move from get_search_moves is legal, so there's no need for move() to check again.
+            possible_positions = tuple(self.generate_outcomes(state, move, self.ratio))
             
-            denominator = state.unknown_live_shells + state.unknown_blank_shells - 1
-            if denominator > 0:
-                shoot_dealer_eval = Fraction(2 * state.unknown_live_shells - 1, 2 * denominator)
+            # Decrement depth on each shot.
+            next_depth = move_depth
+            if move in [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER]:
+                next_depth -= 1
+            
+            eval, path = self.expected_evaluation(next_depth, possible_positions, alpha, beta, parent_moves + [move], state)
+            
+            # A move that fails low (or high for the dealer) only returns a bound, which rounding can leave just past the
+            # best evaluation so far, so only clearly better moves replace it.
+            if state.is_players_turn:
+                if eval > best_eval + self.window_tolerance:
+                    best_eval = eval
+                    best_move = move
+                    best_path = path
+                
+                alpha = max(alpha, eval)
             else:
-                shoot_dealer_eval = Fraction(1, 1)
+                if eval < best_eval - self.window_tolerance:
+                    best_eval = eval
+                    best_move = move
+                    best_path = path
+                
+                beta = min(beta, eval)
             
-            # This one is trickier to explain.
-            # Just, https://cdn.discordapp.com/attachments/1214864872001634374/1216704848293134358/image.png?ex=66015bb1&is=65eee6b1&hm=a3fdd531492b59d0a5802bedaec171791997e8e04553743fb5bcf71589d44b36&
-            # Same variable names as last time.
+            if ply == 0: self.root_best = Move(best_move, best_eval, [best_move] + best_path)
             
-            shoot_self_eval = Fraction(1, 1)
+            if beta <= alpha:
+                statistics.cutoffs += 1
+                statistics.cutoffs_by_move_index[move_index] = statistics.cutoffs_by_move_index.get(move_index, 0) + 1
+                if self.on_cutoff != None: self.on_cutoff(state, move, move_index, move_depth)
+                self.record_cutoff(state, move, ply, move_depth)
+                break
+        
+        self.positions_searched += 1
+        
+        if best_eval <= original_alpha + self.window_tolerance:
+            flag = UPPER_BOUND
+        elif best_eval >= original_beta - self.window_tolerance:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        
+        self.transposition_table.add(Transposition(state.zobrist, best_eval, move_depth, flag, best_move))
+        
+        if flag == EXACT and self.uses_analysis_cache(move_depth, ply):
+            self.analysis_cache.add(state, move_depth, best_eval, [best_move] + best_path)
+        
+        return Move(best_move, best_eval, [best_move] + best_path)
+    
+    def move_outcomes(self, state: PackedPosition, move: ValidMoves) -> tuple[tuple, ...]:
+        """
+        Returns the outcomes of `move` in the form `expected_evaluation` takes them.
+        """
+        return tuple(self.generate_outcomes(state, move, self.ratio))
+    
+    def policy_evaluation(self, move_depth: int, move_weights: list[tuple[ValidMoves, Fraction]], alpha, beta, parent_moves: list[ValidMoves], state: PackedPosition):
+        """
+        Returns the expected evaluation of playing each move in `move_weights` with its chance, and the path through the
+        likeliest one. Moves are pruned like outcomes in `expected_evaluation` (Star1), so a single move just passes the
+        window on, and a cut off node returns a bound.
+        """
+        expected_eval = 0
+        best_path = []
+        lower = sum(weight * MIN_EVALUATION for _, weight in move_weights)
+        upper = sum(weight * MAX_EVALUATION for _, weight in move_weights)
+        most_likely_weight = 0
+        
+        for move, weight in move_weights:
+            lower -= weight * MIN_EVALUATION
+            upper -= weight * MAX_EVALUATION
+            child_alpha = (alpha - expected_eval - upper) / weight
+            child_beta = (beta - expected_eval - lower) / weight
             
-            for n in range(1, state.unknown_blank_shells):
-                denominator = state.unknown_live_shells + state.unknown_blank_shells - n
-                
-                if denominator > 0:
-                    shoot_self_eval += Fraction(state.unknown_live_shells - 1, denominator)
-                else:
-                    shoot_dealer_eval += Fraction(1, 1)
+            next_depth = move_depth - 1 if move in [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER] else move_depth
+            eval, path = self.expected_evaluation(next_depth, self.move_outcomes(state, move), child_alpha, child_beta, parent_moves + [move], state)
             
-            shoot_self_eval *= Fraction(1, state.unknown_blank_shells) if state.unknown_blank_shells > 0 else Fraction(1, 1)
+            fails_low = eval <= child_alpha + self.window_tolerance
+            if fails_low or eval >= child_beta - self.window_tolerance:
+                self.statistics.chance_cutoffs += 1
+                return expected_eval + weight * eval + (upper if fails_low else lower), []
             
-            # Using a beer can lead to four outcomes.
-            # 
-            #  racking         shooting
-            #
-            #                     live +- (L-2)/(L+B-2)
-            #    live +- (L-1)/(L+B-1) +
-            #         |          blank +- (L-1)/(L+B-2)
-            # L/(L+B) +
-            #         |           live +- (L-1)/(L+B-2)
-            #   blank +----- L/(L+B-1) +
-            #                    blank +----- L/(L+B-2)
-            #
-            # Summing the probabilities and dividing by 4 yields the average probability of
-            # (4L-3)/(4(L+B-2))
+            expected_eval += weight * eval
+            if weight > most_likely_weight:
+                most_likely_weight = weight
+                best_path = path
+        
+        return expected_eval, best_path
+    
+    def uses_analysis_cache(self, move_depth: int, ply: int) -> bool:
+        """
+        Whether a position is looked up in and stored to the analysis cache. That's every root, and anything searched
+        deeply enough to be worth a database lookup.
+        """
+        if self.analysis_cache == None: return False
+        return ply == 0 or move_depth >= self.analysis_cache.min_depth
+    
+    def probe_analysis_cache(self, move_depth: int, state: PackedPosition, ply: int) -> tuple[float, list[ValidMoves]] | None:
+        if not self.uses_analysis_cache(move_depth, ply): return None
+        
+        cached = self.analysis_cache.get(state, move_depth)
+        if cached != None: self.statistics.analysis_cache_hits += 1
+        return cached
+    
+    def probe_tablebase(self, move_depth: int, state: PackedPosition) -> tuple[float, ValidMoves] | None:
+        """
+        Returns `(evaluation, best move)` from the tablebase, if there is one, it covers `state`, and the search is deep
+        enough to reach the end of the round anyway (so the tablebase agrees with it).
+        """
+        if self.tablebase == None: return None
+        if move_depth < state.unknown_live_shells + state.unknown_blank_shells: return None
+        
+        entry = self.tablebase.get(state)
+        if entry != None: self.statistics.tablebase_hits += 1
+        return entry
+    
+    def bound_outcome(self, move_depth: int, state: PackedPosition) -> tuple[Fraction, Fraction]:
+        """
+        Returns known `(lower, upper)` bounds on the evaluation of `state` without searching it.
+        """
+        if 0 in [move_depth, state.player_health, state.dealer_health, state.unknown_live_shells]:
+            evaluation = self.timed_leaf_evaluation(state)
+            return evaluation, evaluation
+        
+        tablebase_entry = self.probe_tablebase(move_depth, state)
+        if tablebase_entry != None:
+            return tablebase_entry[0], tablebase_entry[0]
+        
+        transposition = self.transposition_table.get(state.zobrist)
+        if transposition != None and transposition.depth >= move_depth:
+            if transposition.flag == EXACT:
+                return transposition.evaluation, transposition.evaluation
+            elif transposition.flag == LOWER_BOUND:
+                return max(MIN_EVALUATION, transposition.evaluation), MAX_EVALUATION
+            else:
+                return MIN_EVALUATION, min(MAX_EVALUATION, transposition.evaluation)
+        
+        return MIN_EVALUATION, MAX_EVALUATION
+    
+    def expected_evaluation(self, move_depth: int, outcomes: tuple[tuple, ...], alpha, beta, parent_moves: list[ValidMoves], state: PackedPosition | None = None):
+        """
+        Returns the expected evaluation of a chance node, and the path through its most likely outcome.
+        
+        Every evaluation lies between MIN_EVALUATION and MAX_EVALUATION, so after searching some outcomes the expected
+        evaluation is bounded by assuming the rest are as good or as bad as possible. Once those bounds leave the
+        (alpha, beta) window the node is cut off (Star1). Before searching anything, each outcome's bounds are tightened
+        from leaf evaluations and the transposition table (a cheap version of Star2's probing), which can cut the node off
+        straight away. Like alpha-beta, a cut off node returns a bound on its evaluation rather than the evaluation itself.
+        
+        `outcomes` are `(chance, position)` pairs from `PackedPosition.outcomes`. In-place searches pass
+        `(chance, (key, zobrist))` pairs from `outcome_keys` instead, and `state` is changed to each of them and back.
+        """
+        in_place = self.in_place
+        
+        if len(outcomes) == 1:
+            position = outcomes[0][1]
+            if in_place: position, undo = state, state.make(*position)
+            result = self.search(move_depth, position, alpha, beta, parent_moves)
+            if in_place: state.unmake(undo)
+            return result.evaluation, result.path
+        
+        lower_bounds, upper_bounds = [], []
+        for _, position in outcomes:
+            if in_place: position, undo = state, state.make(*position)
+            lower, upper = self.bound_outcome(move_depth, position)
+            if in_place: state.unmake(undo)
+            lower_bounds += [lower]
+            upper_bounds += [upper]
+        
+        lower = sum(chance * bound for (chance, _), bound in zip(outcomes, lower_bounds))
+        upper = sum(chance * bound for (chance, _), bound in zip(outcomes, upper_bounds))
+        
+        if lower >= beta or upper <= alpha:
+            self.statistics.chance_cutoffs += 1
+            return (lower, []) if lower >= beta else (upper, [])
+        
+        # Star1: search each outcome properly, bounding the ones not searched yet.
+        expected_eval = 0
+        best_path = []
+        most_likely_chance = 0
+        
+        for index, (chance, position) in enumerate(outcomes):
+            lower -= chance * lower_bounds[index]
+            upper -= chance * upper_bounds[index]
             
-            if ValidMoves.USE_BEER in state.get_all_moves():
-                denominator = state.unknown_live_shells + state.unknown_blank_shells - 2
-                if denominator > 0:
-                    use_beer_eval = Fraction(4 * state.unknown_live_shells - 3, 4 * denominator)
-                else:
-                    use_beer_eval = Fraction(1, 1)
+            if lower_bounds[index] == upper_bounds[index]:
+                eval, path = lower_bounds[index], []
             else:
-                if state.unknown_blank_shells > 0:
-                    use_beer_eval = Fraction(state.unknown_live_shells, state.unknown_live_shells + state.unknown_blank_shells)
-                else:
-                    use_beer_eval = Fraction(1, 1)
+                child_alpha = (alpha - expected_eval - upper) / chance
+                child_beta = (beta - expected_eval - lower) / chance
+                
+                if in_place: position, undo = state, state.make(*position)
+                result = self.search(move_depth, position, max(child_alpha, lower_bounds[index]), min(child_beta, upper_bounds[index]), parent_moves)
+                if in_place: state.unmake(undo)
+                eval, path = result.evaluation, result.path
+                
+                fails_low = eval <= child_alpha + self.window_tolerance
+                if fails_low or eval >= child_beta - self.window_tolerance:
+                    self.statistics.chance_cutoffs += 1
+                    return expected_eval + chance * eval + (upper if fails_low else lower), []
             
-            return min(shoot_dealer_eval, shoot_self_eval, use_beer_eval)
+            expected_eval += chance * eval
+            if chance > most_likely_chance:
+                most_likely_chance = chance
+                best_path = path
         
-        if state.unknown_blank_shells > 0:
-            dealer_kill_probability = Fraction(state.unknown_live_shells, state.unknown_live_shells + state.unknown_blank_shells)
-        else:
-            dealer_kill_probability = Fraction(1, 1)
-        
-        return dealer_kill_probability
+        return expected_eval, best_path
     
-    def get_ordered_moves(self, state: BuckshotRouletteMove) -> list[ValidMoves]:
+    def parallel_search(self, move_depth: int, state: PackedPosition | BuckshotRouletteMove, workers: int | None = None) -> Move:
         """
-        Returns a list of moves ordered by predicted evaluation or transposition.
+        Same as `search`, but the root is split between separate processes.
+        
+        The first root move (the principal variation's, when there is one) has nothing to prune against, so each of its
+        outcomes is searched in parallel. Every move after that is searched whole by one worker, with the best evaluation
+        of the moves before it as its window, so it's pruned just like in `search`. Only `workers` moves are searched at
+        once so later ones get the best bound found so far, and results are used in move order, so the best move and
+        its evaluation are the same as `search`'s.
+        
+        Each worker keeps its own transposition table between calls, but they don't share them, so a worker searches
+        positions another one already has. Expect more positions searched in total than `search`.
 
         Args:
-            state (BuckshotRouletteMove): A given state in Buckshot Roulette.
+            move_depth (int): How many more shots to search.
+            state (PackedPosition | BuckshotRouletteMove): The position to search.
+            workers (int | None, optional): How many processes to search with. Defaults to None (every core).
 
         Returns:
-            list[ValidMoves]: An ordered list of moves, sorted from highest predicted evaluation to lowest.
+            Move: The best move and its evaluation.
         """
-        available_moves = state.get_all_moves()
-        available_moves = [move for move in available_moves if type(move) != int]
-        move_eval_dict = {}
+        if isinstance(state, BuckshotRouletteMove): state = state.to_packed()
         
-        for move in available_moves:
-            possible_positions = state.move(move)
-            
-            if possible_positions == None: continue
+        if 0 in [move_depth, state.player_health, state.dealer_health, state.unknown_live_shells]:
+            return self.search(move_depth, state)
+        
+        # A modelled dealer plays one move (or a few), there's nothing to split between workers.
+        if not state.is_players_turn and self.dealer_model.move_weights(state, self.ratio) != None:
+            return self.search(move_depth, state)
+        
+        if self.stop_requested: raise SearchAborted()
+        if self.node_limit != None and self.positions_searched >= self.node_limit: raise SearchAborted()
+        
+        process_pool = self.get_process_pool(workers)
+        workers = self.process_pool_size
+        
+        # perf_counter doesn't mean the same thing in another process, so workers get the deadline as wall clock time.
+        deadline = None if self.deadline == None else time.time() + self.deadline - time.perf_counter()
+        
+        def submit(move: ValidMoves, outcome_index: int | None = None, alpha = -INF, beta = INF):
+            next_depth = move_depth - 1 if move in [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER] else move_depth
+            return process_pool.submit(search_in_worker, next_depth, state, move, outcome_index, alpha, beta, self.principal_variation, deadline)
+        
+        def result_of(future) -> tuple:
+            result = future.result()
+            if result == None: raise SearchAborted()
             
-            best_eval = -INF if state.is_players_turn else INF
+            self.positions_searched += result[2]
+            return result
+        
+        root_moves = self.get_search_moves(state)
+        first_move = root_moves[0]
+        first_outcomes = tuple(state.outcomes(first_move, self.ratio))
+        futures = [submit(first_move, index) for index in range(len(first_outcomes))]
+        
+        try:
+            best_eval = 0
+            best_path = []
+            most_likely_chance = 0
             
-            for position in possible_positions:
-                if position == None: continue
-                """
-                transposition_key = (state, move)
-
-                if transposition_key in self.transposition_table:
-                    print("transposition accessed")
-                    position_eval = self.transposition_table[transposition_key].evaluation
-                else:
-                """ 
-                position_eval = self.predicted_evaluation(move, position)
+            for (chance, _), future in zip(first_outcomes, futures):
+                outcome_eval, outcome_path, _ = result_of(future)
+                best_eval += chance * outcome_eval
                 
-                if state.is_players_turn:
-                    best_eval = max(best_eval, position_eval)
-                else:
-                    best_eval = min(best_eval, position_eval)
+                if chance > most_likely_chance:
+                    most_likely_chance = chance
+                    best_path = outcome_path
             
-            move_eval_dict[move] = best_eval
+            best_move = first_move
+            futures = []
+            
+            for index, move in enumerate(root_moves[1:], 1):
+                # Keep every worker busy, submitting with the best bound so far, and use the oldest result first.
+                while len(futures) < workers and index + len(futures) < len(root_moves):
+                    next_move = root_moves[index + len(futures)]
+                    alpha, beta = (best_eval, INF) if state.is_players_turn else (-INF, best_eval)
+                    futures += [submit(next_move, alpha = alpha, beta = beta)]
+                
+                # Compared like in `search`, a move that failed low (or high for the dealer) only returns a bound.
+                eval, path, _ = result_of(futures.pop(0))
+                
+                tolerance = self.window_tolerance
+                if state.is_players_turn and eval > best_eval + tolerance or not state.is_players_turn and eval < best_eval - tolerance:
+                    best_eval = eval
+                    best_move = move
+                    best_path = path
+        finally:
+            for future in futures: future.cancel()
         
-        sorted_moves = sorted(move_eval_dict, key = move_eval_dict.get)
+        self.positions_searched += 1
+        self.transposition_table.add(Transposition(state.zobrist, best_eval, move_depth, EXACT, best_move))
         
-        return sorted_moves
+        return Move(best_move, best_eval, [best_move] + best_path)
     
-    def search(self, move_depth: int, state: BuckshotRouletteMove, alpha = -INF, beta = INF, parent_moves = []) -> Move:
-        if self.verbose: print(f"Starting search with move_depth {move_depth} on moves {', '.join(convert_move_list(parent_moves))}")
+    def get_process_pool(self, workers: int | None = None) -> ProcessPoolExecutor:
+        workers = workers or os.cpu_count() or 1
         
-        if 0 in [move_depth, state.player_health, state.dealer_health, state.unknown_live_shells]:
-            chance_player_lives = 1 - self.evaluate_position(state)
-            health_difference = Fraction(state.player_health, state.dealer_health + state.player_health)
-            return Move(None, chance_player_lives * health_difference * state.probabilty)
+        if self.process_pool == None or self.process_pool_size != workers:
+            self.close()
+            self.process_pool = ProcessPoolExecutor(workers, initializer = start_worker, initargs = (self.arithmetic, self.tablebase and self.tablebase.path, self.dealer_model))
+            self.process_pool_size = workers
+        
+        return self.process_pool
+    
+    def stop(self):
+        """
+        Stops the current iterative_search as soon as possible, from any thread. It returns the deepest finished result,
+        or `fallback_move` if depth 1 didn't finish.
+        
+        iterative_search only clears the request when it finishes, so stopping a search that's about to start (like one
+        just handed to another thread) still works. Set `stop_requested` to False before starting a search if a stop
+        from earlier shouldn't count.
+        """
+        self.stop_requested = True
+    
+    def close(self):
+        """
+        Shuts down the worker processes used by parallel_search, if there are any.
+        """
+        if self.process_pool != None:
+            self.process_pool.shutdown(cancel_futures = True)
+            self.process_pool = None
+            self.process_pool_size = 0
+    
+    def iterative_search(self, position: PackedPosition | BuckshotRouletteMove, max_depth: int, time_limit: float | None = None, node_limit: int | None = None, on_depth = None, workers: int = 1) -> Move:
+        """
+        Searches `position` at depth 1, 2, ... up to `max_depth`, reusing the transposition table and principal variation
+        of each depth to order the next one.
 
-        # Force play any obvious moves, otherwise search all moves ordered by predicted evaluation.
-        obvious_move = obvious_move_exists(state)
-        if obvious_move != None:
-            all_moves = [obvious_move]
-        else:
-            all_moves = self.get_ordered_moves(state)
+        Args:
+            position (PackedPosition | BuckshotRouletteMove): The position to search.
+            max_depth (int): The deepest search to try, in shots.
+            time_limit (float | None, optional): Seconds to stop searching after. Defaults to None (no limit).
+            node_limit (int | None, optional): Positions to stop searching after. Defaults to None (no limit).
+            on_depth (optional): Called with `(depth, move)` every time a depth finishes.
+            workers (int, optional): Searches with parallel_search if more than 1, which only checks the node limit
+                before each depth. Defaults to 1.
+
+        Returns:
+            Move: The result of the deepest search that finished, or `fallback_move` if the limits ran out (or `stop`
+                was called) before depth 1 did.
+        """
+        if isinstance(position, BuckshotRouletteMove): position = position.to_packed()
         
-        best_move = ValidMoves.SHOOT_PLAYER if state.is_players_turn else ValidMoves.SHOOT_DEALER
-        best_eval = -INF if state.is_players_turn else INF
-        best_path = []
+        best_result = None
+        self.root_best = None
+        self.principal_variation = []
+        self.statistics = SearchStatistics()
+        self.transposition_table.reset_counters()
+        self.killer_moves = []
+        self.history = [0] * HISTORY_SIZE
         
-        for move in all_moves:
-            if obvious_move == None and is_redundant_move(move, state): continue
-            try:
-                possible_positions = state.move(move)
-            except InvalidMoveError:
-                continue
-            
-            if possible_positions == None: continue
-            
-            for position in possible_positions:
-                if position == None: continue
-                """
-                transposition_key = state, move
-                current_turn = self.max_depth - shots_taken(parent_moves)
-                
-                if self.transposition_table[transposition_key] != None and self.transposition_table[transposition_key].move_depth == current_turn:
-                    print("transposition accessed")
-                    eval = self.transposition_table[transposition_key].evaluation
-                    eval *= position.probabilty
-                    path = []
-                else: (next 3 lines were indented)
-                """
-                # Decrement depth on each shot.
-                next_depth = move_depth
-                if move in [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER]:
-                    next_depth -= 1
-                
-                lower_search = self.search(next_depth, position, alpha, beta, parent_moves + [move])
-                eval = lower_search.evaluation
-                path = lower_search.path
-                
-                if state.is_players_turn:
-                    if eval > best_eval:
-                        best_eval = eval
-                        best_move = move
-                        best_path = path
-                    
-                    alpha = max(alpha, eval)
-                else:
-                    if eval < best_eval:
-                        best_eval = eval
-                        best_move = move
-                        best_path = path
-                    
-                    beta = min(beta, eval)
+        # Limits apply from the start, even depth 1 can take far longer than a time limit on a big enough position.
+        start_time = time.perf_counter()
+        if time_limit != None: self.deadline = start_time + time_limit
+        if node_limit != None: self.node_limit = self.positions_searched + node_limit
+        
+        try:
+            for depth in range(1, max_depth + 1):
+                self.max_depth = depth
                 
-                if beta <= alpha:
+                try:
+                    if workers > 1:
+                        result = self.parallel_search(depth, position, workers)
+                    else:
+                        result = self.search(depth, position)
+                except SearchAborted:
+                    if best_result == None: best_result = self.fallback_move(position)
                     break
+                
+                best_result = result
+                self.principal_variation = result.path
+                self.statistics.depth_seconds[depth] = time.perf_counter() - start_time
+                if on_depth != None: on_depth(depth, result)
+        finally:
+            self.statistics.count_table(self.transposition_table)
+            self.deadline = None
+            self.node_limit = None
+            self.principal_variation = []
+            self.stop_requested = False
+            if self.analysis_cache != None: self.analysis_cache.commit()
         
-            if beta <= alpha:
-                break
+        return best_result
+    
+    def fallback_move(self, position: PackedPosition) -> Move:
+        """
+        Returns something to play when depth 1 of a search didn't finish, the best root move it did finish searching or
+        failing that, the first move it would have searched, with the position's leaf evaluation.
+        """
+        if self.root_best != None: return self.root_best
+        if 0 in [position.player_health, position.dealer_health, position.unknown_live_shells]:
+            return Move(None, self.leaf_evaluation(position))
         
-        self.positions_searched += 1
-        return Move(best_move, best_eval, [best_move] + best_path)
\ No newline at end of file
+        move = self.get_search_moves(position)[0]
+        return Move(move, self.leaf_evaluation(position), [move])
+
+def compare_arithmetic(position: PackedPosition | BuckshotRouletteMove, max_depth: int) -> float:
+    """
+    Searches `position` to every depth up to `max_depth` with float and fraction arithmetic, and returns the largest
+    difference between their root evaluations. Should be within FLOAT_TOLERANCE.
+    """
+    evaluations = {}
+    
+    for arithmetic in ARITHMETIC:
+        engine = BackshotRoulette(arithmetic)
+        evaluations[arithmetic] = []
+        engine.iterative_search(position, max_depth, on_depth = lambda depth, result: evaluations[arithmetic].append(result.evaluation))
+    
+    return max(abs(float(exact) - float(rounded)) for exact, rounded in zip(evaluations["fraction"], evaluations["float"]))
+
+# Each worker process of parallel_search gets its own engine, so its transposition table lasts between searches.
+worker_engine: BackshotRoulette | None = None
+
+def start_worker(arithmetic: str = "float", tablebase_path: str | None = None, dealer_model: str | DealerModel = "adversarial"):
+    global worker_engine
+    worker_engine = BackshotRoulette(arithmetic, None if tablebase_path == None else Tablebase.open(tablebase_path), dealer_model = dealer_model)
+
+def search_in_worker(move_depth: int, state: PackedPosition, move: ValidMoves, outcome_index: int | None, alpha, beta,
+                     principal_variation: list[ValidMoves], deadline: float | None):
+    """
+    Searches a root move for `BackshotRoulette.parallel_search` within `(alpha, beta)`, or just its outcome at
+    `outcome_index` if that's given. `deadline` is in `time.time()` seconds.
+    Returns `(evaluation, path, positions searched)`, or None if it ran out of time.
+    """
+    worker_engine.positions_searched = 0
+    worker_engine.principal_variation = principal_variation
+    if deadline != None: worker_engine.deadline = time.perf_counter() + deadline - time.time()
+    
+    outcomes = worker_engine.move_outcomes(state, move)
+    if outcome_index != None: outcomes = outcomes[outcome_index:outcome_index + 1]
+    
+    try:
+        evaluation, path = worker_engine.expected_evaluation(move_depth, outcomes, alpha, beta, [move], state)
+    except SearchAborted:
+        return None
+    finally:
+        worker_engine.deadline = None
+        worker_engine.principal_variation = []
+    
+    return evaluation, path, worker_engine.positions_searched
\ No newline at end of file
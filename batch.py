@@ -0,0 +1,149 @@
+from backshot import *
+from concurrent.futures import FIRST_COMPLETED, wait
+import argparse
+import csv
+import json
+import sys
+
+# Each worker process gets its own engine, so its transposition table lasts between positions.
+batch_engine: BackshotRoulette | None = None
+
+def string_to_bool(value) -> bool:
+    if isinstance(value, str): return value.strip().lower() in ["y", "yes", "true", "1"]
+    return bool(value)
+
+def fields_to_position(fields: dict) -> PackedPosition:
+    """
+    Builds a position from the same fields `start.py` asks for. Items are strings in `start.py`'s item key ("hsb"),
+    `current_shell` is "live", "blank" or empty, and `handcuffed` is 0, 1 or 2 like in `start.py`.
+    Raises ValueError, KeyError or TypeError if a field is missing, empty or impossible.
+    """
+    current_shell = (fields.get("current_shell") or "").lower()
+    current_shell = "live" if current_shell.startswith("l") else "blank" if current_shell.startswith("b") else None
+    
+    return PackedPosition.from_fields(string_to_bool(fields["is_players_turn"]),
+                                      int(fields["max_health"]),
+                                      int(fields["dealer_health"]),
+                                      int(fields["player_health"]),
+                                      int(fields["live_shells"]),
+                                      int(fields["blank_shells"]),
+                                      string_to_item(fields.get("dealer_items") or ""),
+                                      string_to_item(fields.get("player_items") or ""),
+                                      [current_shell],
+                                      int(fields.get("handcuffed") or 0),
+                                      string_to_bool(fields.get("gun_is_sawed") or False))
+
+def read_positions(file, file_format: str):
+    """
+    Yields the fields of every position in `file`, which is either "jsonl" (one object per line) or "csv" (with a header row).
+    Lines that aren't valid JSON are yielded as their JSONDecodeError, and lines that aren't JSON objects as a ValueError.
+    """
+    if file_format == "csv":
+        yield from csv.DictReader(file)
+        return
+    
+    for line in file:
+        if not line.strip(): continue
+        
+        # A bad line shouldn't stop a long batch, so it's passed on to be reported like any other error.
+        try:
+            fields = json.loads(line)
+        except json.JSONDecodeError as error:
+            yield error
+            continue
+        
+        yield fields if isinstance(fields, dict) else ValueError(f"Expected a JSON object, got {type(fields).__name__}")
+
+def start_batch_worker(arithmetic: str, tablebase_path: str | None):
+    global batch_engine
+    batch_engine = BackshotRoulette(arithmetic, None if tablebase_path == None else Tablebase.open(tablebase_path))
+
+def analyse_in_worker(fields: dict, max_depth: int, time_limit: float | None, node_limit: int | None) -> dict:
+    """
+    Searches one position for `analyse_batch`, returning its result line without the line number.
+    """
+    start_time = time.perf_counter()
+    start_nodes = batch_engine.positions_searched
+    finished_depth = {"depth": 0}
+    
+    try:
+        position = fields_to_position(fields)
+        result = batch_engine.iterative_search(position, max_depth, time_limit, node_limit,
+                                               on_depth = lambda depth, move: finished_depth.update(depth = depth))
+    except (ValueError, KeyError, TypeError) as error: # TypeError is int(None), from a short CSV row or a null field.
+        return {"error": f"{type(error).__name__}: {error}"}
+    
+    if result == None: return {"error": "No depth was searched"}
+    
+    return {"best_move": None if result.move_type == None else result.move_type.name,
+            "evaluation": float(result.evaluation),
+            "path": convert_move_list(result.path),
+            "depth": finished_depth["depth"],
+            "nodes": batch_engine.positions_searched - start_nodes,
+            "seconds": time.perf_counter() - start_time}
+
+def analyse_batch(positions, output, max_depth: int, time_limit: float | None = None, node_limit: int | None = None,
+                  workers: int | None = None, arithmetic: str = "float", tablebase_path: str | None = None):
+    """
+    Searches every position in `positions` over a process pool, writing each result to `output` as a JSON line as soon as
+    it finishes, so results come out of order. Each line has the position's number in the input (from 1), and its "id" field if it had one.
+    Only a couple of positions per worker are submitted at once, so huge inputs are streamed rather than read up front.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    in_flight = {}
+    
+    def write_finished(futures):
+        for future in futures:
+            line_number, position_id = in_flight.pop(future)
+            result = {"line": line_number}
+            if position_id != None: result["id"] = position_id
+            result.update(future.result())
+            
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    
+    with ProcessPoolExecutor(workers, initializer = start_batch_worker, initargs = (arithmetic, tablebase_path)) as process_pool:
+        for line_number, fields in enumerate(positions, 1):
+            if isinstance(fields, Exception):
+                output.write(json.dumps({"line": line_number, "error": f"{type(fields).__name__}: {fields}"}) + "\n")
+                output.flush()
+                continue
+            
+            if len(in_flight) >= max_in_flight:
+                finished, _ = wait(in_flight, return_when = FIRST_COMPLETED)
+                write_finished(finished)
+            
+            future = process_pool.submit(analyse_in_worker, fields, max_depth, time_limit, node_limit)
+            in_flight[future] = (line_number, fields.get("id"))
+        
+        while in_flight:
+            finished, _ = wait(in_flight, return_when = FIRST_COMPLETED)
+            write_finished(finished)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Analyses every position in a JSONL or CSV file, writing results as JSONL.")
+    parser.add_argument("input", nargs = "?", default = "-", help = "File of positions, or - for stdin. Defaults to stdin.")
+    parser.add_argument("-o", "--output", default = "-", help = "File to write results to, or - for stdout. Defaults to stdout.")
+    parser.add_argument("--format", choices = ["jsonl", "csv"], help = "Input format. Defaults to the input's extension, or jsonl.")
+    parser.add_argument("--depth", type = int, default = 18, help = "Deepest search to try, in shots. Defaults to 18.")
+    parser.add_argument("--time-limit", type = float, help = "Seconds to spend on each position.")
+    parser.add_argument("--node-limit", type = int, help = "Positions to search for each position.")
+    parser.add_argument("--workers", type = int, help = "Processes to search with. Defaults to every core.")
+    parser.add_argument("--arithmetic", choices = list(ARITHMETIC), default = "float", help = "Defaults to float.")
+    parser.add_argument("--tablebase", help = "Endgame tablebase file made by generate_tablebase.py.")
+    arguments = parser.parse_args()
+    
+    if arguments.depth < 1: parser.error("--depth must be at least 1")
+    
+    file_format = arguments.format or ("csv" if arguments.input.lower().endswith(".csv") else "jsonl")
+    input_file = sys.stdin if arguments.input == "-" else open(arguments.input, newline = "")
+    output_file = sys.stdout if arguments.output == "-" else open(arguments.output, "w")
+    
+    try:
+        analyse_batch(read_positions(input_file, file_format), output_file,
+                      arguments.depth, arguments.time_limit, arguments.node_limit,
+                      arguments.workers, arguments.arithmetic, arguments.tablebase)
+    finally:
+        if input_file != sys.stdin: input_file.close()
+        if output_file != sys.stdout: output_file.close()
\ No newline at end of file
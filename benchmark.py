@@ -0,0 +1,154 @@
+from backshot import *
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+
+# (name, position, depth), roughly from cheapest to most expensive.
+# Keep names stable, comparisons match results up by name.
+CORPUS = [
+    ("trivial",
+     PackedPosition.from_fields(True, 2, 2, 2, 1, 0, [], []),
+     4),
+    ("known_live",
+     PackedPosition.from_fields(True, 3, 2, 3, 2, 2, [Items.CIGARETTES], [Items.HAND_SAW], ["live"]),
+     4),
+    ("two_shells_medicine",
+     PackedPosition.from_fields(True, 4, 2, 2, 1, 1, [Items.EXPIRED_MEDICINE, Items.BEER], [Items.EXPIRED_MEDICINE, Items.CIGARETTES]),
+     2),
+    ("dealer_to_move",
+     PackedPosition.from_fields(False, 4, 3, 2, 2, 3, [Items.HANDCUFFS, Items.BEER, Items.MAGNIFYING_GLASS], [Items.HAND_SAW, Items.CIGARETTES]),
+     6),
+    ("handcuffed_sawed",
+     PackedPosition.from_fields(True, 3, 3, 2, 3, 2, [Items.BEER], [Items.BEER, Items.INVERTER], [], 2, True),
+     5),
+    ("phone_and_adrenaline",
+     PackedPosition.from_fields(True, 4, 4, 3, 3, 3, [Items.ADRENALINE, Items.BURNER_PHONE], [Items.BURNER_PHONE, Items.ADRENALINE, Items.MAGNIFYING_GLASS]),
+     4),
+    ("mid_round",
+     PackedPosition.from_fields(True, 4, 3, 3, 3, 3, [Items.BURNER_PHONE, Items.EXPIRED_MEDICINE, Items.INVERTER], [Items.ADRENALINE, Items.HANDCUFFS, Items.BEER]),
+     4),
+    ("full_hands_8_shells",
+     PackedPosition.from_fields(True, 4, 4, 4, 4, 4,
+                                [Items.HANDCUFFS, Items.HAND_SAW, Items.CIGARETTES, Items.BEER, Items.MAGNIFYING_GLASS, Items.ADRENALINE, Items.INVERTER, Items.BURNER_PHONE],
+                                [Items.HANDCUFFS, Items.HAND_SAW, Items.CIGARETTES, Items.BEER, Items.MAGNIFYING_GLASS, Items.EXPIRED_MEDICINE, Items.INVERTER, Items.BURNER_PHONE]),
+     3),
+]
+
+# How much worse a result can be than the baseline before it counts as a regression.
+NODE_TOLERANCE = 0.05 # Node counts are deterministic, so anything more than noise is a real change.
+TIME_TOLERANCE = 0.20 # Timings are noisy.
+MEMORY_TOLERANCE = 0.10 # Peak memory barely changes between runs, but garbage collection moves it a little.
+MIN_TIMED_SECONDS = 0.5 # Anything quicker than this is all noise, so only its node count is compared.
+MIN_COMPARED_MEMORY = 1 << 16 # Same for memory, a few KiB either way is just the interpreter's bookkeeping.
+
+def benchmark_position(position: PackedPosition, depth: int, repeats: int = 1, measure_memory: bool = True) -> dict:
+    """
+    Searches `position` to `depth` on a fresh engine, iterating depth 1, 2, ... like `start.py` does.
+    Timings are the best of `repeats` runs. Peak memory is measured on a separate run, since tracemalloc slows searching down.
+    It's only what the search allocates, the transposition table is allocated up front and would swamp everything else,
+    so its size is reported on its own.
+    """
+    best_times = None
+    
+    for _ in range(repeats):
+        engine = BackshotRoulette()
+        start_time = time.perf_counter()
+        times = []
+        result = engine.iterative_search(position, depth, on_depth = lambda depth, move: times.append(time.perf_counter() - start_time))
+        
+        if best_times == None or times[-1] < best_times[-1]: best_times = times
+        nodes = engine.positions_searched
+    
+    peak_memory = table_memory = None
+    if measure_memory:
+        engine = BackshotRoulette()
+        table_memory = engine.transposition_table.size_in_bytes
+        
+        tracemalloc.start()
+        engine.iterative_search(position, depth)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    
+    return {"depth": depth,
+            "nodes": nodes,
+            "seconds": best_times[-1],
+            "nodes_per_second": nodes / max(best_times[-1], 1e-9),
+            "time_to_depth": best_times,
+            "peak_search_memory_bytes": peak_memory,
+            "transposition_table_bytes": table_memory,
+            "best_move": None if result.move_type == None else result.move_type.name,
+            "evaluation": float(result.evaluation)}
+
+def run_benchmarks(names: list[str] | None = None, repeats: int = 3, measure_memory: bool = True, on_result = None) -> dict:
+    results = {}
+    
+    for name, position, depth in CORPUS:
+        if names and name not in names: continue
+        
+        results[name] = benchmark_position(position, depth, repeats, measure_memory)
+        if on_result != None: on_result(name, results[name])
+    
+    return {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+
+def compare_benchmarks(baseline: dict, current: dict) -> list[str]:
+    """
+    Returns a description of every way `current` is worse than `baseline`. Different evaluations always count, since
+    the search should never change its answer by getting faster.
+    """
+    regressions = []
+    
+    for name, result in current["results"].items():
+        if name not in baseline["results"]: continue
+        old_result = baseline["results"][name]
+        
+        if old_result["depth"] != result["depth"]:
+            regressions += [f"{name}: searched to depth {result['depth']}, baseline was depth {old_result['depth']}, not comparable"]
+            continue
+        
+        if abs(old_result["evaluation"] - result["evaluation"]) > FLOAT_TOLERANCE:
+            regressions += [f"{name}: evaluation changed from {old_result['evaluation']} to {result['evaluation']}"]
+        if result["nodes"] > old_result["nodes"] * (1 + NODE_TOLERANCE):
+            regressions += [f"{name}: searched {result['nodes']} positions, baseline was {old_result['nodes']}"]
+        if old_result["seconds"] >= MIN_TIMED_SECONDS and result["seconds"] > old_result["seconds"] * (1 + TIME_TOLERANCE):
+            regressions += [f"{name}: took {result['seconds']:.3f} seconds, baseline was {old_result['seconds']:.3f}"]
+        
+        # Only compared when both runs measured it (older baselines counted the transposition table in).
+        old_memory, memory = old_result.get("peak_search_memory_bytes"), result.get("peak_search_memory_bytes")
+        if old_memory != None and memory != None and old_memory >= MIN_COMPARED_MEMORY and memory > old_memory * (1 + MEMORY_TOLERANCE):
+            regressions += [f"{name}: peaked at {memory} bytes searching, baseline was {old_memory}"]
+    
+    return regressions
+
+def print_result(name: str, result: dict):
+    memory = "" if result["peak_search_memory_bytes"] == None else f", {result['peak_search_memory_bytes'] / 2 ** 10:.0f} KiB peak searching"
+    print(f"{name} (depth {result['depth']}): {result['nodes']} positions in {result['seconds']:.3f} seconds, "
+          f"{result['nodes_per_second']:.0f} positions/s{memory}, {result['best_move']} {result['evaluation'] * 100:.2f}%", file = sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Searches a fixed set of positions and reports how fast the engine is.")
+    parser.add_argument("-o", "--output", help = "File to write the results to as JSON.")
+    parser.add_argument("--compare", help = "Baseline JSON from an earlier run. Exits with 1 if anything regressed.")
+    parser.add_argument("--positions", nargs = "+", help = f"Only run these positions: {', '.join(name for name, _, _ in CORPUS)}.")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Runs per position, keeping the fastest. Defaults to 3.")
+    parser.add_argument("--no-memory", action = "store_true", help = "Skip measuring peak memory, which searches everything twice.")
+    arguments = parser.parse_args()
+    
+    current = run_benchmarks(arguments.positions, arguments.repeat, not arguments.no_memory, print_result)
+    
+    if arguments.output != None:
+        with open(arguments.output, "w") as file:
+            json.dump(current, file, indent = 4)
+    else:
+        print(json.dumps(current, indent = 4))
+    
+    if arguments.compare != None:
+        with open(arguments.compare) as file:
+            regressions = compare_benchmarks(json.load(file), current)
+        
+        for regression in regressions:
+            print("REGRESSION", regression, file = sys.stderr)
+        
+        if regressions: sys.exit(1)
+        print("No regressions.", file = sys.stderr)
\ No newline at end of file
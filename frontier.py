@@ -0,0 +1,522 @@
+from backshot import *
+import numpy as np
+
+# Column indices into the (rows, 2) health and (rows, 2, len(Items)) items arrays. These match the turn bit, so
+# `health[rows, turn]` is whoever's turn it is.
+DEALER = 0
+PLAYER = 1
+
+MOVE_COUNT = len(ValidMoves)
+
+class Frontier:
+    """
+    A set of positions stored as NumPy columns (struct of arrays), one row per position, so a move can be played on
+    every row at once.
+    
+    Every column is a small integer like in a PackedPosition key, except that the known shells are an (rows, 8) array
+    of slot values (UNKNOWN_SHELL, LIVE_SHELL or BLANK_SHELL), and health and items are indexed by DEALER or PLAYER.
+    `depth` is how many more shots the search looks at from each row, like `move_depth` in `BackshotRoulette.search`.
+    """
+    COLUMNS = ("turn", "max_health", "health", "live", "blank", "handcuffed", "sawed", "adrenaline", "inverter", "shells", "items", "depth")
+    
+    def __init__(self, **columns):
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+    
+    @classmethod
+    def from_positions(cls, positions: list[PackedPosition], depth: int) -> "Frontier":
+        rows = len(positions)
+        columns = {name: np.zeros(rows, np.int8) for name in cls.COLUMNS}
+        columns["health"] = np.zeros((rows, 2), np.int8)
+        columns["shells"] = np.zeros((rows, 8), np.int8)
+        columns["items"] = np.zeros((rows, 2, len(Items)), np.int8)
+        
+        for row, position in enumerate(positions):
+            key = position.key
+            columns["turn"][row] = key & 1
+            columns["max_health"][row] = position.max_health
+            columns["health"][row] = position.dealer_health, position.player_health
+            columns["live"][row] = position.unknown_live_shells
+            columns["blank"][row] = position.unknown_blank_shells
+            columns["handcuffed"][row] = position.handcuffed
+            columns["sawed"][row] = position.gun_is_sawed
+            columns["adrenaline"][row] = position.on_adrenaline
+            columns["inverter"][row] = position.inverter_on
+            columns["shells"][row] = [(key >> (SHELLS_OFFSET + 2 * index)) & 0b11 for index in range(8)]
+            columns["items"][row, DEALER] = [position.count_item(item, False) for item in Items]
+            columns["items"][row, PLAYER] = [position.count_item(item, True) for item in Items]
+            columns["depth"][row] = min(depth, position.unknown_live_shells + position.unknown_blank_shells)
+        
+        return cls(**columns)
+    
+    def __len__(self):
+        return len(self.turn)
+    
+    def take(self, rows) -> "Frontier":
+        return Frontier(**{name: getattr(self, name)[rows] for name in self.COLUMNS})
+    
+    @classmethod
+    def concatenate(cls, frontiers: list["Frontier"]) -> "Frontier":
+        return cls(**{name: np.concatenate([getattr(frontier, name) for frontier in frontiers]) for name in cls.COLUMNS})
+    
+    def packed_keys(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Packs every row into two uint64s, equal only for equal rows. Every column fits in 4 bits or less, since depths
+        are kept to at most the shells left.
+        """
+        fields = [(self.turn, 1), (self.max_health, 3), (self.health[:, DEALER], 3), (self.health[:, PLAYER], 3),
+                  (self.live, 4), (self.blank, 4), (self.handcuffed, 2), (self.sawed, 1), (self.adrenaline, 1),
+                  (self.inverter, 1), (self.depth, 4)]
+        fields += [(self.shells[:, index], 2) for index in range(8)]
+        fields += [(counts, 4) for counts in self.items.reshape(len(self), -1).T]
+        
+        words, word, bits = [], np.zeros(len(self), np.uint64), 0
+        for column, width in fields:
+            if bits + width > 64:
+                words += [word]
+                word, bits = np.zeros(len(self), np.uint64), 0
+            word |= column.astype(np.uint64) << np.uint64(bits)
+            bits += width
+        
+        return words[0], word
+    
+    def unique(self) -> tuple["Frontier", np.ndarray]:
+        """
+        Merges rows holding the same position (at the same depth), returning the merged frontier and which of its rows
+        each old row became.
+        """
+        # Every shot uses up a shell, so searching deeper than the shells left is the same as searching to the end.
+        np.minimum(self.depth, self.live + self.blank, out = self.depth)
+        
+        high, low = self.packed_keys()
+        order = np.lexsort((low, high))
+        high, low = high[order], low[order]
+        
+        starts = np.ones(len(self), bool)
+        starts[1:] = (high[1:] != high[:-1]) | (low[1:] != low[:-1])
+        inverse = np.empty(len(self), np.int64)
+        inverse[order] = np.cumsum(starts) - 1
+        
+        return self.take(order[starts]), inverse
+    
+    def to_position(self, row: int) -> PackedPosition:
+        shells = [{LIVE_SHELL: "live", BLANK_SHELL: "blank"}.get(int(slot)) for slot in self.shells[row]]
+        items = [[item for item in Items for _ in range(int(self.items[row, side, item.value]))] for side in (DEALER, PLAYER)]
+        
+        return PackedPosition.from_fields(bool(self.turn[row]),
+                                          int(self.max_health[row]), int(self.health[row, DEALER]), int(self.health[row, PLAYER]),
+                                          int(self.live[row]), int(self.blank[row]),
+                                          items[DEALER], items[PLAYER],
+                                          shells, int(self.handcuffed[row]),
+                                          bool(self.sawed[row]), bool(self.adrenaline[row]), bool(self.inverter[row]))
+    
+    # Everything below works on every row at once, the same way the helpers in roulette.py work on one key.
+    
+    def rows(self) -> np.ndarray:
+        return np.arange(len(self))
+    
+    def current_items(self) -> np.ndarray:
+        # Adrenaline steals from the other player.
+        return self.items[self.rows(), self.turn ^ self.adrenaline]
+    
+    def current_shell(self) -> np.ndarray:
+        """
+        Returns the chambered shell as it would be fired (flipped by the inverter), like `PackedPosition.get_current_shell`.
+        """
+        shell = self.shells[:, 0]
+        flipped = (self.inverter == 1) & (shell != UNKNOWN_SHELL)
+        return np.where(flipped, LIVE_SHELL + BLANK_SHELL - shell, shell)
+    
+    def unknown_counts(self) -> tuple[np.ndarray, np.ndarray]:
+        unknown_live = self.live - (self.shells == LIVE_SHELL).sum(axis = 1)
+        unknown_blank = self.blank - (self.shells == BLANK_SHELL).sum(axis = 1)
+        return unknown_live, unknown_blank
+    
+    def loaded_live_chance(self, index) -> np.ndarray:
+        """
+        Returns the chance the shell at `index` (one per row, or the same for every row) was loaded live. Ignores the inverter.
+        """
+        slot = self.shells[self.rows(), index]
+        unknown_live, unknown_blank = self.unknown_counts()
+        unknown_chance = unknown_live / np.maximum(1, unknown_live + unknown_blank)
+        return np.where(slot == LIVE_SHELL, 1.0, np.where(slot == BLANK_SHELL, 0.0, unknown_chance))
+    
+    def use_item(self, item: Items):
+        self.items[self.rows(), self.turn ^ self.adrenaline, item.value] -= 1
+        self.adrenaline[:] = 0
+    
+    def fill_implied_shells(self):
+        unknown_live, unknown_blank = self.unknown_counts()
+        one_type = (unknown_live == 0) != (unknown_blank == 0)
+        in_gun = np.arange(8) < (self.live + self.blank)[:, None]
+        fill = one_type[:, None] & in_gun & (self.shells == UNKNOWN_SHELL)
+        self.shells[fill] = np.broadcast_to(np.where(unknown_live > 0, LIVE_SHELL, BLANK_SHELL)[:, None], fill.shape)[fill]
+    
+    def rack_shell(self, shell: np.ndarray):
+        self.live -= shell == LIVE_SHELL
+        self.blank -= shell == BLANK_SHELL
+        self.shells[:, :-1] = self.shells[:, 1:].copy()
+        self.shells[:, -1] = UNKNOWN_SHELL
+        self.inverter[:] = 0
+        self.fill_implied_shells()
+    
+    def reveal_shell(self, index, shell: np.ndarray):
+        self.shells[self.rows(), index] = shell
+        self.fill_implied_shells()
+    
+    def change_health(self, amount, side: np.ndarray):
+        rows = self.rows()
+        self.health[rows, side] = np.clip(self.health[rows, side] + amount, 0, self.max_health)
+    
+    def end_turn(self, rows: np.ndarray):
+        """
+        Passes the turn on in `rows` (a boolean mask), unless the other player is handcuffed.
+        """
+        skipped = rows & (self.handcuffed == 2)
+        passed = rows & ~skipped
+        self.handcuffed[skipped] = 1
+        self.handcuffed[passed & (self.handcuffed == 1)] = 0
+        self.turn[passed] ^= 1
+    
+    def legal_moves(self) -> np.ndarray:
+        """
+        Returns an (rows, len(ValidMoves)) mask of the legal moves, see `_list_legal_moves`.
+        """
+        held = self.current_items() > 0
+        on_adrenaline = self.adrenaline == 1
+        legal = np.zeros((len(self), MOVE_COUNT), bool)
+        
+        legal[:, ValidMoves.USE_ADRENALINE.value] = held[:, Items.ADRENALINE.value] & ~on_adrenaline
+        legal[:, ValidMoves.USE_BEER.value] = held[:, Items.BEER.value]
+        legal[:, ValidMoves.USE_BURNER_PHONE.value] = held[:, Items.BURNER_PHONE.value]
+        legal[:, ValidMoves.USE_CIGARETTES.value] = held[:, Items.CIGARETTES.value]
+        legal[:, ValidMoves.USE_EXPIRED_MEDICINE.value] = held[:, Items.EXPIRED_MEDICINE.value]
+        legal[:, ValidMoves.USE_HANDCUFFS.value] = held[:, Items.HANDCUFFS.value] & (self.handcuffed == 0)
+        legal[:, ValidMoves.USE_HAND_SAW.value] = held[:, Items.HAND_SAW.value] & (self.sawed == 0)
+        legal[:, ValidMoves.USE_INVERTER.value] = held[:, Items.INVERTER.value] & (self.inverter == 0)
+        legal[:, ValidMoves.USE_MAGNIFYING_GLASS.value] = held[:, Items.MAGNIFYING_GLASS.value]
+        
+        # Adrenaline wears off if there's nothing left to steal.
+        can_shoot = ~on_adrenaline | ~legal.any(axis = 1)
+        legal[:, ValidMoves.SHOOT_DEALER.value] = can_shoot
+        legal[:, ValidMoves.SHOOT_PLAYER.value] = can_shoot
+        
+        return legal
+    
+    def redundant_moves(self) -> np.ndarray:
+        """
+        Returns an (rows, len(ValidMoves)) mask of the moves `is_redundant_move` skips.
+        """
+        rows = self.rows()
+        players_turn = self.turn == 1
+        shell = self.current_shell()
+        known_live, known_blank, unknown_shell = shell == LIVE_SHELL, shell == BLANK_SHELL, shell == UNKNOWN_SHELL
+        sawed = self.sawed == 1
+        one_type_left = (self.live == 0) | (self.blank == 0)
+        other_health = self.health[rows, 1 - self.turn]
+        current_health = self.health[rows, self.turn]
+        redundant = np.zeros((len(self), MOVE_COUNT), bool)
+        
+        redundant[:, ValidMoves.SHOOT_DEALER.value] = (~players_turn & sawed) | (players_turn & known_blank) | (~players_turn & known_live)
+        redundant[:, ValidMoves.SHOOT_PLAYER.value] = (players_turn & sawed) | (~players_turn & known_blank) | (players_turn & known_live)
+        redundant[:, ValidMoves.USE_BEER.value] = ~unknown_shell | one_type_left
+        redundant[:, ValidMoves.USE_CIGARETTES.value] = other_health == self.max_health
+        redundant[:, ValidMoves.USE_HAND_SAW.value] = (self.live == 0) | (other_health == 1)
+        redundant[:, ValidMoves.USE_HANDCUFFS.value] = self.handcuffed > 0
+        redundant[:, ValidMoves.USE_MAGNIFYING_GLASS.value] = ~unknown_shell | one_type_left
+        redundant[:, ValidMoves.USE_ADRENALINE.value] = self.items[rows, 1 - self.turn].sum(axis = 1) == 0
+        redundant[:, ValidMoves.USE_BURNER_PHONE.value] = ~unknown_shell | one_type_left
+        
+        has_cigarettes = (self.items[rows, self.turn, Items.CIGARETTES.value] > 0) & (current_health == self.max_health - 1)
+        redundant[:, ValidMoves.USE_EXPIRED_MEDICINE.value] = (current_health == self.max_health) | has_cigarettes
+        redundant[:, ValidMoves.USE_INVERTER.value] = known_live
+        
+        return redundant
+    
+    def obvious_moves(self) -> np.ndarray:
+        """
+        Returns the move `obvious_move_exists` would force in every row, as a `ValidMoves` value, or -1 if there isn't one.
+        """
+        rows = self.rows()
+        players_turn = self.turn == 1
+        shell = self.current_shell()
+        own_items = self.items[rows, self.turn]
+        has = lambda item: own_items[:, item.value] > 0
+        
+        shoot_other = np.where(players_turn, ValidMoves.SHOOT_DEALER.value, ValidMoves.SHOOT_PLAYER.value)
+        shoot_self = np.where(players_turn, ValidMoves.SHOOT_PLAYER.value, ValidMoves.SHOOT_DEALER.value)
+        
+        # Same checks in the same order as obvious_move_exists, including it always checking the dealer's health.
+        is_definitely_live = (shell == LIVE_SHELL) | (self.blank == 0)
+        use_hand_saw = (self.health[:, DEALER] >= 2) & (self.sawed == 0) & has(Items.HAND_SAW)
+        is_definitely_blank = (shell == BLANK_SHELL) | (self.live == 0)
+        use_glass = has(Items.MAGNIFYING_GLASS) & (shell == UNKNOWN_SHELL) & (self.live > 0) & (self.blank > 0)
+        use_cigarettes = has(Items.CIGARETTES) & (self.health[rows, self.turn] != self.max_health)
+        use_handcuffs = has(Items.HANDCUFFS) & (self.blank <= 1)
+        
+        obvious = np.select([self.adrenaline == 1,
+                             is_definitely_live & use_hand_saw,
+                             is_definitely_live,
+                             is_definitely_blank,
+                             use_glass,
+                             use_cigarettes,
+                             use_handcuffs],
+                            [-1,
+                             ValidMoves.USE_HAND_SAW.value,
+                             shoot_other,
+                             shoot_self,
+                             ValidMoves.USE_MAGNIFYING_GLASS.value,
+                             ValidMoves.USE_CIGARETTES.value,
+                             ValidMoves.USE_HANDCUFFS.value],
+                            -1)
+        return obvious
+    
+    def search_moves(self) -> np.ndarray:
+        """
+        Returns an (rows, len(ValidMoves)) mask of the moves `BackshotRoulette.get_search_moves` would search.
+        """
+        legal = self.legal_moves()
+        obvious = self.obvious_moves()
+        
+        moves = legal & ~self.redundant_moves()
+        moves[~moves.any(axis = 1)] = legal[~moves.any(axis = 1)]
+        
+        rows = self.rows()
+        forced = (obvious >= 0) & legal[rows, np.maximum(obvious, 0)]
+        moves[forced] = False
+        moves[rows[forced], obvious[forced]] = True
+        
+        return moves
+    
+    def outcomes(self, move: ValidMoves) -> tuple["Frontier", np.ndarray, np.ndarray]:
+        """
+        Plays `move` in every row, returning `(outcomes, parents, chances)`: a frontier with a row for every outcome,
+        which row each one came from, and its chance. Outcomes that can't happen are left out.
+        """
+        rows = self.rows()
+        certain = np.ones(len(self))
+        
+        match move:
+            case ValidMoves.SHOOT_DEALER | ValidMoves.SHOOT_PLAYER:
+                target = DEALER if move == ValidMoves.SHOOT_DEALER else PLAYER
+                outcomes, parents, chances, shell = self.split_on_shell(0)
+                
+                damage = np.where(outcomes.sawed == 1, 2, 1)
+                is_live = (shell == LIVE_SHELL) != (outcomes.inverter == 1)
+                shooting_self = outcomes.turn == target
+                
+                outcomes.rack_shell(shell)
+                outcomes.sawed[:] = 0
+                outcomes.adrenaline[:] = 0
+                outcomes.change_health(np.where(is_live, -damage, 0), np.full(len(outcomes), target))
+                
+                # Only shooting yourself with a blank keeps your turn.
+                outcomes.end_turn(is_live | ~shooting_self)
+                outcomes.depth -= 1
+                return outcomes, parents, chances
+            
+            case ValidMoves.USE_BEER:
+                outcomes, parents, chances, shell = self.split_on_shell(0)
+                outcomes.use_item(Items.BEER)
+                outcomes.rack_shell(shell)
+                return outcomes, parents, chances
+            
+            case ValidMoves.USE_MAGNIFYING_GLASS:
+                outcomes, parents, chances, shell = self.split_on_shell(0)
+                outcomes.use_item(Items.MAGNIFYING_GLASS)
+                outcomes.reveal_shell(0, shell)
+                return outcomes, parents, chances
+            
+            case ValidMoves.USE_EXPIRED_MEDICINE:
+                # 40% chance to heal 2 charges, 60% chance to lose 1.
+                outcomes = Frontier.concatenate([self, self])
+                outcomes.use_item(Items.EXPIRED_MEDICINE)
+                outcomes.change_health(np.repeat([2, -1], len(self)), outcomes.turn)
+                return outcomes, np.concatenate([rows, rows]), np.repeat([2 / 5, 3 / 5], len(self))
+            
+            case ValidMoves.USE_BURNER_PHONE:
+                # The phone never tells you about the chambered shell, and does nothing if that's the last one.
+                total_shells = self.live + self.blank
+                frontiers, all_parents, all_chances = [], [], []
+                
+                nothing_to_reveal = total_shells <= 1
+                frontiers += [self.take(nothing_to_reveal)]
+                all_parents += [rows[nothing_to_reveal]]
+                all_chances += [certain[nothing_to_reveal]]
+                
+                for index in range(1, 8):
+                    revealing = rows[index < total_shells]
+                    if not len(revealing): break
+                    
+                    outcomes, parents, chances, shell = self.take(revealing).split_on_shell(index)
+                    outcomes.reveal_shell(index, shell)
+                    frontiers += [outcomes]
+                    all_parents += [revealing[parents]]
+                    all_chances += [chances / (total_shells[revealing[parents]] - 1)]
+                
+                outcomes = Frontier.concatenate(frontiers)
+                outcomes.use_item(Items.BURNER_PHONE)
+                return outcomes, np.concatenate(all_parents), np.concatenate(all_chances)
+        
+        outcomes = self.take(rows)
+        
+        match move:
+            case ValidMoves.USE_CIGARETTES:
+                outcomes.use_item(Items.CIGARETTES)
+                outcomes.change_health(1, outcomes.turn)
+            case ValidMoves.USE_HANDCUFFS:
+                outcomes.use_item(Items.HANDCUFFS)
+                outcomes.handcuffed[:] = 2
+            case ValidMoves.USE_HAND_SAW:
+                outcomes.use_item(Items.HAND_SAW)
+                outcomes.sawed[:] = 1
+            case ValidMoves.USE_ADRENALINE:
+                outcomes.use_item(Items.ADRENALINE)
+                outcomes.adrenaline[:] = 1
+            case ValidMoves.USE_INVERTER:
+                outcomes.use_item(Items.INVERTER)
+                outcomes.inverter[:] = 1
+        
+        return outcomes, rows, certain
+    
+    def split_on_shell(self, index: int) -> tuple["Frontier", np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Copies every row once for each way the shell at `index` could have been loaded, returning
+        `(outcomes, parents, chances, shells)`, like `PackedPosition.loaded_outcomes`.
+        """
+        rows = self.rows()
+        live_chance = self.loaded_live_chance(index)
+        could_be_live = live_chance > 0
+        could_be_blank = live_chance < 1
+        
+        parents = np.concatenate([rows[could_be_live], rows[could_be_blank]])
+        chances = np.concatenate([live_chance[could_be_live], 1 - live_chance[could_be_blank]])
+        shells = np.repeat(np.array([LIVE_SHELL, BLANK_SHELL], np.int8), [could_be_live.sum(), could_be_blank.sum()])
+        
+        return self.take(parents), parents, chances, shells
+
+class FrontierSearch:
+    """
+    Searches a position breadth first over `Frontier`s, playing each move on a whole level of the tree at once with
+    NumPy, then backing the evaluations up a level at a time. Gives the same evaluations as `BackshotRoulette.search`
+    (using its move selection and leaf evaluation), but without alpha-beta pruning every position down to `move_depth`
+    is searched, so it's meant for exhaustive solves (`move_depth` at least the shells left) of positions that fit in memory.
+    
+    Transpositions within a level are merged, so each position is only expanded once per level.
+    """
+    def __init__(self, engine: BackshotRoulette | None = None):
+        self.engine = engine or BackshotRoulette()
+        if self.engine.arithmetic != "float": raise ValueError("Frontier searches use NumPy floats, so they need an engine with float arithmetic.")
+        if not isinstance(self.engine.dealer_model, AdversarialDealer): raise ValueError("Frontier searches only search an adversarial dealer.")
+        
+        self.kill_probabilities = np.array(self.engine.kill_probabilities, float)
+        self.positions_searched = 0
+        self.level_sizes = []
+    
+    def evaluate_positions(self, frontier: Frontier) -> np.ndarray:
+        """
+        `BackshotRoulette.evaluate_position` for every row.
+        """
+        has_beer = frontier.current_items()[:, Items.BEER.value] > 0
+        index = (frontier.live.astype(np.int64) * (SHELL_COUNT_MASK + 1) + frontier.blank) * 4 + 2 * frontier.turn + has_beer
+        return self.kill_probabilities[index]
+    
+    def leaf_evaluations(self, frontier: Frontier) -> np.ndarray:
+        """
+        `BackshotRoulette.leaf_evaluation` for every row.
+        """
+        dealer_health = frontier.health[:, DEALER].astype(float)
+        player_health = frontier.health[:, PLAYER].astype(float)
+        
+        evaluation = (1 - self.evaluate_positions(frontier)) * player_health / np.maximum(1, dealer_health + player_health)
+        evaluation = np.where(dealer_health == 0, MAX_EVALUATION, evaluation)
+        return np.where(player_health == 0, MIN_EVALUATION, evaluation)
+    
+    def is_leaf(self, frontier: Frontier) -> np.ndarray:
+        return (frontier.depth == 0) | (frontier.health[:, PLAYER] == 0) | (frontier.health[:, DEALER] == 0) | (frontier.live == 0)
+    
+    def expand(self, frontier: Frontier) -> tuple[np.ndarray, Frontier, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Plays every searched move in every row that isn't a leaf.
+        
+        Returns:
+            tuple: `(moves, next_frontier, parents, move values, chances, children)`, where `moves` is the mask of
+                searched moves for every row, and the rest describe one edge each: the row it came from, the move played,
+                its chance and which row of `next_frontier` it leads to.
+        """
+        moves = frontier.search_moves()
+        moves[self.is_leaf(frontier)] = False
+        
+        outcomes, all_parents, all_moves, all_chances = [], [], [], []
+        for move in ValidMoves:
+            rows = np.flatnonzero(moves[:, move.value])
+            if not len(rows): continue
+            
+            move_outcomes, parents, chances = frontier.take(rows).outcomes(move)
+            outcomes += [move_outcomes]
+            all_parents += [rows[parents]]
+            all_moves += [np.full(len(parents), move.value)]
+            all_chances += [chances]
+        
+        if not outcomes: return moves, None, None, None, None, None
+        
+        next_frontier, children = Frontier.concatenate(outcomes).unique()
+        return moves, next_frontier, np.concatenate(all_parents), np.concatenate(all_moves), np.concatenate(all_chances), children
+    
+    def search(self, move_depth: int, state: PackedPosition | BuckshotRouletteMove) -> Move:
+        """
+        Searches `state` to `move_depth` shots, see the class docstring.
+        
+        Returns:
+            Move: The best move, the expected evaluation of `state`, and the line after it that's most likely to happen.
+        """
+        if isinstance(state, BuckshotRouletteMove): state = state.to_packed()
+        
+        frontier = Frontier.from_positions([state], move_depth)
+        levels = []
+        self.level_sizes = []
+        
+        # Expand a level at a time until there's nothing left that isn't a leaf.
+        while frontier != None:
+            self.positions_searched += len(frontier)
+            self.level_sizes += [len(frontier)]
+            
+            moves, next_frontier, parents, move_values, chances, children = self.expand(frontier)
+            levels += [(frontier, moves, parents, move_values, chances, children)]
+            frontier = next_frontier
+        
+        # Then back the evaluations up, from the deepest level (which is all leaves) to the root.
+        values = self.leaf_evaluations(levels[-1][0])
+        best_moves = [None] * (len(levels) - 1) + [np.full(len(values), -1)]
+        
+        for depth in reversed(range(len(levels) - 1)):
+            frontier, moves, parents, move_values, chances, children = levels[depth]
+            leaf_values = self.leaf_evaluations(frontier)
+            
+            move_evaluations = np.bincount(parents * MOVE_COUNT + move_values, chances * values[children], len(frontier) * MOVE_COUNT).reshape(-1, MOVE_COUNT)
+            players_turn = (frontier.turn == 1)[:, None]
+            scores = np.where(moves, np.where(players_turn, move_evaluations, -move_evaluations), -np.inf)
+            
+            best_moves[depth] = np.where(moves.any(axis = 1), scores.argmax(axis = 1), -1)
+            best_values = move_evaluations[np.arange(len(frontier)), np.maximum(best_moves[depth], 0)]
+            values = np.where(best_moves[depth] >= 0, best_values, leaf_values)
+        
+        if best_moves[0][0] < 0: return Move(None, float(values[0]))
+        return Move(ALL_MOVES[best_moves[0][0]], float(values[0]), self.principal_variation(levels, best_moves))
+    
+    def principal_variation(self, levels: list, best_moves: list[np.ndarray]) -> list[ValidMoves]:
+        """
+        Follows the best move from the root, and then its most likely outcome, until a leaf.
+        """
+        path = []
+        row = 0
+        
+        for depth, (frontier, moves, parents, move_values, chances, children) in enumerate(levels):
+            move = best_moves[depth][row]
+            if move < 0: break
+            path += [ALL_MOVES[move]]
+            
+            edges = np.flatnonzero((parents == row) & (move_values == move))
+            row = children[edges[chances[edges].argmax()]]
+        
+        return path
\ No newline at end of file
@@ -0,0 +1,20 @@
+from backshot import *
+import argparse
+import time
+
+parser = argparse.ArgumentParser(description = "Builds an endgame tablebase for BackshotRoulette to probe during search.")
+parser.add_argument("path", help = "File to write the tablebase to.")
+parser.add_argument("--shells", type = int, default = 2, help = "Most shells left in the gun. Defaults to 2.")
+parser.add_argument("--items", type = int, default = 0, help = "Most items in each hand. Defaults to 0.")
+parser.add_argument("--max-health", type = int, nargs = "+", default = [2, 3, 4], help = "Maximum healths to cover. Defaults to 2 3 4.")
+arguments = parser.parse_args()
+
+start_time = time.time()
+
+def print_progress(solved: int, total: int):
+    print(f"Solved {solved} / {total} positions in {time.time() - start_time:.1f} seconds.")
+
+tablebase = Tablebase.generate(BackshotRoulette(), arguments.shells, arguments.items, arguments.max_health, print_progress)
+tablebase.save(arguments.path)
+
+print(f"Wrote {tablebase.slot_count} slots to {arguments.path} in {time.time() - start_time:.1f} seconds.")
\ No newline at end of file
@@ -0,0 +1,253 @@
+from backshot import *
+from random import Random
+import math
+
+# How much UCT favours trying moves it hasn't tried much over moves that have done well so far.
+# Evaluations are between 0 and 1, so this is about sqrt(2) / 2.
+EXPLORATION = 0.7
+
+# The tree is thrown away once it has this many positions, rather than growing until it runs out of memory.
+MAX_TREE_SIZE = 1000000
+
+# estimate_nodes guesses how big a search would be from how much depth 1 and 2 grow. Positions estimated to need more
+# than this are given to MonteCarloSearch by choose_engine.
+MINIMAX_NODE_BUDGET = 200000
+
+# The most positions estimate_nodes searches to find out. Depth 1 alone can be tens of thousands of positions with
+# full hands of items, and anything that big at depth 2 is far over the budget anyway.
+PROBE_NODE_LIMIT = 5000
+
+# That many positions fit many times over in a table this size, so estimate_nodes doesn't allocate a full sized one every call.
+PROBE_TABLE_MIBIBYTES = 1
+
+class MonteCarloNode:
+    """
+    A position in a `MonteCarloSearch` tree, with statistics for each of its moves. Chance isn't stored as nodes,
+    each move keeps its outcomes and one of them is sampled every time the move is tried.
+    
+    Dealer turns played by the engine's dealer model have `move_weights`, the chance of each move, and a move is sampled
+    from those instead of picked with UCT.
+    """
+    __slots__ = ("position", "moves", "move_weights", "visits", "move_visits", "move_values", "move_outcomes")
+    
+    def __init__(self, position: PackedPosition, moves: list[ValidMoves], move_weights: list[float] | None = None):
+        self.position = position
+        self.moves = moves
+        self.move_weights = move_weights
+        self.visits = 0
+        self.move_visits = [0] * len(moves)
+        self.move_values = [0.0] * len(moves) # Sum of the evaluations backed up through each move.
+        self.move_outcomes = [None] * len(moves) # (cumulative chance, position) pairs, worked out when first tried.
+    
+    def mean_value(self, index: int) -> float:
+        return self.move_values[index] / self.move_visits[index] if self.move_visits[index] else 0.0
+    
+    def most_visited(self) -> int:
+        return max(range(len(self.moves)), key = lambda index: (self.move_visits[index], self.mean_value(index) if self.position.is_players_turn else -self.mean_value(index)))
+
+class MonteCarloSearch:
+    """
+    Monte Carlo tree search with UCT, for positions too big for `BackshotRoulette.search` to finish.
+    
+    Every iteration walks down the tree picking moves with UCT (the player maximising, the dealer minimising, unless the
+    engine has a dealer model, see `MonteCarloNode`) and
+    sampling one outcome of each, until it reaches a position it hasn't seen before or the end of the round, which is
+    evaluated with `BackshotRoulette.leaf_evaluation` and backed up the path. Searches can be stopped after any number
+    of iterations and still give a move.
+    
+    Positions are stored by key, so a search of a position that was reached in an earlier search (like the next move of
+    the same game) carries on from the statistics it already has.
+    """
+    def __init__(self, engine: BackshotRoulette | None = None, exploration: float = EXPLORATION, seed = None, max_tree_size: int = MAX_TREE_SIZE):
+        """
+        Args:
+            engine (BackshotRoulette | None, optional): Supplies move selection (`get_search_moves`) and leaf evaluations.
+                Defaults to None (a new float engine).
+            exploration (float, optional): The UCT exploration constant. Defaults to EXPLORATION.
+            seed (optional): Seed for sampling outcomes, for reproducible searches. Defaults to None.
+            max_tree_size (int, optional): Positions to keep before the tree is cleared. Defaults to MAX_TREE_SIZE.
+        """
+        self.engine = engine or BackshotRoulette()
+        self.exploration = exploration
+        self.random = Random(seed)
+        self.max_tree_size = max_tree_size
+        
+        self.nodes = {}
+        self.iterations = 0
+        self.stop_requested = False
+    
+    def get_node(self, position: PackedPosition) -> MonteCarloNode:
+        node = self.nodes.get(position.key)
+        
+        if node == None:
+            if len(self.nodes) >= self.max_tree_size: self.nodes.clear()
+            
+            dealer_moves = None if position.is_players_turn else self.engine.dealer_model.move_weights(position, self.engine.ratio)
+            if dealer_moves == None:
+                node = MonteCarloNode(position, self.engine.get_search_moves(position))
+            else:
+                node = MonteCarloNode(position, [move for move, _ in dealer_moves], [float(weight) for _, weight in dealer_moves])
+            
+            self.nodes[position.key] = node
+        
+        return node
+    
+    def is_terminal(self, position: PackedPosition) -> bool:
+        return 0 in [position.player_health, position.dealer_health, position.unknown_live_shells]
+    
+    def select_move(self, node: MonteCarloNode) -> int:
+        """
+        Returns the index of the move to try next, any move that hasn't been tried yet first.
+        """
+        if node.move_weights != None: return self.random.choices(range(len(node.moves)), node.move_weights)[0]
+        
+        log_visits = math.log(node.visits)
+        is_players_turn = node.position.is_players_turn
+        best_index, best_score = 0, -INF
+        
+        for index, visits in enumerate(node.move_visits):
+            if visits == 0: return index
+            
+            mean = node.move_values[index] / visits
+            score = (mean if is_players_turn else 1 - mean) + self.exploration * math.sqrt(log_visits / visits)
+            
+            if score > best_score:
+                best_index, best_score = index, score
+        
+        return best_index
+    
+    def sample_outcome(self, node: MonteCarloNode, index: int) -> PackedPosition:
+        outcomes = node.move_outcomes[index]
+        
+        if outcomes == None:
+            outcomes, total = [], 0
+            for chance, position in node.position.outcomes(node.moves[index], self.engine.ratio):
+                total += chance
+                outcomes += [(total, position)]
+            node.move_outcomes[index] = outcomes
+        
+        roll = self.random.random() * outcomes[-1][0]
+        for cumulative_chance, position in outcomes:
+            if roll < cumulative_chance: return position
+        
+        return outcomes[-1][1]
+    
+    def iterate(self, root: MonteCarloNode):
+        path = []
+        node = root
+        
+        while not self.is_terminal(node.position) and node.visits > 0:
+            index = self.select_move(node)
+            path += [(node, index)]
+            node = self.get_node(self.sample_outcome(node, index))
+        
+        value = float(self.engine.leaf_evaluation(node.position))
+        node.visits += 1
+        
+        for parent, index in path:
+            parent.visits += 1
+            parent.move_visits[index] += 1
+            parent.move_values[index] += value
+        
+        self.iterations += 1
+    
+    def principal_variation(self, node: MonteCarloNode, max_length: int = 32) -> list[ValidMoves]:
+        """
+        Follows the most visited move and its most likely outcome for as long as they've been tried.
+        """
+        path = []
+        
+        while len(path) < max_length and node.visits > 1 and not self.is_terminal(node.position):
+            index = node.most_visited()
+            if node.move_visits[index] == 0 or node.move_outcomes[index] == None: break
+            path += [node.moves[index]]
+            
+            outcomes = node.move_outcomes[index]
+            chances = [cumulative - previous for (cumulative, _), previous in zip(outcomes, [0] + [cumulative for cumulative, _ in outcomes])]
+            next_position = outcomes[max(range(len(outcomes)), key = chances.__getitem__)][1]
+            if next_position.key not in self.nodes: break
+            node = self.nodes[next_position.key]
+        
+        return path
+    
+    def search(self, state: PackedPosition | BuckshotRouletteMove, iterations: int | None = None, time_limit: float | None = None, on_progress = None) -> Move:
+        """
+        Searches `state` until `iterations` more iterations or `time_limit` seconds are up, whichever comes first,
+        or until `stop` is called. At least one of them should be given, and at least one iteration always runs.
+        
+        Args:
+            state (PackedPosition | BuckshotRouletteMove): The position to search.
+            iterations (int | None, optional): Iterations to run. Defaults to None (no limit).
+            time_limit (float | None, optional): Seconds to search for. Defaults to None (no limit).
+            on_progress (optional): Called with `(iterations run, current best move)` every 1000 iterations.
+        
+        Returns:
+            Move: The most visited move, its average evaluation and the most likely line after it.
+        """
+        if isinstance(state, BuckshotRouletteMove): state = state.to_packed()
+        
+        if self.is_terminal(state): return Move(None, self.engine.leaf_evaluation(state))
+        
+        root = self.get_node(state)
+        deadline = None if time_limit == None else time.perf_counter() + time_limit
+        run = 0
+        
+        while True:
+            self.iterate(root)
+            run += 1
+            
+            if self.stop_requested: break
+            if iterations != None and run >= iterations: break
+            if deadline != None and run % 16 == 0 and time.perf_counter() >= deadline: break
+            if on_progress != None and run % 1000 == 0: on_progress(run, self.best_move(root))
+        
+        # Only cleared once the search is over, like BackshotRoulette.iterative_search, so an early stop isn't lost.
+        self.stop_requested = False
+        return self.best_move(root)
+    
+    def best_move(self, root: MonteCarloNode) -> Move:
+        index = root.most_visited()
+        return Move(root.moves[index], root.mean_value(index), self.principal_variation(root))
+    
+    def stop(self):
+        """
+        Stops the current search after the iteration it's on (or the next search after its first, if none is running),
+        from any thread.
+        """
+        self.stop_requested = True
+    
+    def clear(self):
+        self.nodes.clear()
+
+def estimate_nodes(position: PackedPosition | BuckshotRouletteMove, max_depth: int, engine: BackshotRoulette | None = None, node_limit: int = PROBE_NODE_LIMIT) -> float:
+    """
+    Guesses how many positions `BackshotRoulette.iterative_search` would need to search `position` to `max_depth`, by
+    searching depths 1 and 2 and assuming every depth after grows by the same factor. Depths past the shells left
+    cost nothing extra, since every shot uses one up.
+    
+    The probe search stops after `node_limit` positions, and if it hadn't finished by then the estimate is infinite.
+    Without an `engine`, it searches with a new one with a PROBE_TABLE_MIBIBYTES table.
+    """
+    if isinstance(position, BuckshotRouletteMove): position = position.to_packed()
+    
+    engine = engine or BackshotRoulette(table_mibibytes = PROBE_TABLE_MIBIBYTES)
+    max_depth = max(1, min(max_depth, position.unknown_live_shells + position.unknown_blank_shells))
+    start_nodes = engine.positions_searched
+    depth_nodes = []
+    engine.iterative_search(position, min(max_depth, 2), node_limit = node_limit,
+                            on_depth = lambda depth, move: depth_nodes.append(engine.positions_searched - start_nodes))
+    
+    if len(depth_nodes) < min(max_depth, 2): return math.inf
+    if max_depth <= 2: return depth_nodes[-1]
+    
+    # Nodes at depth 2 include the ones searched for depth 1 again.
+    growth = max(1.0, (depth_nodes[1] - depth_nodes[0]) / max(1, depth_nodes[0]))
+    return depth_nodes[1] + (depth_nodes[1] - depth_nodes[0]) * sum(growth ** depth for depth in range(1, max_depth - 1))
+
+def choose_engine(position: PackedPosition | BuckshotRouletteMove, max_depth: int, node_budget: int = MINIMAX_NODE_BUDGET) -> str:
+    """
+    Returns "minimax" if `BackshotRoulette.search` should finish `max_depth` within about `node_budget` positions,
+    or "mcts" if it's better to give the position to `MonteCarloSearch`. Deciding searches at most `PROBE_NODE_LIMIT`
+    positions (or `node_budget`, if that's fewer).
+    """
+    return "minimax" if estimate_nodes(position, max_depth, node_limit = min(node_budget, PROBE_NODE_LIMIT)) <= node_budget else "mcts"
\ No newline at end of file
@@ -1,7 +1,7 @@
 from enum import *
 from fractions import Fraction
-from copy import deepcopy
 from typing import Literal
+from random import Random
 
 INF = 1000000
 
@@ -62,262 +62,725 @@ class LoadedShells:
 class InvalidMoveError(Exception):
     pass
 
-class BuckshotRouletteMove:
-    def __init__(self, 
-                 is_players_turn: bool, 
-                 max_health: int, 
-                 dealer_health: int, 
-                 player_health: int, 
-                 unknown_live_shells: int, 
-                 unknown_blank_shells: int, 
-                 dealer_items: list, 
-                 player_items: list
-                 ):
+# Bit layout of a PackedPosition key, least significant bit first.
+#
+#  field           | offset | bits | notes
+# -----------------+--------+------+-------------------------------------------
+#  is_players_turn |      0 |    1 |
+#  max_health      |      1 |    3 |
+#  dealer_health   |      4 |    3 |
+#  player_health   |      7 |    3 |
+#  live shells     |     10 |    4 | every live shell left in the gun
+#  blank shells    |     14 |    4 | every blank shell left in the gun
+#  handcuffed      |     18 |    2 | same meaning as BuckshotRouletteMove.handcuffed
+#  gun_is_sawed    |     20 |    1 |
+#  on_adrenaline   |     21 |    1 |
+#  inverter_on     |     22 |    1 | the chambered shell has been inverted
+#  known shells    |     23 |   16 | 2 bits per slot, see UNKNOWN_SHELL etc.
+#  dealer items    |     39 |   36 | 4 bit count per Items value
+#  player items    |     75 |   36 | 4 bit count per Items value
+# -----------------+--------+------+-------------------------------------------
+
+TURN_OFFSET = 0
+MAX_HEALTH_OFFSET = 1
+DEALER_HEALTH_OFFSET = 4
+PLAYER_HEALTH_OFFSET = 7
+LIVE_OFFSET = 10
+BLANK_OFFSET = 14
+HANDCUFFED_OFFSET = 18
+SAWED_OFFSET = 20
+ADRENALINE_OFFSET = 21
+INVERTER_OFFSET = 22
+SHELLS_OFFSET = 23
+DEALER_ITEMS_OFFSET = 39
+PLAYER_ITEMS_OFFSET = 75
+
+HEALTH_MASK = 0b111
+SHELL_COUNT_MASK = 0b1111
+HANDCUFFED_MASK = 0b11
+SHELLS_MASK = 0xFFFF
+ITEM_COUNT_MASK = 0b1111
+INVENTORY_MASK = (1 << 36) - 1
+
+UNKNOWN_SHELL = 0
+LIVE_SHELL = 1
+BLANK_SHELL = 2
+
+LIVE_SLOTS_MASK = 0x5555 # The low bit of every known shell slot
+BLANK_SLOTS_MASK = 0xAAAA # The high bit of every known shell slot
+
+# Every field that gets its own set of Zobrist keys, as (offset, mask) pairs.
+ZOBRIST_FIELDS = [(TURN_OFFSET, 1),
+                  (MAX_HEALTH_OFFSET, HEALTH_MASK),
+                  (DEALER_HEALTH_OFFSET, HEALTH_MASK),
+                  (PLAYER_HEALTH_OFFSET, HEALTH_MASK),
+                  (LIVE_OFFSET, SHELL_COUNT_MASK),
+                  (BLANK_OFFSET, SHELL_COUNT_MASK),
+                  (HANDCUFFED_OFFSET, HANDCUFFED_MASK),
+                  (SAWED_OFFSET, 1),
+                  (ADRENALINE_OFFSET, 1),
+                  (INVERTER_OFFSET, 1)]
+ZOBRIST_FIELDS += [(SHELLS_OFFSET + 2 * index, 0b11) for index in range(8)]
+ZOBRIST_FIELDS += [(DEALER_ITEMS_OFFSET + 4 * item.value, ITEM_COUNT_MASK) for item in Items]
+ZOBRIST_FIELDS += [(PLAYER_ITEMS_OFFSET + 4 * item.value, ITEM_COUNT_MASK) for item in Items]
+
+# Seeded so hashes are the same in every process, which matters for anything saved or shared between processes.
+_zobrist_random = Random(0xB0C5407)
+ZOBRIST_KEYS = {offset: [_zobrist_random.getrandbits(64) for _ in range(mask + 1)] for offset, mask in ZOBRIST_FIELDS}
+
+def zobrist_hash(key: int) -> int:
+    """
+    Hashes a PackedPosition key from scratch. Successors update their parent's hash incrementally instead.
+    """
+    zobrist = 0
+    
+    for offset, mask in ZOBRIST_FIELDS:
+        zobrist ^= ZOBRIST_KEYS[offset][(key >> offset) & mask]
+    
+    return zobrist
+
+# The helpers below take a key and its Zobrist hash, and return the changed key and hash.
+
+def _set_field(key: int, zobrist: int, offset: int, mask: int, value: int):
+    zobrist_keys = ZOBRIST_KEYS[offset]
+    zobrist ^= zobrist_keys[(key >> offset) & mask] ^ zobrist_keys[value]
+    return (key & ~(mask << offset)) | (value << offset), zobrist
+
+def _current_items_offset(key: int):
+    # Same truth table as BuckshotRouletteMove.remove_item used to have, adrenaline steals from the other player.
+    is_players_turn = key & 1
+    on_adrenaline = (key >> ADRENALINE_OFFSET) & 1
+    return PLAYER_ITEMS_OFFSET if is_players_turn != on_adrenaline else DEALER_ITEMS_OFFSET
+
+def _use_item(key: int, zobrist: int, item: Items):
+    """
+    Removes `item` from whoever is using it and wears off adrenaline.
+    """
+    offset = _current_items_offset(key) + 4 * item.value
+    key, zobrist = _set_field(key, zobrist, offset, ITEM_COUNT_MASK, ((key >> offset) & ITEM_COUNT_MASK) - 1)
+    return _set_field(key, zobrist, ADRENALINE_OFFSET, 1, 0)
+
+def _rack_shell(key: int, zobrist: int, shell: int):
+    """
+    Removes the chambered shell, which was loaded as `shell`, and moves every known shell up a slot.
+    """
+    offset = LIVE_OFFSET if shell == LIVE_SHELL else BLANK_OFFSET
+    key, zobrist = _set_field(key, zobrist, offset, SHELL_COUNT_MASK, ((key >> offset) & SHELL_COUNT_MASK) - 1)
+    
+    shells = (key >> SHELLS_OFFSET) & SHELLS_MASK
+    for index in range(8):
+        old_slot = (shells >> (2 * index)) & 0b11
+        new_slot = (shells >> (2 * index + 2)) & 0b11
+        if old_slot != new_slot:
+            zobrist_keys = ZOBRIST_KEYS[SHELLS_OFFSET + 2 * index]
+            zobrist ^= zobrist_keys[old_slot] ^ zobrist_keys[new_slot]
+    key ^= (shells ^ (shells >> 2)) << SHELLS_OFFSET
+    
+    key, zobrist = _set_field(key, zobrist, INVERTER_OFFSET, 1, 0)
+    return _fill_implied_shells(key, zobrist)
+
+def _reveal_shell(key: int, zobrist: int, index: int, shell: int):
+    key, zobrist = _set_field(key, zobrist, SHELLS_OFFSET + 2 * index, 0b11, shell)
+    return _fill_implied_shells(key, zobrist)
+
+def _fill_implied_shells(key: int, zobrist: int):
+    """
+    Marks every unknown shell as known once they can only be one type, so positions that know the same things
+    have the same key however they found them out.
+    """
+    shells = (key >> SHELLS_OFFSET) & SHELLS_MASK
+    unknown_live = ((key >> LIVE_OFFSET) & SHELL_COUNT_MASK) - (shells & LIVE_SLOTS_MASK).bit_count()
+    unknown_blank = ((key >> BLANK_OFFSET) & SHELL_COUNT_MASK) - (shells & BLANK_SLOTS_MASK).bit_count()
+    if unknown_live and unknown_blank or not unknown_live + unknown_blank: return key, zobrist
+    
+    shell = LIVE_SHELL if unknown_live else BLANK_SHELL
+    for index in range(((key >> LIVE_OFFSET) & SHELL_COUNT_MASK) + ((key >> BLANK_OFFSET) & SHELL_COUNT_MASK)):
+        if not (shells >> (2 * index)) & 0b11:
+            key, zobrist = _set_field(key, zobrist, SHELLS_OFFSET + 2 * index, 0b11, shell)
+    
+    return key, zobrist
+
+def _change_health(key: int, zobrist: int, amount: int, offset: int | None = None):
+    """
+    Changes the current player's health (or the health at `offset`) by `amount`, keeping it between 0 and the maximum health.
+    """
+    if offset == None: offset = PLAYER_HEALTH_OFFSET if key & 1 else DEALER_HEALTH_OFFSET
+    max_health = (key >> MAX_HEALTH_OFFSET) & HEALTH_MASK
+    health = (key >> offset) & HEALTH_MASK
+    return _set_field(key, zobrist, offset, HEALTH_MASK, min(max_health, max(0, health + amount)))
+
+def _end_turn(key: int, zobrist: int):
+    """
+    Passes the turn to the other player, unless they are handcuffed.
+    """
+    match (key >> HANDCUFFED_OFFSET) & HANDCUFFED_MASK:
+        case 2:
+            return _set_field(key, zobrist, HANDCUFFED_OFFSET, HANDCUFFED_MASK, 1)
+        case 1:
+            key, zobrist = _set_field(key, zobrist, HANDCUFFED_OFFSET, HANDCUFFED_MASK, 0)
+    
+    return _set_field(key, zobrist, TURN_OFFSET, 1, (key & 1) ^ 1)
+
+def _key_pair(key: int, zobrist: int):
+    return key, zobrist
+
+def _list_legal_moves(key: int) -> list[ValidMoves]:
+    """
+    Works out the legal moves of a key the slow way, to fill in `LEGAL_MOVES_TABLE`.
+    """
+    items = key >> _current_items_offset(key)
+    has_item = lambda item: (items >> (4 * item.value)) & ITEM_COUNT_MASK
+    on_adrenaline = (key >> ADRENALINE_OFFSET) & 1
+    
+    all_moves = []
+    
+    if has_item(Items.ADRENALINE) and not on_adrenaline: all_moves += [ValidMoves.USE_ADRENALINE]
+    if has_item(Items.BEER): all_moves += [ValidMoves.USE_BEER]
+    if has_item(Items.BURNER_PHONE): all_moves += [ValidMoves.USE_BURNER_PHONE]
+    if has_item(Items.CIGARETTES): all_moves += [ValidMoves.USE_CIGARETTES]
+    if has_item(Items.EXPIRED_MEDICINE): all_moves += [ValidMoves.USE_EXPIRED_MEDICINE]
+    if has_item(Items.HANDCUFFS) and not (key >> HANDCUFFED_OFFSET) & HANDCUFFED_MASK: all_moves += [ValidMoves.USE_HANDCUFFS]
+    if has_item(Items.HAND_SAW) and not (key >> SAWED_OFFSET) & 1: all_moves += [ValidMoves.USE_HAND_SAW]
+    if has_item(Items.INVERTER) and not (key >> INVERTER_OFFSET) & 1: all_moves += [ValidMoves.USE_INVERTER]
+    if has_item(Items.MAGNIFYING_GLASS): all_moves += [ValidMoves.USE_MAGNIFYING_GLASS]
+    
+    # Adrenaline wears off if there's nothing left to steal.
+    if not on_adrenaline or not all_moves:
+        if key & 1:
+            all_moves += [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER]
+        else:
+            all_moves += [ValidMoves.SHOOT_PLAYER, ValidMoves.SHOOT_DEALER]
+    
+    return all_moves
+
+# Legal moves only depend on which items whoever's turn it is can use (not how many), the flags from handcuffed to
+# inverter_on, which are next to each other in the key, and whose turn it is. LEGAL_MOVES_TABLE maps those, packed into
+# an index by `PackedPosition._legal_moves_entry`, to `(bitmask, moves)`, and is filled in as combinations come up.
+HELD_ITEMS_MASK = sum(1 << (4 * item.value) for item in Items) # The low bit of every item count
+MOVE_FLAGS_OFFSET = HANDCUFFED_OFFSET
+MOVE_FLAGS_MASK = 0b11111
+LEGAL_MOVES_TABLE = {}
+
+def _shell_to_slot(shell: Literal["live", "blank"] | None):
+    match shell:
+        case "live":
+            return LIVE_SHELL
+        case "blank":
+            return BLANK_SHELL
+    
+    return UNKNOWN_SHELL
+
+class Inventory:
+    """
+    An immutable hand of items, stored as a 4 bit count per `Items` value packed into one int, the same way the
+    inventories are stored in a `PackedPosition` key.
+    
+    Hands holding the same items are equal (and hash the same) whatever order the items were picked up in.
+    Iterating over one gives every item it holds, in `Items` order, so `list(inventory)` converts it back to a list.
+    """
+    __slots__ = ("counts",)
+    
+    def __init__(self, counts: int = 0):
+        self.counts = counts
+    
+    @classmethod
+    def from_items(cls, items) -> "Inventory":
+        if isinstance(items, Inventory): return items
         
-        self.probabilty = Fraction(1, 1)
+        counts = 0
+        for item in items:
+            counts += 1 << (4 * item.value)
         
-        self.unknown_live_shells = unknown_live_shells
-        self.unknown_blank_shells = unknown_blank_shells
-        self.loaded_shells = LoadedShells()
+        return cls(counts)
+    
+    def count(self, item: Items) -> int:
+        return (self.counts >> (4 * item.value)) & ITEM_COUNT_MASK
+    
+    def add(self, item: Items) -> "Inventory":
+        if self.count(item) == ITEM_COUNT_MASK: raise ValueError(f"Can't hold more than {ITEM_COUNT_MASK} of {item}.")
+        return Inventory(self.counts + (1 << (4 * item.value)))
+    
+    def remove(self, item: Items) -> "Inventory":
+        if not self.count(item): raise ValueError(f"{item} isn't in the inventory.")
+        return Inventory(self.counts - (1 << (4 * item.value)))
+    
+    def __contains__(self, item: Items) -> bool:
+        return bool((self.counts >> (4 * item.value)) & ITEM_COUNT_MASK)
+    
+    def __iter__(self):
+        for item in Items:
+            for _ in range(self.count(item)):
+                yield item
+    
+    def __len__(self):
+        return sum(self.count(item) for item in Items)
+    
+    def __bool__(self):
+        return self.counts != 0
+    
+    def __eq__(self, other):
+        return isinstance(other, Inventory) and self.counts == other.counts
+    
+    def __hash__(self):
+        return hash(self.counts)
+    
+    def __repr__(self):
+        return f"Inventory({list(self)})"
+
+class PackedPosition:
+    """
+    An immutable position in Buckshot Roulette, packed into a single int (see the bit layout above).
+    
+    Two positions are equal if and only if their keys are equal, no matter how they were reached, so they can be
+    hashed and used as dictionary keys. Successors are generated with bit arithmetic instead of copying objects.
+    """
+    __slots__ = ("key", "zobrist", "legal_moves")
+    
+    def __init__(self, key: int, zobrist: int | None = None):
+        self.key = key
+        self.zobrist = zobrist_hash(key) if zobrist == None else zobrist
+        self.legal_moves = None # Worked out the first time it's needed, see _legal_moves_entry
+    
+    @classmethod
+    def from_fields(cls,
+                    is_players_turn: bool,
+                    max_health: int,
+                    dealer_health: int,
+                    player_health: int,
+                    live_shells: int,
+                    blank_shells: int,
+                    dealer_items: list[Items] | Inventory,
+                    player_items: list[Items] | Inventory,
+                    shells: list[Literal["live", "blank"] | None] = [],
+                    handcuffed: int = 0,
+                    gun_is_sawed: bool = False,
+                    on_adrenaline: bool = False,
+                    inverter_on: bool = False
+                    ):
+        if not 0 <= max_health <= HEALTH_MASK: raise ValueError(f"Maximum health must be between 0 and {HEALTH_MASK}.")
+        if not 0 <= dealer_health <= max_health: raise ValueError("Dealer's health must be between 0 and the maximum health.")
+        if not 0 <= player_health <= max_health: raise ValueError("Player's health must be between 0 and the maximum health.")
+        if min(live_shells, blank_shells) < 0 or live_shells + blank_shells > 8: raise ValueError("The gun can only have 8 shells at once.")
+        if len(dealer_items) > 8 or len(player_items) > 8: raise ValueError("Players can only hold 8 items at once.")
+        if not 0 <= handcuffed <= 2: raise ValueError("handcuffed must be 0, 1 or 2.")
         
-        self.is_players_turn = is_players_turn
-        self.handcuffed = 0 # 0 represents no handcuffs, 1 means handcuffs are on but will go next turn, 2 means handcuffs are on and will skip next turn
-        self.gun_is_sawed = False
-        self.on_adrenaline = False
-        self.inverter_on = False
+        key = int(is_players_turn)
+        key |= max_health << MAX_HEALTH_OFFSET
+        key |= dealer_health << DEALER_HEALTH_OFFSET
+        key |= player_health << PLAYER_HEALTH_OFFSET
+        key |= live_shells << LIVE_OFFSET
+        key |= blank_shells << BLANK_OFFSET
+        key |= handcuffed << HANDCUFFED_OFFSET
+        key |= int(gun_is_sawed) << SAWED_OFFSET
+        key |= int(on_adrenaline) << ADRENALINE_OFFSET
+        key |= int(inverter_on) << INVERTER_OFFSET
         
-        self.max_health = max_health
-        self.dealer_health = dealer_health
-        self.player_health = player_health
+        known_shells = shells[:live_shells + blank_shells]
+        if known_shells.count("live") > live_shells or known_shells.count("blank") > blank_shells: raise ValueError("More shells are known than are loaded.")
+        
+        for index, shell in enumerate(known_shells):
+            key |= _shell_to_slot(shell) << (SHELLS_OFFSET + 2 * index)
+        key, _ = _fill_implied_shells(key, 0)
+        
+        key |= Inventory.from_items(dealer_items).counts << DEALER_ITEMS_OFFSET
+        key |= Inventory.from_items(player_items).counts << PLAYER_ITEMS_OFFSET
+        
+        return cls(key)
+    
+    @property
+    def is_players_turn(self) -> bool:
+        return bool(self.key & 1)
+    
+    @property
+    def max_health(self) -> int:
+        return (self.key >> MAX_HEALTH_OFFSET) & HEALTH_MASK
+    
+    @property
+    def dealer_health(self) -> int:
+        return (self.key >> DEALER_HEALTH_OFFSET) & HEALTH_MASK
+    
+    @property
+    def player_health(self) -> int:
+        return (self.key >> PLAYER_HEALTH_OFFSET) & HEALTH_MASK
+    
+    @property
+    def unknown_live_shells(self) -> int:
+        return (self.key >> LIVE_OFFSET) & SHELL_COUNT_MASK
+    
+    @property
+    def unknown_blank_shells(self) -> int:
+        return (self.key >> BLANK_OFFSET) & SHELL_COUNT_MASK
+    
+    @property
+    def handcuffed(self) -> int:
+        return (self.key >> HANDCUFFED_OFFSET) & HANDCUFFED_MASK
+    
+    @property
+    def gun_is_sawed(self) -> bool:
+        return bool((self.key >> SAWED_OFFSET) & 1)
+    
+    @property
+    def on_adrenaline(self) -> bool:
+        return bool((self.key >> ADRENALINE_OFFSET) & 1)
+    
+    @property
+    def inverter_on(self) -> bool:
+        return bool((self.key >> INVERTER_OFFSET) & 1)
+    
+    @property
+    def dealer_items(self) -> Inventory:
+        return Inventory((self.key >> DEALER_ITEMS_OFFSET) & INVENTORY_MASK)
+    
+    @property
+    def player_items(self) -> Inventory:
+        return Inventory((self.key >> PLAYER_ITEMS_OFFSET) & INVENTORY_MASK)
+    
+    def count_item(self, item: Items, players: bool) -> int:
+        """
+        Returns how many of `item` the player (or dealer, if `players` is False) is holding.
+        """
+        offset = PLAYER_ITEMS_OFFSET if players else DEALER_ITEMS_OFFSET
+        return (self.key >> (offset + 4 * item.value)) & ITEM_COUNT_MASK
+    
+    def count_usable_item(self, item: Items) -> int:
+        """
+        Returns how many of `item` whoever's turn it is could use, which are the other player's items on adrenaline.
+        """
+        return (self.key >> (_current_items_offset(self.key) + 4 * item.value)) & ITEM_COUNT_MASK
+    
+    def get_shell(self, index: int):
+        """
+        Returns the shell at `index` as it would be fired, or None if it is unknown.
+        """
+        slot = (self.key >> (SHELLS_OFFSET + 2 * index)) & 0b11
+        if slot == UNKNOWN_SHELL: return None
+        
+        is_live = slot == LIVE_SHELL
+        if index == 0 and self.inverter_on: is_live = not is_live
         
-        self.dealer_items = dealer_items
-        self.player_items = player_items
+        return "live" if is_live else "blank"
     
     def get_current_shell(self):
-        return self.loaded_shells.get_current_shell()
+        return self.get_shell(0)
     
-    def get_all_moves(self):
-        all_moves = []
+    def _legal_moves_entry(self) -> tuple[int, tuple[ValidMoves, ...]]:
+        if self.legal_moves == None:
+            key = self.key
+            items = (key >> _current_items_offset(key)) & INVENTORY_MASK
+            held_items = (items | (items >> 1) | (items >> 2) | (items >> 3)) & HELD_ITEMS_MASK
+            index = (held_items << 6) | (((key >> MOVE_FLAGS_OFFSET) & MOVE_FLAGS_MASK) << 1) | (key & 1)
+            
+            entry = LEGAL_MOVES_TABLE.get(index)
+            if entry == None:
+                moves = tuple(_list_legal_moves(key))
+                entry = LEGAL_MOVES_TABLE[index] = (sum(1 << move.value for move in moves), moves)
+            
+            self.legal_moves = entry
         
-        if not self.on_adrenaline:
-            current_items = self.player_items if self.is_players_turn else self.dealer_items
-        else:
-            current_items = self.player_items if not self.is_players_turn else self.dealer_items
+        return self.legal_moves
+    
+    def legal_move_mask(self) -> int:
+        """
+        Returns every legal move as a bitmask, with bit `move.value` set if `move` can be played.
+        """
+        return self._legal_moves_entry()[0]
+    
+    def is_legal(self, move: ValidMoves) -> bool:
+        return bool((self._legal_moves_entry()[0] >> move.value) & 1)
+    
+    def get_all_moves(self) -> tuple[ValidMoves, ...]:
+        return self._legal_moves_entry()[1]
+    
+    def loaded_counts(self, index: int = 0) -> tuple[int, int]:
+        """
+        Returns `(live, total)`, the chance that the shell at `index` was loaded as a live shell as a numerator and denominator. Ignores the inverter.
+        """
+        key = self.key
+        slot = (key >> (SHELLS_OFFSET + 2 * index)) & 0b11
         
-        if Items.ADRENALINE in current_items: all_moves += [ValidMoves.USE_ADRENALINE]
-        if Items.BEER in current_items: all_moves += [ValidMoves.USE_BEER]
-        if Items.BURNER_PHONE in current_items: all_moves += [ValidMoves.USE_BURNER_PHONE]
-        if Items.CIGARETTES in current_items: all_moves += [ValidMoves.USE_CIGARETTES]
-        if Items.EXPIRED_MEDICINE in current_items: all_moves += [ValidMoves.USE_EXPIRED_MEDICINE]
-        if Items.HANDCUFFS in current_items and self.handcuffed == 0: all_moves += [ValidMoves.USE_HANDCUFFS]
-        if Items.HAND_SAW in current_items and self.gun_is_sawed == False: all_moves += [ValidMoves.USE_HAND_SAW]
-        if Items.INVERTER in current_items: all_moves += [ValidMoves.USE_INVERTER]
-        if Items.MAGNIFYING_GLASS in current_items: all_moves += [ValidMoves.USE_MAGNIFYING_GLASS]
+        if slot == LIVE_SHELL: return 1, 1
+        if slot == BLANK_SHELL: return 0, 1
         
-        if not self.on_adrenaline:    
-            if self.is_players_turn:
-                all_moves += [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER]
-            else:
-                all_moves += [ValidMoves.SHOOT_PLAYER, ValidMoves.SHOOT_DEALER]
+        # Shells that are already known elsewhere in the gun can't be this one.
+        shells = (key >> SHELLS_OFFSET) & SHELLS_MASK
+        unknown_live = ((key >> LIVE_OFFSET) & SHELL_COUNT_MASK) - (shells & LIVE_SLOTS_MASK).bit_count()
+        unknown_blank = ((key >> BLANK_OFFSET) & SHELL_COUNT_MASK) - (shells & BLANK_SLOTS_MASK).bit_count()
         
-        return all_moves
+        if unknown_live + unknown_blank <= 0: return 0, 1
+        return unknown_live, unknown_live + unknown_blank
     
-    def generate_live_and_blank_moves(self):
-        next_move = deepcopy(self)
-        
-        if self.unknown_live_shells + self.unknown_blank_shells == 0:
-            live_probability = Fraction(0, 1)
-        elif self.get_current_shell() == "live":
-            live_probability = Fraction(1, 1)
-        else:
-            live_probability = Fraction(self.unknown_live_shells, self.unknown_live_shells + self.unknown_blank_shells)
-            
-        blank_probability = 1 - live_probability # Since live_probability + blank_probability must equal 1
+    def loaded_chance(self, index: int = 0, ratio = Fraction) -> Fraction:
+        """
+        Returns the chance that the shell at `index` was loaded as a live shell. Ignores the inverter.
+        """
+        return ratio(*self.loaded_counts(index))
+    
+    def loaded_outcomes(self, index: int = 0, ratio = Fraction, ways: int = 1) -> list[tuple[int, Fraction]]:
+        """
+        Returns every way the shell at `index` could have been loaded as `(shell, chance)` pairs, skipping impossible ones.
         
-        live_move = deepcopy(self)
-        live_move.probabilty *= live_probability
-        live_move.unknown_live_shells = max(0, live_move.unknown_live_shells - 1)
+        Each chance is divided by `ways`, so callers picking the shell out of several don't need to multiply chances together.
+        """
+        live, total = self.loaded_counts(index)
+        outcomes = []
         
-        blank_move = deepcopy(self)
-        blank_move.probabilty *= blank_probability
-        blank_move.unknown_blank_shells = max(0, blank_move.unknown_blank_shells - 1)
+        if live > 0: outcomes += [(LIVE_SHELL, ratio(live, total * ways))]
+        if live < total: outcomes += [(BLANK_SHELL, ratio(total - live, total * ways))]
         
-        return next_move, live_move, blank_move
+        return outcomes
     
-    def move(self, move: ValidMoves):
-        if move not in self.get_all_moves(): 
+    def move(self, move: ValidMoves, ratio = Fraction) -> tuple[tuple[Fraction, "PackedPosition"], ...]:
+        """
+        Plays `move`, returning every possible outcome as `(chance, position)` pairs.
+        Chances are built with `ratio(numerator, denominator)`, which is `Fraction` unless the caller wants floats.
+        Raises InvalidMoveError if `move` can't be played in this position.
+        """
+        if not self.is_legal(move):
             error_message = f"Move {move} not possible in position\n---\n{self}\n---"
             raise InvalidMoveError(error_message)
         
-        next_move, live_move, blank_move = self.generate_live_and_blank_moves()
+        return tuple(self.outcomes(move, ratio))
+    
+    def outcomes(self, move: ValidMoves, ratio = Fraction):
+        """
+        Yields the outcomes of `move` as `(chance, position)` pairs one at a time, only building each position when it's
+        asked for. Outcomes that can't happen are never yielded.
+        Unlike `move`, this doesn't check `move` is legal, so only use it with moves from `get_all_moves`.
+        """
+        return self._outcomes(move, ratio, PackedPosition)
+    
+    def outcome_keys(self, move: ValidMoves, ratio = Fraction):
+        """
+        Same as `outcomes`, but yields `(chance, (key, zobrist))` without building a position for any of them.
+        """
+        return self._outcomes(move, ratio, _key_pair)
+    
+    def _outcomes(self, move: ValidMoves, ratio, build):
+        # Both kinds of outcome come from here, `build` turns each (key, zobrist) into what's yielded.
+        key, zobrist = self.key, self.zobrist
+        certain = ratio(1, 1)
         
         match move:
             case ValidMoves.SHOOT_DEALER:
-                live_move.dealer_health -= 1 if not self.gun_is_sawed else 2
-                live_move.dealer_health = max(0, live_move.dealer_health)
-                live_move.loaded_shells.shoot()
-                live_move.gun_is_sawed = False
-                
-                if self.handcuffed > 0: # Decrement turns left until next handcuff
-                    live_move.handcuffed -= 1
-                    blank_move.handcuffed -= 1
-                else:
-                    live_move.is_players_turn = False if self.is_players_turn else True # If the player shoots dealer with a live, it is not the players turn. If the dealer shoots themself with a live, it is the players turn.
-                
-                blank_move.loaded_shells.shoot()
-                blank_move.is_players_turn = False # If the player shoots the dealer with a blank, it is not the players turn. If the dealer shoots themself with a blank, it is not the players turn.
-                blank_move.gun_is_sawed = False
-                
-                return live_move, blank_move
+                yield from self._shoot(DEALER_HEALTH_OFFSET, ratio, build)
             
             case ValidMoves.SHOOT_PLAYER:
-                live_move.player_health -= 1 if not self.gun_is_sawed else 2
-                live_move.player_health = max(0, live_move.player_health)
-                live_move.loaded_shells.shoot()
-                live_move.gun_is_sawed = False
-                
-                if self.handcuffed > 0: # Decrement turns left until next handcuff
-                    live_move.handcuffed -= 1
-                    blank_move.handcuffed -= 1
-                else:
-                    live_move.is_players_turn = False if self.is_players_turn else True # If the player shoots themself with a live, it is not the players turn. If the dealer shoots the player with a live, it is the players turn.
-                
-                blank_move.loaded_shells.shoot()
-                blank_move.is_players_turn = True # If the player shoots themself with a blank, it is the players turn. If the dealer shoots the player with a blank, it is the players turn.
-                blank_move.gun_is_sawed = False
-
-                return live_move, blank_move
-                
+                yield from self._shoot(PLAYER_HEALTH_OFFSET, ratio, build)
+            
             case ValidMoves.USE_BEER:
-                # LoadedShells.shoot() just removes the first bullet. I should probably rename that.
-                live_move.loaded_shells.shoot()
-                blank_move.loaded_shells.shoot()
-                
-                self.remove_item(live_move, Items.MAGNIFYING_GLASS)
-                self.remove_item(blank_move, Items.MAGNIFYING_GLASS)
-                
-                return live_move, blank_move
+                key, zobrist = _use_item(key, zobrist, Items.BEER)
+                for shell, chance in self.loaded_outcomes(0, ratio):
+                    yield chance, build(*_rack_shell(key, zobrist, shell))
             
             case ValidMoves.USE_MAGNIFYING_GLASS:
-                live_move.loaded_shells.set_shell(0, "live")
-                blank_move.loaded_shells.set_shell(0, "blank")
-                
-                self.remove_item(live_move, Items.MAGNIFYING_GLASS)
-                self.remove_item(blank_move, Items.MAGNIFYING_GLASS)
-                
-                return live_move, blank_move
+                key, zobrist = _use_item(key, zobrist, Items.MAGNIFYING_GLASS)
+                for shell, chance in self.loaded_outcomes(0, ratio):
+                    yield chance, build(*_reveal_shell(key, zobrist, 0, shell))
             
             case ValidMoves.USE_CIGARETTES:
-                if self.is_players_turn:
-                    next_move.player_health += 1
-                    next_move.player_health = max(self.max_health, next_move.player_health)
-                else:
-                    next_move.dealer_health += 1
-                    next_move.dealer_health = max(self.max_health, next_move.dealer_health)
-                
-                self.remove_item(next_move, Items.CIGARETTES)
-                
-                return next_move,
+                key, zobrist = _use_item(key, zobrist, Items.CIGARETTES)
+                yield certain, build(*_change_health(key, zobrist, 1))
             
             case ValidMoves.USE_HANDCUFFS:
-                if self.handcuffed: return None
-                
-                self.remove_item(next_move, Items.HANDCUFFS)
-                
-                next_move.handcuffed = 2
-                
-                return next_move,
-                
+                key, zobrist = _use_item(key, zobrist, Items.HANDCUFFS)
+                yield certain, build(*_set_field(key, zobrist, HANDCUFFED_OFFSET, HANDCUFFED_MASK, 2))
+            
             case ValidMoves.USE_HAND_SAW:
-                if self.gun_is_sawed: return None
-                
-                self.remove_item(next_move, Items.HAND_SAW)
-                
-                next_move.gun_is_sawed = True
-                
-                return next_move,
-
+                key, zobrist = _use_item(key, zobrist, Items.HAND_SAW)
+                yield certain, build(*_set_field(key, zobrist, SAWED_OFFSET, 1, 1))
+            
             case ValidMoves.USE_ADRENALINE:
-                if self.on_adrenaline: return None
-                
-                self.remove_item(next_move, Items.ADRENALINE)
-                
-                next_move.on_adrenaline = True
-                
-                return next_move,
+                key, zobrist = _use_item(key, zobrist, Items.ADRENALINE)
+                yield certain, build(*_set_field(key, zobrist, ADRENALINE_OFFSET, 1, 1))
+            
+            case ValidMoves.USE_INVERTER:
+                key, zobrist = _use_item(key, zobrist, Items.INVERTER)
+                yield certain, build(*_set_field(key, zobrist, INVERTER_OFFSET, 1, 1))
+            
+            case ValidMoves.USE_EXPIRED_MEDICINE:
+                # 40% chance to heal 2 charges, 60% chance to lose 1.
+                key, zobrist = _use_item(key, zobrist, Items.EXPIRED_MEDICINE)
+                yield ratio(2, 5), build(*_change_health(key, zobrist, 2))
+                yield ratio(3, 5), build(*_change_health(key, zobrist, -1))
             
             case ValidMoves.USE_BURNER_PHONE:
+                # The phone never tells you about the chambered shell, and does nothing if that's the last one.
+                key, zobrist = _use_item(key, zobrist, Items.BURNER_PHONE)
                 total_shells = self.unknown_live_shells + self.unknown_blank_shells
-                possible_outcomes = []
+                if total_shells <= 1:
+                    yield certain, build(key, zobrist)
+                    return
                 
-                for i in range(0, total_shells):
-                    possible_live_move = deepcopy(self)
-                    possible_blank_move = deepcopy(self)
-                    
-                    shell_probability = Fraction(1, total_shells)
-                    
-                    possible_live_move.loaded_shells.set_shell(i, "live")
-                    possible_live_move.probabilty *= shell_probability
-                    possible_blank_move.loaded_shells.set_shell(i, "blank")
-                    possible_blank_move.probabilty *= shell_probability
-                    
-                    self.remove_item(possible_live_move, Items.BURNER_PHONE)
-                    self.remove_item(possible_blank_move, Items.BURNER_PHONE)
-                    
-                    possible_outcomes += [possible_live_move, possible_blank_move]
+                # Different reveals can leave the same position, like revealing a shell that's already known, or revealing
+                # one of two unknown shells when that gives away the other. Those are merged into one outcome.
+                merged = {}
+                for index in range(1, total_shells):
+                    for shell, chance in self.loaded_outcomes(index, ratio, total_shells - 1):
+                        next_key, next_zobrist = _reveal_shell(key, zobrist, index, shell)
+                        
+                        if next_key in merged:
+                            merged[next_key][0] += chance
+                        else:
+                            merged[next_key] = [chance, next_zobrist]
                 
-                return tuple(possible_outcomes)
+                for next_key, (chance, next_zobrist) in merged.items():
+                    yield chance, build(next_key, next_zobrist)
+    
+    def _shoot(self, health_offset: int, ratio, build):
+        key, zobrist = self.key, self.zobrist
+        shooting_self = (health_offset == PLAYER_HEALTH_OFFSET) == bool(key & 1)
+        damage = 2 if (key >> SAWED_OFFSET) & 1 else 1
+        inverted = bool((key >> INVERTER_OFFSET) & 1)
+        
+        for shell, chance in self.loaded_outcomes(0, ratio):
+            next_key, next_zobrist = _rack_shell(key, zobrist, shell)
+            next_key, next_zobrist = _set_field(next_key, next_zobrist, SAWED_OFFSET, 1, 0)
+            next_key, next_zobrist = _set_field(next_key, next_zobrist, ADRENALINE_OFFSET, 1, 0)
+            is_live = (shell == LIVE_SHELL) != inverted
             
-            case ValidMoves.USE_EXPIRED_MEDICINE:
-                heal_move = live_move
-                heal_move.probabilty = self.probabilty * Fraction(2, 5) # 40% change for 2 charges
-                if self.is_players_turn:
-                    heal_move.player_health += 2
-                    heal_move.player_health = max(self.max_health, heal_move.player_health)
-                else:
-                    heal_move.dealer_health += 2
-                    heal_move.dealer_health = max(self.max_health, heal_move.dealer_health)
-                
-                bad_move = blank_move
-                bad_move.probabilty = self.probabilty * Fraction(3, 5)
-                if self.is_players_turn:
-                    heal_move.player_health -= 1
-                    bad_move.player_health = min(0, bad_move.player_health)
-                else:
-                    heal_move.dealer_health -= 1
-                    bad_move.dealer_health = min(0, bad_move.dealer_health)
-                
-                self.remove_item(heal_move, Items.EXPIRED_MEDICINE)
-                self.remove_item(bad_move, Items.EXPIRED_MEDICINE)
-                
-                return heal_move, bad_move
+            if is_live:
+                next_key, next_zobrist = _change_health(next_key, next_zobrist, -damage, health_offset)
             
-            case ValidMoves.USE_INVERTER:
-                if self.inverter_on: return None
+            # Only shooting yourself with a blank keeps your turn.
+            if is_live or not shooting_self:
+                next_key, next_zobrist = _end_turn(next_key, next_zobrist)
+            
+            yield chance, build(next_key, next_zobrist)
+    
+    def __eq__(self, other):
+        return isinstance(other, PackedPosition) and self.key == other.key
+    
+    def __hash__(self):
+        return self.zobrist
+    
+    def __repr__(self):
+        return f"PackedPosition({self.key:#x})"
+    
+    def __str__(self):
+        known_shells = [self.get_shell(index) for index in range(self.unknown_live_shells + self.unknown_blank_shells)]
+        
+        return f"""Buckshot Roulette Position
 
-                next_move.inverter_on = True
-                
-                self.remove_item(next_move, Items.INVERTER)
-                
-                return next_move,
-    
-    def remove_item(self, next_move, item: Items): # Hate how I can't type hint BuckshotRouletteMove for next_move here.
-        # The below truth table shows why the conditional is why it is.
-        # 
-        #  is_players_turn | on_adrenaline | items getting removed |
-        # -----------------+---------------+-----------------------+
-        #            false |         false | dealer                |
-        #            false |          true | player                |
-        #             true |         false | player                |
-        #             true |          true | dealer                |
-        # -----------------+---------------+-----------------------+
+Turn: {"Player" if self.is_players_turn else "Dealer"}
+
+Number of live shells: {self.unknown_live_shells}
+Number of blank shells: {self.unknown_blank_shells}
+Known shells: {", ".join(shell or "unknown" for shell in known_shells)}
+
+Handcuffed? {"Yes" if self.handcuffed else "No"}
+Sawed gun? {"Yes" if self.gun_is_sawed else "No"}
+On adrenaline? {"Yes" if self.on_adrenaline else "No"}
+Inverted shell? {"Yes" if self.inverter_on else "No"}
+
+Player's Health: {self.player_health} / {self.max_health}
+Player's Items: {list(self.player_items)}
+
+Dealer's Health: {self.dealer_health} / {self.max_health}
+Dealer's Items: {list(self.dealer_items)}
+"""
+
+class MutablePosition(PackedPosition):
+    """
+    A PackedPosition that can be changed in place, for `BackshotRoulette`'s in-place search.
+    
+    `make` turns it into one of its outcomes (a `(key, zobrist)` pair from `outcome_keys`) and returns an undo record, and `unmake` turns it back.
+    Since its key changes it can't be hashed, use `PackedPosition(position.key, position.zobrist)` to keep a copy.
+    """
+    __slots__ = ()
+    __hash__ = None
+    
+    def make(self, key: int, zobrist: int) -> tuple:
+        undo = (self.key, self.zobrist, self.legal_moves)
+        self.key, self.zobrist, self.legal_moves = key, zobrist, None
+        return undo
+    
+    def unmake(self, undo: tuple):
+        self.key, self.zobrist, self.legal_moves = undo
+
+class BuckshotRouletteMove:
+    """
+    Mutable, human friendly version of a position, used by `start.py` and `start_gui.py` to set up a position.
+    
+    The game rules live in `PackedPosition`, this class converts to and from it with `to_packed` and `from_packed`.
+    """
+    def __init__(self, 
+                 is_players_turn: bool, 
+                 max_health: int, 
+                 dealer_health: int, 
+                 player_health: int, 
+                 unknown_live_shells: int, 
+                 unknown_blank_shells: int, 
+                 dealer_items: list | Inventory, 
+                 player_items: list | Inventory
+                 ):
         
-        if self.is_players_turn != self.on_adrenaline:
-            next_move.player_items.remove(item)
-        else:
-            next_move.dealer_items.remove(item)
+        self.probabilty = Fraction(1, 1)
+        
+        self.unknown_live_shells = unknown_live_shells
+        self.unknown_blank_shells = unknown_blank_shells
+        self.loaded_shells = LoadedShells()
+        
+        self.is_players_turn = is_players_turn
+        self.handcuffed = 0 # 0 represents no handcuffs, 1 means handcuffs are on but will go next turn, 2 means handcuffs are on and will skip next turn
+        self.gun_is_sawed = False
+        self.on_adrenaline = False
+        self.inverter_on = False
+        
+        self.max_health = max_health
+        self.dealer_health = dealer_health
+        self.player_health = player_health
+        
+        self.dealer_items = Inventory.from_items(dealer_items)
+        self.player_items = Inventory.from_items(player_items)
+    
+    @classmethod
+    def from_packed(cls, position: PackedPosition, probabilty: Fraction = Fraction(1, 1)):
+        state = cls(position.is_players_turn,
+                    position.max_health, position.dealer_health, position.player_health,
+                    position.unknown_live_shells, position.unknown_blank_shells,
+                    position.dealer_items,
+                    position.player_items)
+        
+        state.probabilty = probabilty
+        state.handcuffed = position.handcuffed
+        state.gun_is_sawed = position.gun_is_sawed
+        state.on_adrenaline = position.on_adrenaline
+        state.inverter_on = position.inverter_on
+        
+        # Known shells are stored as loaded, get_shell would apply the inverter to the chambered one.
+        for index in range(8):
+            slot = (position.key >> (SHELLS_OFFSET + 2 * index)) & 0b11
+            if slot != UNKNOWN_SHELL: state.loaded_shells.set_shell(index, "live" if slot == LIVE_SHELL else "blank")
+        
+        return state
+    
+    def to_packed(self) -> PackedPosition:
+        return PackedPosition.from_fields(self.is_players_turn,
+                                          self.max_health, self.dealer_health, self.player_health,
+                                          self.unknown_live_shells, self.unknown_blank_shells,
+                                          self.dealer_items,
+                                          self.player_items,
+                                          self.loaded_shells.shells,
+                                          self.handcuffed,
+                                          self.gun_is_sawed,
+                                          self.on_adrenaline,
+                                          self.inverter_on)
+    
+    def get_current_shell(self):
+        return self.loaded_shells.get_current_shell()
+    
+    def get_all_moves(self):
+        return self.to_packed().get_all_moves()
+    
+    def move(self, move: ValidMoves):
+        """
+        Yields every outcome of `move` as a BuckshotRouletteMove, converting each one only when it's asked for.
+        Raises InvalidMoveError straight away if `move` can't be played.
+        """
+        position = self.to_packed()
+        if not position.is_legal(move): raise InvalidMoveError(f"Move {move} not possible in position\n---\n{self}\n---")
         
-        next_move.on_adrenaline = False
+        return (BuckshotRouletteMove.from_packed(outcome, self.probabilty * chance) for chance, outcome in position.outcomes(move))
     
     def __str__(self):
         return f"""Buckshot Roulette Move
@@ -330,11 +793,11 @@ Number of blank shells: {self.unknown_blank_shells}
 
 Handcuffed? {"Yes" if self.handcuffed else "No"}
 Sawed gun? {"Yes" if self.gun_is_sawed else "No"}
-Current shell? {"Unknown" if self.get_current_shell == None else self.get_current_shell}
+Current shell? {"Unknown" if self.get_current_shell() == None else self.get_current_shell()}
 
 Player's Health: {self.player_health} / {self.max_health}
-Player's Items: {self.player_items}
+Player's Items: {list(self.player_items)}
 
 Dealer's Health: {self.dealer_health} / {self.max_health}
-Dealer's Items: {self.dealer_items}
+Dealer's Items: {list(self.dealer_items)}
 """
\ No newline at end of file
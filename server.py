@@ -0,0 +1,179 @@
+from batch import *
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+
+HOST = "127.0.0.1" # Never anything but localhost, there's no authentication.
+MAX_REQUEST_BYTES = 1 << 16
+
+STATUS_MESSAGES = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+                   500: "Internal Server Error"}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class AnalysisServer:
+    """
+    Serves `POST /analyse` on localhost. The body is a JSON object with the same fields as a line of `batch.py` input, plus
+    optional "depth", "time_limit" and "node_limit", and the response is the same as a line of `batch.py` output.
+    
+    Searches run on a pool of worker processes whose engines (and transposition tables) stay warm between requests.
+    Results of searches that reached their depth are kept in an LRU cache (ones cut short by a limit depend on how busy
+    the machine was), and requests for a search that's already running wait for it instead of starting another one.
+    """
+    def __init__(self, port: int = 8000, workers: int | None = None, cache_size: int = 4096, max_depth: int = 18,
+                 arithmetic: str = "float", tablebase_path: str | None = None):
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_size = cache_size
+        self.max_depth = max_depth
+        self.arithmetic = arithmetic
+        self.tablebase_path = tablebase_path
+        
+        self.process_pool = None
+        self.cache = OrderedDict()
+        self.running = {}
+    
+    async def analyse(self, fields: dict) -> dict:
+        try:
+            position = fields_to_position(fields)
+            max_depth = self.max_depth if fields.get("depth") == None else int(fields["depth"])
+            time_limit = None if fields.get("time_limit") == None else float(fields["time_limit"])
+            node_limit = None if fields.get("node_limit") == None else int(fields["node_limit"])
+        except (ValueError, KeyError, TypeError) as error:
+            raise HTTPError(400, f"{type(error).__name__}: {error}")
+        
+        if max_depth < 1: raise HTTPError(400, "depth must be at least 1.")
+        if time_limit != None and not time_limit > 0: raise HTTPError(400, "time_limit must be more than 0.")
+        if node_limit != None and node_limit < 1: raise HTTPError(400, "node_limit must be at least 1.")
+        
+        cache_key = (position.key, max_depth, time_limit, node_limit)
+        
+        if cache_key in self.cache:
+            self.cache.move_to_end(cache_key)
+            return self.cache[cache_key] | {"cached": True}
+        
+        # Someone else already asked for this, so share their search.
+        if cache_key in self.running:
+            return await asyncio.shield(self.running[cache_key])
+        
+        search = asyncio.ensure_future(self.search_in_pool(fields, max_depth, time_limit, node_limit))
+        self.running[cache_key] = search
+        
+        try:
+            result = await asyncio.shield(search)
+        finally:
+            del self.running[cache_key]
+        
+        if "error" not in result and result["depth"] == max_depth:
+            self.cache[cache_key] = result
+            if len(self.cache) > self.cache_size: self.cache.popitem(last = False)
+        
+        return result
+    
+    async def search_in_pool(self, fields: dict, max_depth: int, time_limit: float | None, node_limit: int | None) -> dict:
+        process_pool = self.process_pool
+        
+        try:
+            return await asyncio.get_running_loop().run_in_executor(process_pool, analyse_in_worker, fields, max_depth, time_limit, node_limit)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory...), which breaks the whole pool, so start a new one for the next request.
+            if self.process_pool is process_pool:
+                process_pool.shutdown(wait = False, cancel_futures = True)
+                self.start_process_pool()
+            raise
+    
+    async def read_request(self, reader: asyncio.StreamReader) -> tuple[str, str, bytes]:
+        """
+        Returns the method, path and body of one HTTP request.
+        """
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3: raise HTTPError(400, "Malformed request line.")
+        method, path, _ = request_line
+        
+        content_length = 0
+        while True:
+            header = (await reader.readline()).decode("latin-1").strip()
+            if not header: break
+            
+            name, _, value = header.partition(":")
+            if name.strip().lower() == "content-length":
+                if not value.strip().isdigit(): raise HTTPError(400, "Malformed Content-Length.")
+                content_length = int(value)
+        
+        if content_length > MAX_REQUEST_BYTES: raise HTTPError(413, "Request body too large.")
+        
+        return method, path, await reader.readexactly(content_length)
+    
+    async def respond(self, reader: asyncio.StreamReader) -> tuple[int, dict]:
+        """
+        Returns the status and JSON body of the response to one request.
+        """
+        try:
+            method, path, body = await self.read_request(reader)
+            
+            if path.split("?")[0] != "/analyse": raise HTTPError(404, f"Nothing at {path}, try POST /analyse.")
+            if method != "POST": raise HTTPError(405, "Only POST is allowed.")
+            
+            try:
+                fields = json.loads(body)
+            except json.JSONDecodeError as error:
+                raise HTTPError(400, f"JSONDecodeError: {error}")
+            if not isinstance(fields, dict): raise HTTPError(400, "The body must be a JSON object.")
+            
+            result = await self.analyse(fields)
+            return 400 if "error" in result else 200, result
+        except HTTPError as error:
+            return error.status, {"error": str(error)}
+        except (asyncio.IncompleteReadError, ConnectionError):
+            raise
+        except Exception as error: # Anything else is our fault, but the client still gets an answer rather than hanging.
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, result = await self.respond(reader)
+            
+            response_body = json.dumps(result).encode()
+            writer.write(f"HTTP/1.1 {status} {STATUS_MESSAGES[status]}\r\n".encode())
+            writer.write(f"Content-Type: application/json\r\nContent-Length: {len(response_body)}\r\nConnection: close\r\n\r\n".encode())
+            writer.write(response_body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # The client went away, so there's no one to answer.
+        finally:
+            writer.close()
+    
+    def start_process_pool(self):
+        self.process_pool = ProcessPoolExecutor(self.workers, initializer = start_batch_worker, initargs = (self.arithmetic, self.tablebase_path))
+    
+    async def serve(self):
+        self.start_process_pool()
+        
+        try:
+            server = await asyncio.start_server(self.handle_connection, HOST, self.port)
+            print(f"Serving POST /analyse on http://{HOST}:{self.port}")
+            
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.process_pool.shutdown(cancel_futures = True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Serves BackshotRoulette analysis over HTTP on localhost.")
+    parser.add_argument("--port", type = int, default = 8000, help = "Defaults to 8000.")
+    parser.add_argument("--workers", type = int, help = "Processes to search with. Defaults to every core.")
+    parser.add_argument("--cache-size", type = int, default = 4096, help = "Finished results to remember. Defaults to 4096.")
+    parser.add_argument("--depth", type = int, default = 18, help = "Depth for requests that don't give one. Defaults to 18.")
+    parser.add_argument("--arithmetic", choices = list(ARITHMETIC), default = "float", help = "Defaults to float.")
+    parser.add_argument("--tablebase", help = "Endgame tablebase file made by generate_tablebase.py.")
+    arguments = parser.parse_args()
+    
+    analysis_server = AnalysisServer(arguments.port, arguments.workers, arguments.cache_size, arguments.depth, arguments.arithmetic, arguments.tablebase)
+    
+    try:
+        asyncio.run(analysis_server.serve())
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
@@ -0,0 +1,302 @@
+from backshot import *
+from concurrent.futures import as_completed
+from random import Random
+import argparse
+import json
+import math
+import sys
+
+# Real games deal out 2 to 8 shells, with at least one of each, and 1 to 4 items to each player per load.
+MIN_SHELLS = 2
+MAX_SHELLS = 8
+MAX_ITEMS_PER_LOAD = 4
+MAX_ITEMS = 8
+MAX_HEALTHS = [2, 3, 4]
+
+# Games still going after this many loads are given up on as draws, so a pair of very defensive policies can't
+# keep a worker busy forever.
+MAX_LOADS = 50
+
+# Engines in simulations get a smaller table than the default, there's one per policy per worker.
+SIMULATION_TABLE_MIBIBYTES = 8
+
+class SearchPolicy:
+    """
+    Plays whatever `BackshotRoulette.iterative_search` thinks is best, for whichever side is to move.
+    The transposition table is kept between moves of a game, but cleared at the start of every game, so games with the
+    same seed play out the same (unless there's a time limit).
+    """
+    def __init__(self, depth: int = 4, time_limit: float | None = None, node_limit: int | None = None, dealer_model: str = "adversarial"):
+        self.depth = depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        
+        self.engine = BackshotRoulette(dealer_model = dealer_model, table_mibibytes = SIMULATION_TABLE_MIBIBYTES)
+    
+    def new_game(self):
+        self.engine.transposition_table.clear()
+    
+    def __call__(self, position: PackedPosition, rng: Random) -> ValidMoves:
+        result = self.engine.iterative_search(position, self.depth, self.time_limit, self.node_limit)
+        return None if result == None else result.move_type
+
+class RandomPolicy:
+    """
+    Plays a random legal move, using the game's random number generator so it's reproducible too.
+    """
+    def new_game(self):
+        pass
+    
+    def __call__(self, position: PackedPosition, rng: Random) -> ValidMoves:
+        return rng.choice(position.get_all_moves())
+
+class ModelPolicy:
+    """
+    Plays like one of the DEALER_MODELS, picking between its moves with the game's random number generator.
+    """
+    def __init__(self, model: str = "scripted"):
+        self.model = DEALER_MODELS[model]()
+    
+    def new_game(self):
+        pass
+    
+    def __call__(self, position: PackedPosition, rng: Random) -> ValidMoves:
+        move_weights = self.model.move_weights(position, truediv)
+        if move_weights == None: return None # Adversarial, which isn't a policy on its own.
+        
+        moves, weights = zip(*move_weights)
+        return rng.choices(moves, weights)[0]
+
+def make_policy(spec: dict):
+    """
+    Builds a policy from a spec like `{"kind": "search", "depth": 4}`, `{"kind": "model", "model": "scripted"}` or
+    `{"kind": "random"}`. Specs are plain dicts so they can be sent to worker processes and written out with the results.
+    """
+    match spec["kind"]:
+        case "search":
+            return SearchPolicy(spec.get("depth", 4), spec.get("time_limit"), spec.get("node_limit"), spec.get("dealer_model", "adversarial"))
+        case "model":
+            return ModelPolicy(spec.get("model", "scripted"))
+        case "random":
+            return RandomPolicy()
+    
+    raise ValueError(f"Unknown policy {spec['kind']!r}, expected 'search', 'model' or 'random'.")
+
+def deal_items(rng: Random, inventory: Inventory, count: int) -> Inventory:
+    for item in rng.choices(list(Items), k = count):
+        if len(inventory) >= MAX_ITEMS: break
+        inventory = inventory.add(item)
+    
+    return inventory
+
+def load_gun(rng: Random, max_health: int, dealer_health: int, player_health: int, dealer_items: Inventory, player_items: Inventory) -> BuckshotRouletteMove:
+    """
+    Starts a new load, returning it with every shell known. The player always goes first.
+    """
+    total_shells = rng.randint(MIN_SHELLS, MAX_SHELLS)
+    live_shells = rng.randint(1, total_shells - 1)
+    shells = ["live"] * live_shells + ["blank"] * (total_shells - live_shells)
+    rng.shuffle(shells)
+    
+    item_count = rng.randint(1, MAX_ITEMS_PER_LOAD)
+    state = BuckshotRouletteMove(True,
+                                 max_health, dealer_health, player_health,
+                                 live_shells, total_shells - live_shells,
+                                 deal_items(rng, dealer_items, item_count),
+                                 deal_items(rng, player_items, item_count))
+    
+    for index, shell in enumerate(shells):
+        state.loaded_shells.set_shell(index, shell)
+    
+    return state
+
+def known_position(truth: BuckshotRouletteMove, known_shells: int) -> PackedPosition:
+    """
+    Returns what both players know about `truth`, which is everything but the shells whose bit isn't set in `known_shells`.
+    """
+    view = BuckshotRouletteMove.from_packed(truth.to_packed())
+    
+    for index in range(8):
+        if not (known_shells >> index) & 1: view.loaded_shells.set_shell(index, None)
+    
+    return view.to_packed()
+
+def play_move(truth: BuckshotRouletteMove, move: ValidMoves, known_shells: int, rng: Random) -> tuple[BuckshotRouletteMove, int]:
+    """
+    Plays `move` on the real game, returning the new real game and which shells are known afterwards.
+    Every shell in `truth` is known, so the only chance left in its outcomes is the expired medicine's.
+    """
+    outcomes = list(truth.move(move))
+    next_truth = rng.choices(outcomes, weights = [float(outcome.probabilty) for outcome in outcomes])[0]
+    next_truth.probabilty = Fraction(1, 1)
+    
+    match move:
+        case ValidMoves.SHOOT_DEALER | ValidMoves.SHOOT_PLAYER | ValidMoves.USE_BEER:
+            known_shells >>= 1
+        case ValidMoves.USE_MAGNIFYING_GLASS:
+            known_shells |= 1
+        case ValidMoves.USE_BURNER_PHONE:
+            total_shells = truth.unknown_live_shells + truth.unknown_blank_shells
+            if total_shells > 1: known_shells |= 1 << rng.randint(1, total_shells - 1)
+    
+    return next_truth, known_shells
+
+def play_game(player_policy, dealer_policy, seed) -> dict:
+    """
+    Plays one game, loading the gun again whenever it runs out of live shells, until someone dies.
+    Policies only ever see what the players know, see `known_position`.
+    
+    Args:
+        player_policy: Called as `policy(position, rng)` for the player's moves, see `SearchPolicy`.
+        dealer_policy: The same, for the dealer's moves.
+        seed: Seed for everything random in the game, so the same seed and policies give the same game.
+    
+    Returns:
+        dict: The winner ("player", "dealer", or None if the game hit MAX_LOADS), and how the game went.
+    """
+    rng = Random(seed)
+    player_policy.new_game()
+    dealer_policy.new_game()
+    
+    max_health = rng.choice(MAX_HEALTHS)
+    truth = load_gun(rng, max_health, max_health, max_health, Inventory(), Inventory())
+    known_shells = 0
+    loads = 1
+    moves = 0
+    
+    while truth.player_health > 0 and truth.dealer_health > 0:
+        # Nobody can be hurt by what's left, so it's as good as empty.
+        if truth.unknown_live_shells == 0:
+            if loads >= MAX_LOADS: break
+            
+            truth = load_gun(rng, max_health, truth.dealer_health, truth.player_health, truth.dealer_items, truth.player_items)
+            known_shells = 0
+            loads += 1
+        
+        position = known_position(truth, known_shells)
+        policy = player_policy if position.is_players_turn else dealer_policy
+        move = policy(position, rng)
+        if move == None or not position.is_legal(move): move = position.get_all_moves()[0]
+        
+        truth, known_shells = play_move(truth, move, known_shells, rng)
+        moves += 1
+    
+    if truth.player_health == 0:
+        winner = "dealer"
+    elif truth.dealer_health == 0:
+        winner = "player"
+    else:
+        winner = None
+    
+    return {"seed": seed,
+            "winner": winner,
+            "max_health": max_health,
+            "player_health": truth.player_health,
+            "dealer_health": truth.dealer_health,
+            "loads": loads,
+            "moves": moves}
+
+# Each worker process keeps its policies (and their engines) between games.
+worker_policies = {}
+
+def play_game_in_worker(player_spec: dict, dealer_spec: dict, seed) -> dict:
+    policies = []
+    
+    for spec in (player_spec, dealer_spec):
+        spec_key = json.dumps(spec, sort_keys = True)
+        if spec_key not in worker_policies: worker_policies[spec_key] = make_policy(spec)
+        policies += [worker_policies[spec_key]]
+    
+    # Both sides might be the same spec, which would share an engine, that's fine since only one moves at a time.
+    return play_game(*policies, seed)
+
+def wilson_interval(wins: int, games: int, z: float = 1.96) -> tuple[float, float]:
+    """
+    Returns a confidence interval (95% by default) for a win rate of `wins` out of `games`.
+    """
+    if games == 0: return 0.0, 1.0
+    
+    rate = wins / games
+    centre = (rate + z ** 2 / (2 * games)) / (1 + z ** 2 / games)
+    spread = z * math.sqrt(rate * (1 - rate) / games + z ** 2 / (4 * games ** 2)) / (1 + z ** 2 / games)
+    return max(0.0, centre - spread), min(1.0, centre + spread)
+
+def simulate(player_spec: dict, dealer_spec: dict, games: int, seed: int = 0, workers: int | None = None, on_result = None) -> dict:
+    """
+    Plays `games` games between two policies over a process pool, and returns how often each side won.
+    Game `index` is seeded with `f"{seed}:{index}"`, so the same seed always plays the same games.
+    
+    Args:
+        player_spec (dict): The player's policy, see `make_policy`.
+        dealer_spec (dict): The dealer's policy.
+        games (int): How many games to play.
+        seed (int, optional): Defaults to 0.
+        workers (int | None, optional): Processes to play with. Defaults to None (every core).
+        on_result (optional): Called with every game's result as it finishes, in any order.
+    
+    Returns:
+        dict: Win counts, the player's win rate and its 95% confidence interval.
+    """
+    workers = workers or os.cpu_count() or 1
+    wins = {"player": 0, "dealer": 0, None: 0}
+    
+    with ProcessPoolExecutor(workers) as process_pool:
+        futures = [process_pool.submit(play_game_in_worker, player_spec, dealer_spec, f"{seed}:{index}") for index in range(games)]
+        
+        for future in as_completed(futures):
+            result = future.result()
+            wins[result["winner"]] += 1
+            if on_result != None: on_result(result)
+    
+    decided = wins["player"] + wins["dealer"]
+    low, high = wilson_interval(wins["player"], decided)
+    
+    return {"player": player_spec,
+            "dealer": dealer_spec,
+            "games": games,
+            "player_wins": wins["player"],
+            "dealer_wins": wins["dealer"],
+            "draws": wins[None],
+            "player_win_rate": wins["player"] / decided if decided else 0.0,
+            "player_win_rate_interval": [low, high]}
+
+def policy_spec(kind: str, depth: int, time_limit: float | None, node_limit: int | None, dealer_model: str = "adversarial") -> dict:
+    if kind == "random": return {"kind": "random"}
+    if kind in DEALER_MODELS: return {"kind": "model", "model": kind}
+    return {"kind": "search", "depth": depth, "time_limit": time_limit, "node_limit": node_limit, "dealer_model": dealer_model}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Plays games between engine policies and reports the player's win rate.")
+    parser.add_argument("--games", type = int, default = 1000, help = "Games per matchup. Defaults to 1000.")
+    parser.add_argument("--seed", type = int, default = 0, help = "Defaults to 0.")
+    parser.add_argument("--workers", type = int, help = "Processes to play with. Defaults to every core.")
+    parser.add_argument("--player", choices = ["search", "random", "scripted", "stochastic"], default = "search", help = "Defaults to search.")
+    parser.add_argument("--player-depth", type = int, nargs = "+", default = [4], help = "Search depths to try for the player, one matchup each. Defaults to 4.")
+    parser.add_argument("--player-time-limit", type = float, help = "Seconds per player move.")
+    parser.add_argument("--player-node-limit", type = int, help = "Positions per player move.")
+    parser.add_argument("--player-dealer-model", choices = list(DEALER_MODELS), default = "adversarial", help = "How the player's search assumes the dealer plays. Defaults to adversarial.")
+    parser.add_argument("--dealer", choices = ["search", "random", "scripted", "stochastic"], default = "search", help = "Defaults to search.")
+    parser.add_argument("--dealer-depth", type = int, default = 4, help = "Defaults to 4.")
+    parser.add_argument("--dealer-time-limit", type = float, help = "Seconds per dealer move.")
+    parser.add_argument("--dealer-node-limit", type = int, help = "Positions per dealer move.")
+    parser.add_argument("-o", "--output", help = "File to write every game to as JSONL.")
+    arguments = parser.parse_args()
+    
+    dealer_spec = policy_spec(arguments.dealer, arguments.dealer_depth, arguments.dealer_time_limit, arguments.dealer_node_limit)
+    output_file = None if arguments.output == None else open(arguments.output, "w")
+    
+    try:
+        for depth in arguments.player_depth:
+            player_spec = policy_spec(arguments.player, depth, arguments.player_time_limit, arguments.player_node_limit, arguments.player_dealer_model)
+            
+            def write_result(result: dict):
+                if output_file != None: output_file.write(json.dumps({"player": player_spec, "dealer": dealer_spec} | result) + "\n")
+            
+            summary = simulate(player_spec, dealer_spec, arguments.games, arguments.seed, arguments.workers, write_result)
+            low, high = summary["player_win_rate_interval"]
+            
+            print(f"Player {json.dumps(player_spec)} vs dealer {json.dumps(dealer_spec)}: "
+                  f"{summary['player_wins']} / {summary['games']} player wins ({summary['player_win_rate'] * 100:.1f}%, "
+                  f"95% CI {low * 100:.1f}-{high * 100:.1f}%), {summary['draws']} draws", file = sys.stderr)
+    finally:
+        if output_file != None: output_file.close()
\ No newline at end of file
@@ -1,34 +1,15 @@
 from backshot import *
 import time
 
-bot = BackshotRoulette()
+# Results are kept here between runs, so positions that come up again are instant. Set to None to always start from scratch.
+ANALYSIS_CACHE_PATH = "analysis_cache.sqlite3"
 
-def string_to_item(item_string: str):
-    item_string = item_string.lower()
-    items = []
-    
-    for char in item_string:
-        match char:
-            case "h":
-                items += [Items.HANDCUFFS]
-            case "s":
-                items += [Items.HAND_SAW]
-            case "c":
-                items += [Items.CIGARETTES]
-            case "b":
-                items += [Items.BEER]
-            case "m":
-                items += [Items.MAGNIFYING_GLASS]
-            case "a":
-                items += [Items.ADRENALINE]
-            case "e":
-                items += [Items.EXPIRED_MEDICINE]
-            case "f":
-                items += [Items.BURNER_PHONE]
-            case "i":
-                items += [Items.INVERTER]
-    
-    return items
+# How the dealer is assumed to play, see DEALER_MODELS. The analysis cache only holds results against the "adversarial" dealer,
+# so it isn't used with the others.
+DEALER_MODEL = "adversarial"
+
+uses_analysis_cache = ANALYSIS_CACHE_PATH != None and DEALER_MODEL == "adversarial"
+bot = BackshotRoulette(analysis_cache = AnalysisCache.open(ANALYSIS_CACHE_PATH) if uses_analysis_cache else None, dealer_model = DEALER_MODEL)
 
 def idiot_input(prompt: object = "", condition = lambda x: 1):
     while True:
@@ -76,14 +57,19 @@ position.gun_is_sawed = sawed
 max_depth = 18
 
 start_time = time.time()
+last_depth = {"positions": 0, "time": start_time}
 
-for depth in range (1, max_depth + 1):
-    depth_start_time = time.time()
-    bot.max_depth = depth
-    bot.positions_searched = 0
+def print_depth(depth: int, result: Move):
+    print("Finished search with depth", depth)
+    print(result)
+    print(f"Searched {bot.positions_searched - last_depth['positions']} positions in {time.time() - last_depth['time']} seconds.")
     
-    print("Starting search with depth", depth)
-    print(bot.search(depth, position))
-    print(f"Searched {bot.positions_searched} positions in {time.time() - depth_start_time} seconds.")
+    last_depth["positions"] = bot.positions_searched
+    last_depth["time"] = time.time()
+
+bot.iterative_search(position, max_depth, on_depth = print_depth)
+
+print(f"Completed search in {time.time() - start_time} seconds.")
+print(bot.statistics)
 
-print(f"Completed search in {time.time() - start_time} seconds.")
\ No newline at end of file
+if bot.analysis_cache != None: bot.analysis_cache.close()
\ No newline at end of file
@@ -1,8 +1,15 @@
 import tkinter as tk
 from tkinter import ttk
 from backshot import *
+import queue
+import threading
 import time
 
+MAX_DEPTH = 18
+POLL_MILLISECONDS = 100
+ANALYSIS_CACHE_PATH = "analysis_cache.sqlite3" # None to not keep results between runs.
+DEALER_MODEL = "adversarial" # See DEALER_MODELS. The analysis cache is only used with "adversarial".
+
 def font(size: int, bold = False):
     font_name = "Arial Black" if bold else "Arial"
     return (font_name, size)
@@ -13,33 +20,6 @@ def get_int_value(widget: tk.Spinbox):
         return int(value)
     raise ValueError()
 
-def string_to_item(item_string: str):
-    item_string = item_string.lower()
-    items = []
-    
-    for char in item_string:
-        match char:
-            case "h":
-                items += [Items.HANDCUFFS]
-            case "s":
-                items += [Items.HAND_SAW]
-            case "c":
-                items += [Items.CIGARETTES]
-            case "b":
-                items += [Items.BEER]
-            case "m":
-                items += [Items.MAGNIFYING_GLASS]
-            case "a":
-                items += [Items.ADRENALINE]
-            case "e":
-                items += [Items.EXPIRED_MEDICINE]
-            case "f":
-                items += [Items.BURNER_PHONE]
-            case "i":
-                items += [Items.INVERTER]
-    
-    return items
-
 class GraphicBackshot: # ha ha ha ha ha
     def __init__(self):
         self.window = tk.Tk()
@@ -47,6 +27,16 @@ class GraphicBackshot: # ha ha ha ha ha
         self.window.geometry("480x720")
         self.window.resizable(True, False)
         
+        # One engine for the whole session, so its transposition table carries over between searches.
+        # The analysis cache carries results over between sessions too.
+        uses_analysis_cache = ANALYSIS_CACHE_PATH != None and DEALER_MODEL == "adversarial"
+        analysis_cache = AnalysisCache.open(ANALYSIS_CACHE_PATH) if uses_analysis_cache else None
+        self.engine = BackshotRoulette(analysis_cache = analysis_cache, dealer_model = DEALER_MODEL)
+        self.search_thread = None
+        self.search_updates = queue.Queue()
+        self.search_cancelled = False
+        self.depth_reported = False
+        
         self.set_up_labels()
         self.set_up_inputs()
     
@@ -130,11 +120,20 @@ class GraphicBackshot: # ha ha ha ha ha
                                            )
         self.turn_button.grid(row = 14, column = 1)
         
-        tk.Button(self.window,
-                  text = "Search",
-                  font = font(20),
-                  command = lambda: self.search()
-                  ).grid(row = 15, column = 0, columnspan = 2)
+        self.search_button = tk.Button(self.window,
+                                       text = "Search",
+                                       font = font(20),
+                                       command = lambda: self.search()
+                                       )
+        self.search_button.grid(row = 15, column = 0)
+        
+        self.cancel_button = tk.Button(self.window,
+                                       text = "Cancel",
+                                       font = font(20),
+                                       state = "disabled",
+                                       command = lambda: self.cancel()
+                                       )
+        self.cancel_button.grid(row = 15, column = 1)
         
     
     def set_up_labels(self):
@@ -196,13 +195,11 @@ class GraphicBackshot: # ha ha ha ha ha
                                 )
         self.result_label.grid(row = 16, column = 0, columnspan = 2)
         
-    def search(self):
-        self.result_label["text"] = "Searching..."
-        
+    def get_position(self) -> BuckshotRouletteMove:
         is_players_turn = bool(self.is_players_turn.get())
         max_health = get_int_value(self.maximum_health)
-        dealer_health = max(max_health, get_int_value(self.dealer_health))
-        player_health = max(max_health, get_int_value(self.player_health))
+        dealer_health = min(max_health, get_int_value(self.dealer_health))
+        player_health = min(max_health, get_int_value(self.player_health))
         lives = get_int_value(self.live_shells)
         blanks = get_int_value(self.blank_shells)
         dealer_items = string_to_item(self.dealer_items.get())[:8]
@@ -222,7 +219,7 @@ class GraphicBackshot: # ha ha ha ha ha
             case "Blank":
                 current_shell = "blank"
         
-        position.current_shell = current_shell
+        position.loaded_shells.set_shell(0, current_shell)
         
         match self.handcuffed.get():
             case "Not handcuffed":
@@ -235,10 +232,106 @@ class GraphicBackshot: # ha ha ha ha ha
         position.handcuffed = handcuffed
         position.gun_is_sawed = bool(self.gun_is_sawed.get())
         
+        return position
+    
+    def search(self):
+        if self.search_thread != None: return
+        
         try:
-            self.result_label["text"] = BackshotRoulette().search(18, position).gui_string()
-        except UnboundLocalError:
+            position = self.get_position().to_packed()
+        except ValueError:
             self.result_label["text"] = "Error when trying to evaluate,\ncheck bullet counts or health."
+            return
+        
+        self.result_label["text"] = "Searching..."
+        self.search_button["state"] = "disabled"
+        self.cancel_button["state"] = "normal"
+        self.search_cancelled = False
+        self.depth_reported = False
+        
+        # Cleared here rather than by the search thread, so a Cancel pressed before the thread gets going isn't lost,
+        # while a late Cancel from the last search (after it finished) doesn't stop this one.
+        self.engine.stop_requested = False
+        
+        self.search_thread = threading.Thread(target = self.run_search, args = (position,), daemon = True)
+        self.search_thread.start()
+        self.window.after(POLL_MILLISECONDS, self.poll_search)
+    
+    def run_search(self, position: PackedPosition):
+        """
+        Runs on the search thread. Tk isn't thread safe, so results go through `search_updates` instead of the widgets.
+        """
+        last_depth = {"positions": self.engine.positions_searched, "time": time.perf_counter()}
+        
+        def report_depth(depth: int, result: Move):
+            positions = self.engine.positions_searched - last_depth["positions"]
+            seconds = max(time.perf_counter() - last_depth["time"], 1e-9)
+            self.search_updates.put(("depth", depth, result, positions / seconds))
+            
+            last_depth["positions"] = self.engine.positions_searched
+            last_depth["time"] = time.perf_counter()
+        
+        try:
+            self.search_updates.put(("done", self.engine.iterative_search(position, MAX_DEPTH, on_depth = report_depth)))
+        except Exception as error:
+            self.search_updates.put(("error", error))
+    
+    def poll_search(self):
+        while True:
+            try:
+                update = self.search_updates.get_nowait()
+            except queue.Empty:
+                break
+            
+            # An exception in an `after` callback would stop polling and leave the Search button disabled for good.
+            try:
+                finished = self.handle_update(update)
+            except Exception as error:
+                self.result_label["text"] = f"Error when trying to show the result:\n{error}"
+                
+                # The search may still be going if showing a depth failed. Stopping it is quick, and its last updates
+                # are thrown away so the next search doesn't pick them up.
+                self.engine.stop()
+                self.search_thread.join()
+                while not self.search_updates.empty(): self.search_updates.get_nowait()
+                finished = True
+            
+            if finished:
+                self.finish_search()
+                return
+        
+        self.window.after(POLL_MILLISECONDS, self.poll_search)
+    
+    def handle_update(self, update: tuple) -> bool:
+        """
+        Shows an update from `run_search`, returning True once the search is over.
+        """
+        match update:
+            case ("depth", depth, result, positions_per_second):
+                self.result_label["text"] = f"Depth {depth}\n{result.gui_string()}\n{positions_per_second:.0f} positions/s"
+                self.depth_reported = True
+            case ("done", result):
+                if not self.depth_reported:
+                    self.result_label["text"] = f"Cancelled before depth 1 finished\n{result.gui_string()}"
+                elif self.search_cancelled:
+                    self.result_label["text"] += "\n(Cancelled)"
+                return True
+            case ("error", error):
+                self.result_label["text"] = f"Error when trying to evaluate:\n{error}"
+                return True
+        
+        return False
+    
+    def finish_search(self):
+        self.search_thread = None
+        self.search_button["state"] = "normal"
+        self.cancel_button["state"] = "disabled"
+    
+    def cancel(self):
+        if self.search_thread == None: return
+        
+        self.search_cancelled = True
+        self.engine.stop()
     
     def start(self):
         self.window.mainloop()
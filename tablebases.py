@@ -0,0 +1,169 @@
+from roulette import *
+from itertools import combinations_with_replacement, product
+from transposition_tables import ALL_MOVES
+from operator import truediv
+import mmap
+import struct
+
+# File layout: a header, then a hash table of records indexed by Zobrist hash modulo the slot count.
+# Collisions move on to the next slot, and a best move of 0 marks an empty slot, which is why moves are stored as value + 1.
+TABLEBASE_MAGIC = b"BSTB"
+TABLEBASE_VERSION = 2
+TABLEBASE_HEADER = struct.Struct("<4sHHHQ") # magic, version, max shells, max items, slot count
+TABLEBASE_RECORD = struct.Struct("<QdB") # zobrist, evaluation, best move + 1
+
+# At most this fraction of slots are used, so probes stay short.
+TABLEBASE_LOAD_FACTOR = 0.75
+
+def enumerate_positions(max_shells: int, max_items: int, max_healths: list[int]):
+    """
+    Yields every position with between 1 and `max_shells` shells left (at least one live), and at most `max_items` items
+    in each hand. Positions come out in order of shells left then items held, and every move uses up a shell or an item,
+    so every position comes after all the positions it can lead to.
+    """
+    hands = [list(combinations_with_replacement(list(Items), size)) for size in range(max_items + 1)]
+    
+    for total_shells in range(1, max_shells + 1):
+        for item_total in range(2 * max_items + 1):
+            for live_shells in range(1, total_shells + 1):
+                blank_shells = total_shells - live_shells
+                
+                for shells in product([None, "live", "blank"], repeat = total_shells):
+                    unknown_live = live_shells - shells.count("live")
+                    unknown_blank = blank_shells - shells.count("blank")
+                    if unknown_live < 0 or unknown_blank < 0: continue
+                    
+                    # Once the unknown shells can only be one type they're all known (see _fill_implied_shells), so
+                    # leaving any of them unknown would only repeat a position.
+                    if (unknown_live == 0) != (unknown_blank == 0): continue
+                    
+                    for dealer_size in range(max(0, item_total - max_items), min(max_items, item_total) + 1):
+                        for dealer_items, player_items in product(hands[dealer_size], hands[item_total - dealer_size]):
+                            for max_health in max_healths:
+                                for dealer_health, player_health in product(range(1, max_health + 1), repeat = 2):
+                                    for is_players_turn, handcuffed, gun_is_sawed, on_adrenaline, inverter_on in product((False, True), range(3), (False, True), (False, True), (False, True)):
+                                        yield PackedPosition.from_fields(is_players_turn,
+                                                                         max_health, dealer_health, player_health,
+                                                                         live_shells, blank_shells,
+                                                                         dealer_items, player_items,
+                                                                         list(shells), handcuffed,
+                                                                         gun_is_sawed, on_adrenaline, inverter_on)
+
+class Tablebase:
+    """
+    Exact evaluations and best moves of every position with few enough shells and items, as made by `generate`.
+    
+    Once a search is at least as deep as the shells left it can't hit its depth limit, so these evaluations are what
+    `BackshotRoulette.search` would give at any such depth. Lookups are a hash probe into a memory mapped file.
+    """
+    def __init__(self, buffer, max_shells: int, max_items: int, slot_count: int, path: str | None = None):
+        self.buffer = buffer
+        self.max_shells = max_shells
+        self.max_items = max_items
+        self.slot_count = slot_count
+        self.path = path
+        self.file = None
+    
+    @classmethod
+    def open(cls, path: str) -> "Tablebase":
+        file = open(path, "rb")
+        buffer = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version, max_shells, max_items, slot_count = TABLEBASE_HEADER.unpack_from(buffer, 0)
+        
+        if magic != TABLEBASE_MAGIC or version != TABLEBASE_VERSION:
+            buffer.close()
+            file.close()
+            raise ValueError(f"{path} isn't a version {TABLEBASE_VERSION} tablebase.")
+        
+        tablebase = cls(buffer, max_shells, max_items, slot_count, path)
+        tablebase.file = file
+        return tablebase
+    
+    @classmethod
+    def generate(cls, engine, max_shells: int, max_items: int, max_healths: list[int] = [2, 3, 4], on_progress = None) -> "Tablebase":
+        """
+        Solves every position from `enumerate_positions` with `engine`'s move selection and leaf evaluation, working back
+        from the end of the round so every outcome is already in the table when it's needed.
+        
+        Args:
+            engine (BackshotRoulette): Supplies `get_search_moves` and `leaf_evaluation`. Should use float arithmetic.
+            max_shells (int): The most shells left in the gun.
+            max_items (int): The most items in each hand.
+            max_healths (list[int], optional): Maximum healths to cover. Defaults to [2, 3, 4].
+            on_progress (optional): Called with `(positions solved, total positions)` every 10000 positions.
+        
+        Returns:
+            Tablebase: The table, in memory. Use `save` to write it out.
+        """
+        position_count = sum(1 for _ in enumerate_positions(max_shells, max_items, max_healths))
+        slot_count = int(position_count / TABLEBASE_LOAD_FACTOR) + 1
+        buffer = bytearray(TABLEBASE_HEADER.size + slot_count * TABLEBASE_RECORD.size)
+        TABLEBASE_HEADER.pack_into(buffer, 0, TABLEBASE_MAGIC, TABLEBASE_VERSION, max_shells, max_items, slot_count)
+        
+        tablebase = cls(buffer, max_shells, max_items, slot_count)
+        
+        for solved, position in enumerate(enumerate_positions(max_shells, max_items, max_healths)):
+            evaluation, best_move = tablebase.solve(engine, position)
+            tablebase.add(position, evaluation, best_move)
+            
+            if on_progress != None and solved % 10000 == 0: on_progress(solved, position_count)
+        
+        return tablebase
+    
+    def solve(self, engine, position: PackedPosition) -> tuple[float, ValidMoves]:
+        """
+        Returns the evaluation and best move of `position`, from the evaluations of its outcomes already in the table.
+        """
+        best_move = None
+        best_eval = -INF if position.is_players_turn else INF
+        
+        for move in engine.get_search_moves(position):
+            expected_eval = 0
+            for chance, outcome in position.outcomes(move, truediv):
+                if 0 in [outcome.player_health, outcome.dealer_health, outcome.unknown_live_shells]:
+                    expected_eval += chance * engine.leaf_evaluation(outcome)
+                    continue
+                
+                entry = self.get(outcome)
+                if entry == None: raise ValueError(f"Outcome of {move} isn't in the tablebase yet\n---\n{outcome}\n---")
+                expected_eval += chance * entry[0]
+            
+            if position.is_players_turn and expected_eval > best_eval or not position.is_players_turn and expected_eval < best_eval:
+                best_eval = expected_eval
+                best_move = move
+        
+        return best_eval, best_move
+    
+    def _slot_offset(self, slot: int) -> int:
+        return TABLEBASE_HEADER.size + slot * TABLEBASE_RECORD.size
+    
+    def add(self, position: PackedPosition, evaluation: float, best_move: ValidMoves):
+        slot = position.zobrist % self.slot_count
+        
+        while TABLEBASE_RECORD.unpack_from(self.buffer, self._slot_offset(slot))[2] != 0:
+            slot = (slot + 1) % self.slot_count
+        
+        TABLEBASE_RECORD.pack_into(self.buffer, self._slot_offset(slot), position.zobrist, evaluation, best_move.value + 1)
+    
+    def get(self, position: PackedPosition) -> tuple[float, ValidMoves] | None:
+        """
+        Returns `(evaluation, best move)` for `position`, or None if it isn't covered.
+        """
+        slot = position.zobrist % self.slot_count
+        
+        while True:
+            zobrist, evaluation, best_move = TABLEBASE_RECORD.unpack_from(self.buffer, self._slot_offset(slot))
+            if best_move == 0: return None
+            if zobrist == position.zobrist: return evaluation, ALL_MOVES[best_move - 1]
+            slot = (slot + 1) % self.slot_count
+    
+    def save(self, path: str):
+        with open(path, "wb") as file:
+            file.write(self.buffer)
+        self.path = path
+    
+    def close(self):
+        if self.file != None:
+            self.buffer.close()
+            self.file.close()
+            self.file = None
\ No newline at end of file
@@ -0,0 +1,209 @@
+from backshot import *
+from benchmark import CORPUS
+from random import Random
+import analysis_cache
+import pytest
+
+CORPUS_BY_NAME = {name: (position, depth) for name, position, depth in CORPUS}
+
+# The cheaper half of benchmark.py's corpus, plus phone_and_adrenaline deeper, where float Star1 windows used to round
+# a cut off node's bound into an exact evaluation.
+ARITHMETIC_CASES = [(name, *CORPUS_BY_NAME[name]) for name in ["trivial", "known_live", "two_shells_medicine", "dealer_to_move", "handcuffed_sawed", "phone_and_adrenaline"]]
+ARITHMETIC_CASES += [("phone_and_adrenaline_deep", CORPUS_BY_NAME["phone_and_adrenaline"][0], 6)]
+
+# Random positions are kept small, since the reference search has no pruning at all.
+RANDOM_POSITIONS = 200
+RANDOM_SEED = 8
+
+def random_position(random: Random) -> PackedPosition:
+    max_health = random.choice([2, 3, 4])
+    shells = random.randint(1, 5)
+    live_shells = random.randint(1, shells)
+    dealer_items = [random.choice(list(Items)) for _ in range(random.randint(0, 3))]
+    player_items = [random.choice(list(Items)) for _ in range(random.randint(0, 3))]
+    current_shell = random.choice([None, None, "live" if live_shells else None, "blank" if shells > live_shells else None])
+    
+    return PackedPosition.from_fields(random.random() < 0.5, max_health, random.randint(1, max_health), random.randint(1, max_health),
+                                      live_shells, shells - live_shells, dealer_items, player_items, [current_shell],
+                                      random.choice([0, 0, 1, 2]), random.random() < 0.2)
+
+def random_cases(count: int = RANDOM_POSITIONS, seed: int = RANDOM_SEED) -> list[tuple[PackedPosition, int]]:
+    random = Random(seed)
+    return [(random_position(random), random.randint(1, 3)) for _ in range(count)]
+
+def expectimax(engine: BackshotRoulette, depth: int, state: PackedPosition):
+    """
+    Plain expectimax over the same moves `search` considers, without pruning, tables or move ordering.
+    """
+    if 0 in [depth, state.player_health, state.dealer_health, state.unknown_live_shells]:
+        return engine.leaf_evaluation(state)
+    
+    def move_evaluation(move: ValidMoves):
+        next_depth = depth - 1 if move in [ValidMoves.SHOOT_DEALER, ValidMoves.SHOOT_PLAYER] else depth
+        return sum(chance * expectimax(engine, next_depth, position) for chance, position in state.outcomes(move, engine.ratio))
+    
+    dealer_moves = None if state.is_players_turn else engine.dealer_model.move_weights(state, engine.ratio)
+    if dealer_moves != None:
+        return sum(weight * move_evaluation(move) for move, weight in dealer_moves)
+    
+    obvious_move = obvious_move_exists(state)
+    if obvious_move != None and state.is_legal(obvious_move):
+        moves = [obvious_move]
+    else:
+        moves = [move for move in state.get_all_moves() if not is_redundant_move(move, state)] or state.get_all_moves()
+    
+    evaluations = [move_evaluation(move) for move in moves]
+    return max(evaluations) if state.is_players_turn else min(evaluations)
+
+@pytest.mark.parametrize("name, position, depth", ARITHMETIC_CASES)
+def test_float_matches_fraction(name, position, depth):
+    assert compare_arithmetic(position, depth) <= FLOAT_TOLERANCE
+    
+    # compare_arithmetic searches iteratively, so also check one search without the tables earlier depths leave.
+    exact = BackshotRoulette("fraction").search(depth, position).evaluation
+    assert abs(BackshotRoulette().search(depth, position).evaluation - exact) <= FLOAT_TOLERANCE
+
+@pytest.mark.parametrize("dealer_model", list(DEALER_MODELS))
+def test_search_matches_expectimax(dealer_model):
+    # Engines are shared between positions (making one allocates its transposition table), which also checks that
+    # nothing left in the tables from one search spoils the next.
+    reference = BackshotRoulette("fraction", dealer_model = dealer_model)
+    exact = BackshotRoulette("fraction", dealer_model = dealer_model)
+    engines = [BackshotRoulette(dealer_model = dealer_model), BackshotRoulette(in_place = True, dealer_model = dealer_model)]
+    
+    for position, depth in random_cases():
+        expected = expectimax(reference, depth, position)
+        
+        # Fraction searches have no rounding, so they should be exactly right.
+        assert exact.search(depth, position).evaluation == expected
+        
+        for engine in engines:
+            assert abs(engine.search(depth, position).evaluation - expected) <= FLOAT_TOLERANCE
+            assert abs(engine.iterative_search(position, depth).evaluation - expected) <= FLOAT_TOLERANCE
+def test_analysis_cache_round_trip():
+    cache = AnalysisCache.open(":memory:")
+    position, _ = CORPUS_BY_NAME["mid_round"]
+    path = [ValidMoves.USE_MAGNIFYING_GLASS, ValidMoves.SHOOT_DEALER]
+    
+    cache.add(position, 2, 0.25, path)
+    assert cache.get(position, 2) == (0.25, path)
+    
+    # Only the same depth counts, so a warm cache can't change what a search returns...
+    assert cache.get(position, 1) == None
+    assert cache.get(position, 3) == None
+    
+    # ...except past the shells left, where every depth searches the same tree.
+    shells = position.unknown_live_shells + position.unknown_blank_shells
+    cache.add(position, shells + 5, 0.5, path)
+    assert cache.get(position, shells) == (0.5, path)
+    assert cache.get(position, 100) == (0.5, path)
+
+def test_analysis_cache_matches_search():
+    position, depth = CORPUS_BY_NAME["mid_round"]
+    cache = AnalysisCache.open(":memory:", min_depth = 1)
+    BackshotRoulette(analysis_cache = cache).iterative_search(position, depth)
+    
+    cold, warm = [], []
+    BackshotRoulette().iterative_search(position, depth, on_depth = lambda depth, result: cold.append(result.evaluation))
+    BackshotRoulette(analysis_cache = cache).iterative_search(position, depth, on_depth = lambda depth, result: warm.append(result.evaluation))
+    assert warm == pytest.approx(cold, abs = FLOAT_TOLERANCE)
+
+def test_analysis_cache_evicts_least_recently_used():
+    cache = AnalysisCache.open(":memory:", max_entries = 10)
+    positions = [position for position, _ in random_cases(11)]
+    
+    for position in positions[:10]: cache.add(position, 1, 0.5, [])
+    cache.get(positions[0], 1)
+    cache.add(positions[10], 1, 0.5, [])
+    
+    # Another tenth of max_entries goes too, so it doesn't evict on every store.
+    assert cache.entries == 9
+    kept = [position for position in positions if cache.get(position, 1) != None]
+    assert kept == [positions[0]] + positions[3:]
+
+def test_analysis_cache_resets_on_version_change(tmp_path, monkeypatch):
+    path = str(tmp_path / "analysis_cache.sqlite3")
+    position, _ = CORPUS_BY_NAME["trivial"]
+    
+    cache = AnalysisCache.open(path)
+    cache.add(position, 1, 0.5, [])
+    cache.close()
+    
+    cache = AnalysisCache.open(path)
+    assert cache.get(position, 1) == (0.5, [])
+    cache.close()
+    
+    monkeypatch.setattr(analysis_cache, "ANALYSIS_CACHE_VERSION", ANALYSIS_CACHE_VERSION + 1)
+    cache = AnalysisCache.open(path)
+    assert cache.entries == 0 and cache.get(position, 1) == None
+    cache.close()
+def test_frontier_matches_search():
+    pytest.importorskip("numpy")
+    from frontier import FrontierSearch
+    
+    engine = BackshotRoulette()
+    
+    for position, depth in random_cases(100):
+        # Both the random depth, and deep enough to solve the round like the frontier search is meant for.
+        for move_depth in [depth, position.unknown_live_shells + position.unknown_blank_shells]:
+            expected = engine.search(move_depth, position).evaluation
+            assert abs(FrontierSearch(engine).search(move_depth, position).evaluation - expected) <= FLOAT_TOLERANCE
+def test_tablebase_matches_search(tmp_path):
+    # Small enough to solve in about a second, and saved and opened again like generate_tablebase.py's files are.
+    path = str(tmp_path / "tablebase.bin")
+    Tablebase.generate(BackshotRoulette(), 3, 0, [2, 3]).save(path)
+    tablebase = Tablebase.open(path)
+    engine = BackshotRoulette()
+    
+    try:
+        for position in enumerate_positions(3, 0, [2, 3]):
+            shells = position.unknown_live_shells + position.unknown_blank_shells
+            assert abs(tablebase.get(position)[0] - engine.search(shells, position).evaluation) <= FLOAT_TOLERANCE
+        
+        # Searches of positions the tablebase doesn't cover, which probe it once they get down to 3 shells.
+        probing = BackshotRoulette(tablebase = tablebase)
+        for live_shells, blank_shells, is_players_turn in [(2, 2, True), (3, 1, False), (2, 3, True)]:
+            position = PackedPosition.from_fields(is_players_turn, 3, 2, 3, live_shells, blank_shells, [], [])
+            shells = live_shells + blank_shells
+            assert abs(probing.search(shells, position).evaluation - engine.search(shells, position).evaluation) <= FLOAT_TOLERANCE
+        
+        assert probing.statistics.tablebase_hits > 0
+    finally:
+        tablebase.close()
+def test_parallel_search_matches_search():
+    # One parallel engine for every position, so its workers' tables carry over between searches like they do in use.
+    parallel = BackshotRoulette()
+    
+    try:
+        for position, depth in random_cases(30, seed = RANDOM_SEED + 1) + [CORPUS_BY_NAME["handcuffed_sawed"]]:
+            expected = BackshotRoulette().iterative_search(position, depth)
+            result = parallel.iterative_search(position, depth, workers = 2)
+            
+            assert result.move_type == expected.move_type
+            assert abs(result.evaluation - expected.evaluation) <= FLOAT_TOLERANCE
+    finally:
+        parallel.close()
+@pytest.mark.parametrize("name, position, depth", CORPUS)
+def test_monte_carlo_search_runs(name, position, depth):
+    from mcts import MonteCarloSearch
+    
+    result = MonteCarloSearch(seed = RANDOM_SEED).search(position, iterations = 500)
+    assert position.is_legal(result.move_type)
+    assert MIN_EVALUATION <= result.evaluation <= MAX_EVALUATION
+    
+    # Seeded searches are reproducible.
+    again = MonteCarloSearch(seed = RANDOM_SEED).search(position, iterations = 500)
+    assert (again.move_type, again.evaluation) == (result.move_type, result.evaluation)
+    
+    # With an obvious move there's only one move to try, so it has to agree with minimax.
+    if obvious_move_exists(position) != None:
+        assert result.move_type == BackshotRoulette().search(depth, position).move_type
+
+def test_choose_engine():
+    from mcts import choose_engine
+    
+    for name in ["trivial", "known_live", "two_shells_medicine", "dealer_to_move", "handcuffed_sawed"]:
+        assert choose_engine(*CORPUS_BY_NAME[name]) == "minimax"
+    
+    # Full hands and 8 shells to the end of the round is far past the budget, which the capped probe has to notice.
+    assert choose_engine(CORPUS_BY_NAME["full_hands_8_shells"][0], 18) == "mcts"
\ No newline at end of file
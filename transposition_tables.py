@@ -1,37 +1,144 @@
-import sys
+from array import array
+from roulette import ValidMoves, INF
 
-class Transposition:
-    def __init__(self, evaluation, depth: int):
-        self.evaluation = evaluation
-        self.depth = depth
+# Transposition flags, what the stored evaluation means relative to the real evaluation.
+EXACT = 0
+LOWER_BOUND = 1 # Search failed high, the real evaluation is at least this.
+UPPER_BOUND = 2 # Search failed low, the real evaluation is at most this.
 
-class TranspositionTable:
-    def __init__(self, max_mibibytes: int | float):
-        self.transposition_dict = {}
-        self.max_size = max_mibibytes * 2 ** 20
-    
-    def add(self, state, move, transposition: Transposition):
-        self.transposition_dict[state, move] = transposition
-        if sys.getsizeof(self.transposition_dict) >= self.max_size:
-            print("culling")
-            self.cull()
+NO_MOVE = -1
+EMPTY_SLOT = -1 # Stored as the depth of slots that have never been written to.
 
-    def cull(self):
-        while sys.getsizeof(self.transposition_dict) >= self.max_size:
-            first_key = list(self.transposition_dict.keys())[0]
-            self.transposition_dict.pop(first_key)
+# Depths are stored as signed chars, so deeper searches are stored as this. Every shot uses up a shell, and a round
+# never has this many, so searching any deeper can't change an evaluation. Entries this deep are returned with a depth of INF.
+MAX_STORED_DEPTH = 127
 
-    def get(self, state, move) -> Transposition:
-        if (state, move) not in self.transposition_dict: return None
-        return self.transposition_dict[state, move]
+ALL_MOVES = list(ValidMoves)
 
-    def __contains__(self, key_tuple):
-        return key_tuple in self.transposition_dict
+class Transposition:
+    __slots__ = ("zobrist", "evaluation", "depth", "flag", "best_move")
+    
+    def __init__(self, zobrist: int, evaluation, depth: int, flag: int = EXACT, best_move: ValidMoves | None = None):
+        self.zobrist = zobrist
+        self.evaluation = evaluation
+        self.depth = depth
+        self.flag = flag
+        self.best_move = best_move
 
-    def __getitem__(self, key_tuple) -> Transposition:
-        if len(key_tuple) != 2: raise KeyError("Transpositions take only 2 arguments: state and move")
-        return self.get(*key_tuple)
+class TranspositionTable:
+    """
+    A fixed number of buckets indexed by Zobrist hash, each with two slots.
+    
+    The first slot keeps whichever transposition was searched deepest, the second always takes the newest one.
+    Deep results survive for a long time, while shallow, recent results still get stored somewhere.
+    
+    Every field lives in its own preallocated `array`, sized once from `max_mibibytes`, so the table never grows.
+    Evaluations are stored as doubles, unless `exact` is set, in which case they're kept as they are in a list
+    (for fraction searches, which would otherwise get rounded). The objects in that list aren't counted towards the size.
+    """
+    # zobrist (Q) + evaluation (d) + depth (b) + flag (B) + best move (b)
+    SLOT_SIZE = 8 + 8 + 1 + 1 + 1
+    
+    def __init__(self, max_mibibytes: int | float, exact: bool = False):
+        self.exact = exact
+        self.bucket_count = max(1, int(max_mibibytes * 2 ** 20) // (2 * self.SLOT_SIZE))
+        slot_count = 2 * self.bucket_count
+        
+        self.zobrists = array("Q", [0]) * slot_count
+        self.evaluations = [0] * slot_count if exact else array("d", [0.0]) * slot_count
+        self.depths = array("b", [EMPTY_SLOT]) * slot_count
+        self.flags = array("B", [EXACT]) * slot_count
+        self.best_moves = array("b", [NO_MOVE]) * slot_count
+        
+        self.reset_counters()
+        self.occupied = 0
+    
+    def reset_counters(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0 # Stores that overwrote a different position.
+    
+    @property
+    def size_in_bytes(self) -> int:
+        columns = (self.zobrists, self.evaluations, self.depths, self.flags, self.best_moves)
+        return sum(len(column) * (column.itemsize if isinstance(column, array) else 8) for column in columns)
+    
+    @property
+    def occupancy(self) -> float:
+        """
+        Returns the fraction of slots in use, between 0 and 1.
+        """
+        return self.occupied / len(self.depths)
+    
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+    
+    def _write(self, slot: int, zobrist: int, evaluation: float, depth: int, flag: int, best_move: int):
+        if self.depths[slot] == EMPTY_SLOT:
+            self.occupied += 1
+        elif self.zobrists[slot] != zobrist:
+            self.collisions += 1
+        
+        self.zobrists[slot] = zobrist
+        self.evaluations[slot] = evaluation
+        self.depths[slot] = depth
+        self.flags[slot] = flag
+        self.best_moves[slot] = best_move
+    
+    def add(self, transposition: Transposition):
+        self.stores += 1
+        
+        zobrist = transposition.zobrist
+        evaluation = transposition.evaluation if self.exact else float(transposition.evaluation)
+        best_move = NO_MOVE if transposition.best_move == None else transposition.best_move.value
+        depth = min(transposition.depth, MAX_STORED_DEPTH)
+        
+        deep_slot = 2 * (zobrist % self.bucket_count)
+        new_slot = deep_slot + 1
+        deepest_depth = self.depths[deep_slot]
+        same_position = self.zobrists[deep_slot] == zobrist
+        
+        if deepest_depth == EMPTY_SLOT or same_position or depth >= deepest_depth:
+            # Demote the old deepest entry rather than throwing it away.
+            if deepest_depth != EMPTY_SLOT and not same_position:
+                self._write(new_slot, self.zobrists[deep_slot], self.evaluations[deep_slot], deepest_depth, self.flags[deep_slot], self.best_moves[deep_slot])
+            self._write(deep_slot, zobrist, evaluation, depth, transposition.flag, best_move)
+        else:
+            self._write(new_slot, zobrist, evaluation, depth, transposition.flag, best_move)
+    
+    def clear(self):
+        slot_count = len(self.depths)
+        self.depths = array("b", [EMPTY_SLOT]) * slot_count
+        self.occupied = 0
+    
+    def get(self, zobrist: int) -> Transposition:
+        self.probes += 1
+        deep_slot = 2 * (zobrist % self.bucket_count)
+        
+        for slot in (deep_slot, deep_slot + 1):
+            if self.zobrists[slot] == zobrist and self.depths[slot] != EMPTY_SLOT:
+                self.hits += 1
+                best_move = self.best_moves[slot]
+                depth = self.depths[slot]
+                return Transposition(zobrist,
+                                     self.evaluations[slot],
+                                     INF if depth == MAX_STORED_DEPTH else depth,
+                                     self.flags[slot],
+                                     None if best_move == NO_MOVE else ALL_MOVES[best_move])
+        
+        return None
+    
+    def __len__(self):
+        return self.occupied
+    
+    def __contains__(self, zobrist: int):
+        return self.get(zobrist) != None
+    
+    def __getitem__(self, zobrist: int) -> Transposition:
+        return self.get(zobrist)
     
-    def __setitem__(self, key_tuple, transposition: Transposition):
-        if len(key_tuple) != 2: raise KeyError("Transpositions take only 2 arguments: state and move")
-        self.add(*key_tuple, transposition)
\ No newline at end of file
+    def __setitem__(self, zobrist: int, transposition: Transposition):
+        if zobrist != transposition.zobrist: raise KeyError("Transpositions must be stored under their own Zobrist hash.")
+        self.add(transposition)
\ No newline at end of file